@@ -11,7 +11,7 @@ if ROOT not in sys.path:
 
 # === 2. 尝试导入引擎（捕获所有异常）===
 try:
-    from src.rag_engine import ComplianceRAGEngine
+    from src.engine_registry import session_for
     ENGINE_LOADED = True
 except Exception as e:
     ENGINE_LOADED = False
@@ -27,9 +27,9 @@ if not ENGINE_LOADED:
     st.code(ENGINE_ERROR)
     st.stop()
 
-# === 5. 初始化引擎（不缓存！每次刷新都重建）===
+# === 5. 取得引擎（进程内所有会话共用一个引擎，首次构建后不再重建，见 src/engine_registry.py）===
 try:
-    engine = ComplianceRAGEngine()
+    engine = session_for(st.session_state)
     rule_count = len(getattr(engine, 'rules', []))
     st.success(f"✅ 引擎初始化成功！加载 {rule_count} 条规则。")
 except Exception as e:
@@ -1,9 +1,6 @@
 # demo.py
-import os
 from src.rag_engine import ComplianceRAGEngine
 
-os.environ["DASHSCOPE_API_KEY"] = "sk-2061ea9f55e446ffa570d8ac2510d401"
-
 if __name__ == "__main__":
     engine = ComplianceRAGEngine()
 
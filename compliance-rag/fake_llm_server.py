@@ -0,0 +1,88 @@
+# fake_llm_server.py —— 本地 OpenAI 兼容假接口，用于压测并发控制器
+# 用法：
+#   python fake_llm_server.py --port 8808 --capacity 6 --throttle-rate 0.05
+#   DASHSCOPE_API_BASE=http://127.0.0.1:8808/v1 python demo.py
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_ANSWER = "是否违规：否\n触发事件：无\n理由：本地假接口固定返回"
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    # 由 main() 注入
+    config = None
+    inflight = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        cfg = self.config
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        cls = type(self)
+        with cls.lock:
+            cls.inflight += 1
+            current = cls.inflight
+        try:
+            # 超过容量或随机命中时注入限流
+            if current > cfg.capacity or random.random() < cfg.throttle_rate:
+                self._send(429, {"error": {"message": "rate limited"}},
+                           {"Retry-After": str(cfg.retry_after)})
+                return
+            if random.random() < cfg.error_rate:
+                self._send(503, {"error": {"message": "unavailable"}})
+                return
+            # 并发越高延迟越大，模拟排队
+            time.sleep(cfg.latency * (1 + current / max(cfg.capacity, 1)))
+            self._send(200, {
+                "id": "fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "fake",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": FAKE_ANSWER},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+        finally:
+            with cls.lock:
+                cls.inflight -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假 LLM 接口（注入 429/503）")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--capacity", type=int, default=6, help="超过该并发即返回 429")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="随机 429 比例")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机 503 比例")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.3, help="基础延迟（秒）")
+    args = parser.parse_args()
+
+    FakeLLMHandler.config = args
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FakeLLMHandler)
+    print(f"假接口已启动: http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 # web_app.pyhttps://github.com/pozansky/compliance-checker/tree/main/compliance-rag
 import streamlit as st
 import pandas as pd
-from src.rag_engine import ComplianceRAGEngine
+from src.engine_registry import get_registry, session_for
+from src.result_store import ResultStore, make_record
+from src.compact_results import CompactResults
 import tempfile
 import os
 import sys
@@ -17,16 +19,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 初始化 RAG 引擎
-@st.cache_resource
+# 初始化 RAG 引擎：进程内所有会话共用注册表中的同一个引擎（见 src/engine_registry.py）
 def load_engine():
     try:
-        # 设置 DashScope API Key
-        # os.environ["DASHSCOPE_API_KEY"] = "sk-2061ea9f55e446ffa570d8ac2510d401"
-        os.environ["DASHSCOPE_API_KEY"] = "sk-a677631fd47a4e2184b6836f6097f0b5"
-
-        engine = ComplianceRAGEngine()
-        return engine
+        get_registry().get()
+        # 本会话的句柄：检测请求计入全局在途上限与会话统计
+        return session_for(st.session_state)
     except Exception as e:
         st.error(f"引擎初始化失败: {str(e)}")
         return None
@@ -115,32 +113,39 @@ def batch_file_analysis(engine):
         st.success(f"成功读取文件，共 {len(lines)} 条内容")
         
         if st.button("开始批量分析", type="primary"):
-            results = []
+            # 列式紧凑结果，DataFrame 只在展示时生成
+            results = CompactResults()
             progress_bar = st.progress(0)
             status_text = st.empty()
             
+            store = ResultStore()
+            records = []
             for i, line in enumerate(lines):
                 status_text.text(f"正在分析第 {i+1}/{len(lines)} 条: {line[:50]}...")
                 result = engine.predict(line)
-                results.append({
-                    '内容': line,
-                    '合规状态': '违规' if result['violation'] else '合规',
-                    '触发事件': result['triggered_event'],
-                    '理由': result['reason']
-                })
+                results.append(line, result)
+                records.append(make_record(line, result, conversation_id=uploaded_file.name))
+                if len(records) >= 10000:
+                    store.append(records)
+                    records = []
                 progress_bar.progress((i + 1) / len(lines))
             
-            status_text.text("分析完成！")
+            if records:
+                store.append(records)
+            status_text.text("分析完成！结果已写入结果库")
             
             # 显示结果表格
-            df = pd.DataFrame(results)
+            df = results.to_frame({'text': '内容', 'violation': '合规状态', 'triggered_event': '触发事件', 'reason': '理由'})
+            df = df[['内容', '合规状态', '触发事件', '理由']]
+            df['合规状态'] = df['合规状态'].map({True: '违规', False: '合规'})
+            results.close()
             st.markdown("### 📋 分析结果汇总")
             st.dataframe(df, use_container_width=True)
             
             # 统计信息
             col1, col2, col3, col4 = st.columns(4)
-            total_count = len(results)
-            violation_count = sum(1 for r in results if r['合规状态'] == '违规')
+            total_count = len(df)
+            violation_count = int((df['合规状态'] == '违规').sum())
             compliant_count = total_count - violation_count
             
             col1.metric("总条目", total_count)
@@ -0,0 +1,366 @@
+# src/batch_jobs.py
+"""
+批量分析后台任务。
+
+Streamlit 脚本线程里跑批量分析，任何控件交互或关闭页面都会中断，结果也要等全部跑完才显示。
+这里把批量任务交给后台线程：
+- 每个任务一个 job_id，任务与逐条结果持久化在 SQLite（JOBS_DIR/jobs.sqlite），逐条写入
+- 每个任务一个调度线程 + 共享的工作线程池，随时可以取消
+- 页面刷新后凭 job_id 重新挂载；运行中的任务记录所属进程（主机 + pid）并定期刷新心跳，
+  所属进程已退出（同一主机上 pid 不存在）或心跳超过 stale_after 秒未刷新的任务标记为 interrupted，
+  可以 resume 续跑；多个进程共用同一个任务库时不会互相打断
+- 任务完成时整批写入结果库（ResultStore）
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from .compact_results import CompactResults
+from .result_store import ResultStore, make_record
+
+PAGE_SIZE = 10_000
+HEARTBEAT_INTERVAL = 10.0
+STALE_AFTER = 60.0
+_INSERT_ITEM = "INSERT INTO job_items (job_id, idx, text, meta, status) VALUES (?, ?, ?, ?, ?)"
+
+PENDING, RUNNING, DONE, CANCELLED, FAILED, INTERRUPTED = (
+    "pending", "running", "done", "cancelled", "failed", "interrupted")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    error TEXT,
+    owner TEXT,
+    heartbeat REAL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class BatchJobManager:
+    """见模块说明；predict 一般为 engine.predict"""
+
+    def __init__(self, predict: Callable[[str], Dict[str, Any]], root: Optional[str] = None,
+                 max_workers: int = 8, store: Optional[ResultStore] = None,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL, stale_after: float = STALE_AFTER):
+        self.predict = predict
+        self.root = Path(root or os.getenv("JOBS_DIR", "jobs"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / "jobs.sqlite"
+        self.max_workers = max_workers
+        self.store = store
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        # 所属进程：主机名:pid:随机串（同一进程内多个 manager 也能区分）
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-job")
+        self._threads: Dict[str, threading.Thread] = {}
+        self._cancel: set = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            # 旧版本建的任务库没有所属进程和心跳列
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self.recover_stale()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._heartbeat, name="batch-job-heartbeat", daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _owner_alive(owner: Optional[str]) -> Optional[bool]:
+        """同一主机上的所属进程是否存在；其他主机或无法判断时返回 None（只看心跳）"""
+        host, _, rest = (owner or "").partition(":")
+        pid = rest.split(":")[0]
+        if host != socket.gethostname() or not pid.isdigit():
+            return None
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            # 进程存在但无权发信号等
+            return True
+        return True
+
+    def recover_stale(self) -> int:
+        """所属进程已退出或心跳超时的运行中任务标记为 interrupted，返回标记的任务数"""
+        now = time.time()
+        conn = self._connect()
+        rows = conn.execute("SELECT id, owner, COALESCE(heartbeat, updated) AS beat FROM jobs "
+                            "WHERE status IN (?, ?) AND (owner IS NULL OR owner != ?)",
+                            (RUNNING, PENDING, self.owner)).fetchall()
+        stale = [(row["id"], row["owner"]) for row in rows
+                 if self._owner_alive(row["owner"]) is False or row["beat"] < now - self.stale_after]
+        if not stale:
+            return 0
+        with conn:
+            # 所属进程没变才标记，避免覆盖刚被其他进程续跑的任务
+            marked = sum(conn.execute("UPDATE jobs SET status = ?, updated = ? "
+                                      "WHERE id = ? AND owner IS ? AND status IN (?, ?)",
+                                      (INTERRUPTED, now, job_id, owner, RUNNING, PENDING)).rowcount
+                         for job_id, owner in stale)
+        if marked:
+            print(f"{marked} 个任务的所属进程已退出或心跳超时，标记为 interrupted")
+        return marked
+
+    def _heartbeat(self) -> None:
+        """刷新本进程运行中任务的心跳，顺带回收其他进程遗留的任务"""
+        while not self._stopped.wait(self.heartbeat_interval):
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status IN (?, ?)",
+                                 (time.time(), self.owner, RUNNING, PENDING))
+                self.recover_stale()
+            except sqlite3.Error as e:
+                print(f"任务心跳写入失败: {e}")
+
+    def close(self) -> None:
+        """停止心跳线程（进程内重建 manager 时调用；运行中的任务会在 stale_after 秒后被视为中断）"""
+        self._stopped.set()
+
+    def submit(self, items: Iterable[Dict[str, Any]], name: str = "") -> str:
+        """
+        提交任务。items 为 {"text": ..., "agent": ..., "conversation_id": ..., "ts": ...}
+        （result_store.parse_input_line 的输出）的序列，可以是生成器，按 PAGE_SIZE 分页写入；返回 job_id
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT INTO jobs (id, name, status, total, created, updated, owner, heartbeat) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (job_id, name, PENDING, 0, now, now, self.owner, now))
+        total = 0
+        try:
+            page = []
+            for item in items:
+                page.append((job_id, total, item["text"],
+                             json.dumps({k: v for k, v in item.items() if k != "text"}, ensure_ascii=False),
+                             PENDING))
+                total += 1
+                if len(page) >= PAGE_SIZE:
+                    with conn:
+                        conn.executemany(_INSERT_ITEM, page)
+                    page = []
+            with conn:
+                if page:
+                    conn.executemany(_INSERT_ITEM, page)
+                conn.execute("UPDATE jobs SET total = ?, updated = ? WHERE id = ?", (total, time.time(), job_id))
+        except BaseException:
+            # 读取输入中途出错：删除写了一半的任务
+            with conn:
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            raise
+        self._start(job_id)
+        return job_id
+
+    def resume(self, job_id: str) -> None:
+        """续跑中断或取消的任务（只跑尚未完成的条目）"""
+        job = self.get(job_id)
+        if job is None or job["status"] in (RUNNING, DONE):
+            return
+        self._start(job_id)
+
+    def cancel(self, job_id: str) -> None:
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                self._cancel.add(job_id)
+                return
+        job = self.get(job_id)
+        if job is not None and job["status"] in (PENDING, INTERRUPTED):
+            self._set_status(job_id, CANCELLED)
+
+    def _start(self, job_id: str) -> None:
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return
+            self._cancel.discard(job_id)
+            now = time.time()
+            conn = self._connect()
+            with conn:
+                conn.execute("UPDATE jobs SET status = ?, error = NULL, updated = ?, owner = ?, heartbeat = ? "
+                             "WHERE id = ?", (RUNNING, now, self.owner, now, job_id))
+            thread = threading.Thread(target=self._run, args=(job_id,), name=f"job-{job_id}", daemon=True)
+            self._threads[job_id] = thread
+            thread.start()
+
+    def _set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                         (status, error, time.time(), job_id))
+
+    def _predict_item(self, text: str) -> Dict[str, Any]:
+        result = self.predict(text)
+        return {k: v for k, v in result.items() if k in (
+            "violation", "triggered_event", "reason", "degraded", "source", "rule_version")}
+
+    def _run(self, job_id: str) -> None:
+        conn = self._connect()
+        try:
+            queue = self._pending(job_id)
+            inflight = {}
+            exhausted = False
+            while True:
+                cancelled = job_id in self._cancel
+                # 在途数量有上限，取消后不再提交新条目，等在途条目完成
+                while not cancelled and not exhausted and len(inflight) < self.max_workers * 2:
+                    row = next(queue, None)
+                    if row is None:
+                        exhausted = True
+                        break
+                    inflight[self._pool.submit(self._predict_item, row["text"])] = row["idx"]
+                if not inflight:
+                    break
+                finished, _ = wait(list(inflight), timeout=1.0, return_when=FIRST_COMPLETED)
+                with conn:
+                    for future in finished:
+                        idx = inflight.pop(future)
+                        error = future.exception()
+                        if error is None:
+                            status, payload = DONE, future.result()
+                        else:
+                            status, payload = FAILED, {"error": f"{type(error).__name__}: {error}"}
+                        conn.execute("UPDATE job_items SET status = ?, result = ? WHERE job_id = ? AND idx = ?",
+                                     (status, json.dumps(payload, ensure_ascii=False), job_id, idx))
+                        column = "done" if status == DONE else "failed"
+                        conn.execute(f"UPDATE jobs SET {column} = {column} + 1, updated = ? WHERE id = ?",
+                                     (time.time(), job_id))
+            if job_id in self._cancel:
+                self._set_status(job_id, CANCELLED)
+                return
+            self._persist(job_id)
+            self._set_status(job_id, DONE)
+        except Exception as e:
+            self._set_status(job_id, FAILED, f"{type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._cancel.discard(job_id)
+
+    def _pending(self, job_id: str, page_size: int = PAGE_SIZE):
+        """分页读取未完成条目，百万行任务也不会一次性载入内存"""
+        last = -1
+        while True:
+            rows = self._connect().execute(
+                "SELECT idx, text FROM job_items WHERE job_id = ? AND status = ? AND idx > ? ORDER BY idx LIMIT ?",
+                (job_id, PENDING, last, page_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1]["idx"]
+
+    def _persist(self, job_id: str) -> None:
+        """任务完成后分页写入结果库"""
+        if self.store is None:
+            return
+        job = self.get(job_id)
+        records = []
+        for item in self.iter_results(job_id):
+            if item["status"] != DONE:
+                continue
+            meta = item["meta"]
+            try:
+                records.append(make_record(item["text"], item["result"],
+                                           meta.get("conversation_id") or job["name"],
+                                           meta.get("agent", ""), meta.get("ts")))
+            except ValueError as e:
+                print(f"任务 {job_id} 第 {item['idx']} 条未写入结果库: {e}")
+                continue
+            if len(records) >= PAGE_SIZE:
+                self.store.append(records)
+                records = []
+        if records:
+            self.store.append(records)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        rows = self._connect().execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def results(self, job_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """已完成（或失败）的条目，按输入顺序"""
+        sql = "SELECT idx, text, meta, status, result FROM job_items WHERE job_id = ? AND status != ? ORDER BY idx"
+        params: List[Any] = [job_id, PENDING]
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit if limit is not None else -1, offset]
+        items = []
+        for row in self._connect().execute(sql, params).fetchall():
+            items.append({
+                "idx": row["idx"],
+                "text": row["text"],
+                "meta": json.loads(row["meta"]),
+                "status": row["status"],
+                "result": json.loads(row["result"]) if row["result"] else {},
+            })
+        return items
+
+    def iter_results(self, job_id: str, page_size: int = PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        offset = 0
+        while True:
+            page = self.results(job_id, offset, page_size)
+            if not page:
+                return
+            yield from page
+            offset += len(page)
+
+    def counts(self, job_id: str) -> Dict[str, int]:
+        """已完成条目中的违规 / 合规 / 失败数，直接在 SQLite 上统计"""
+        row = self._connect().execute(
+            "SELECT SUM(status = ? AND json_extract(result, '$.violation') = 1) AS violation, "
+            "SUM(status = ? AND json_extract(result, '$.violation') = 0) AS compliant, "
+            "SUM(status = ?) AS failed FROM job_items WHERE job_id = ?",
+            (DONE, DONE, FAILED, job_id)).fetchone()
+        return {k: int(row[k] or 0) for k in ("violation", "compliant", "failed")}
+
+    def export(self, job_id: str, **compact_kwargs) -> CompactResults:
+        """把任务结果转成列式 CompactResults（失败条目记为 source=failed），用于导出"""
+        results = CompactResults(**compact_kwargs)
+        for item in self.iter_results(job_id):
+            if item["status"] == DONE:
+                results.append(item["text"], item["result"])
+            else:
+                results.append(item["text"], {"violation": False, "triggered_event": "无",
+                                              "reason": item["result"].get("error", ""), "source": "failed"})
+        return results
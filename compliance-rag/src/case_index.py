@@ -0,0 +1,403 @@
+# src/case_index.py
+"""
+历史判定案例的近似最近邻索引。
+
+审核人员需要看到与新告警相似的历史判定，LLM 判定时也可以把相似案例作为参考证据。
+项目里原来唯一的向量检索是 14 条规则文档上的 FAISS.from_documents，这里单独为全部
+历史判定文本建索引：
+
+    <root>/index.faiss    FAISS 索引（向量 id = 案例 id，从 0 连续编号）
+    <root>/events.u64     每个案例的触发事件位掩码（uint64，按 id 顺序）
+    <root>/cases.sqlite   案例元数据（原文、结论、事件、理由、规则版本、时间）
+
+- 索引结构由 FAISS factory 字符串决定：默认 "HNSW32"（无需训练，适合百万级）；
+  千万级建议 "IVF16384,PQ48" 之类的 IVF-PQ（内存约 48 字节/条），攒够 train_size 条后自动训练，
+  训练前的向量暂存在 pending 中按暴力检索
+- 增量写入：add / add_many，同一文本只收录一次（按文本哈希去重）；每 save_every 条自动落盘
+- mmap=True 以只读方式内存映射加载索引（服务多个只读副本，写入仍由单个进程负责）
+- 按规则事件过滤：事件掩码生成 IDSelectorBitmap，在 FAISS 检索内部过滤，不做检索后截断；
+  掩码最多容纳 64 种事件，之后出现的新事件照常收录（元数据里保留），只是不能按它过滤
+- 向量已归一化，使用内积，分数即余弦相似度
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set
+
+import numpy as np
+
+from .local_screen import join_events, split_events
+
+MAX_EVENTS = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY,
+    text_hash TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    violation INTEGER NOT NULL,
+    events TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    source TEXT NOT NULL,
+    rule_version TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS event_bits (
+    name TEXT PRIMARY KEY,
+    bit INTEGER NOT NULL UNIQUE
+);
+"""
+
+
+class SimilarCase(NamedTuple):
+    id: int
+    score: float
+    text: str
+    violation: bool
+    triggered_event: str
+    reason: str
+    rule_version: str
+    ts: float
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class CaseIndex:
+    """见模块说明；embeddings 为空时首次使用才加载（可传入多租户共享的 SharedEmbeddings）"""
+
+    def __init__(self, root: Optional[str] = None, embeddings: Any = None,
+                 factory: str = "HNSW32", train_size: Optional[int] = None,
+                 ef_search: int = 64, nprobe: int = 32, mmap: bool = False,
+                 save_every: int = 10_000):
+        self.root = Path(root or os.getenv("CASE_INDEX_DIR", "case_index"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.faiss"
+        self.events_path = self.root / "events.u64"
+        self.db_path = self.root / "cases.sqlite"
+        self.factory = factory
+        self.train_size = train_size
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.read_only = mmap
+        self.save_every = save_every
+        self._embeddings = embeddings
+        self._index = None
+        self._pending: List[np.ndarray] = []
+        self._masks = np.zeros(0, dtype=np.uint64)
+        self._bitmaps: Dict[int, np.ndarray] = {}
+        self._unmasked: Set[str] = set()
+        self._unsaved = 0
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        self._bits = {row[0]: row[1] for row in conn.execute("SELECT name, bit FROM event_bits")}
+        self._load()
+
+    # ---------- 存储 ----------
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _load(self) -> None:
+        import faiss
+
+        if not self.index_path.exists():
+            if not self.read_only:
+                # 首次落盘前退出时写入的元数据作废，重新收录
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM cases")
+            return
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if self.read_only else 0
+        self._index = faiss.read_index(str(self.index_path), flags)
+        self._set_train_size()
+        if self.events_path.exists():
+            if self.read_only:
+                self._masks = np.memmap(self.events_path, dtype=np.uint64, mode="r")
+            else:
+                self._masks = np.fromfile(self.events_path, dtype=np.uint64)
+        pending_path = self.root / "pending.npy"
+        if pending_path.exists():
+            self._pending = list(np.load(pending_path))
+        # 索引与元数据以较少的一方为准（上次落盘后写入的案例需要重新收录）
+        n = self._index.ntotal + len(self._pending)
+        self._masks = self._masks[:n]
+        if not self.read_only:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM cases WHERE id >= ?", (n,))
+        print(f"已加载历史案例索引: {self.root}（{n} 条）")
+
+    def save(self) -> None:
+        import faiss
+
+        if self.read_only:
+            return
+        with self._lock:
+            if self._index is None:
+                return
+            tmp = self.index_path.with_suffix(".tmp")
+            faiss.write_index(self._index, str(tmp))
+            os.replace(tmp, self.index_path)
+            self._masks.tofile(self.events_path)
+            pending_path = self.root / "pending.npy"
+            if self._pending:
+                np.save(pending_path, np.vstack(self._pending))
+            elif pending_path.exists():
+                pending_path.unlink()
+            self._unsaved = 0
+
+    def close(self) -> None:
+        if self._unsaved:
+            self.save()
+
+    # ---------- 写入 ----------
+    def _get_embeddings(self):
+        if self._embeddings is None:
+            from .embeddings import load_embeddings
+            self._embeddings = load_embeddings()
+        return self._embeddings
+
+    def embed(self, text: str) -> np.ndarray:
+        return np.asarray(self._get_embeddings().embed_query(text), dtype=np.float32)
+
+    def _create(self, dim: int) -> None:
+        import faiss
+
+        self._index = faiss.index_factory(dim, self.factory, faiss.METRIC_INNER_PRODUCT)
+        self._set_train_size()
+
+    def _set_train_size(self) -> None:
+        """IVF 默认每个聚类中心 40 条训练样本"""
+        import faiss
+
+        if self.train_size is None:
+            ivf = faiss.try_extract_index_ivf(self._index)
+            self.train_size = 40 * ivf.nlist if ivf is not None else 0
+
+    def _event_bit(self, conn: sqlite3.Connection, event: str) -> Optional[int]:
+        """事件对应的掩码位；已满 64 种时返回 None（该事件不进掩码，案例照常收录）"""
+        bit = self._bits.get(event)
+        if bit is None:
+            if len(self._bits) >= MAX_EVENTS:
+                if event not in self._unmasked:
+                    self._unmasked.add(event)
+                    print(f"事件种类超过 {MAX_EVENTS} 个，不能按该事件过滤: {event}")
+                return None
+            bit = self._bits[event] = len(self._bits)
+            conn.execute("INSERT INTO event_bits (name, bit) VALUES (?, ?)", (event, bit))
+        return bit
+
+    def add_many(self, items: Sequence[Dict[str, Any]],
+                 vectors: Optional[Sequence[np.ndarray]] = None) -> int:
+        """
+        收录一批已判定文本：items 为 {"text", "violation", "triggered_event", "reason", ...}
+        （predict 结果或 result_store.make_record 的输出加上 text）。返回新收录条数
+        """
+        if self.read_only:
+            raise RuntimeError("只读（mmap）加载的案例索引不能写入")
+        if not items:
+            return 0
+        if vectors is None:
+            vectors = self._get_embeddings().embed_documents([item["text"] for item in items])
+        added = 0
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                new_vectors, new_masks = [], []
+                next_id = len(self._masks)
+                for item, vector in zip(items, vectors):
+                    events = split_events(item["triggered_event"])
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO cases (id, text_hash, text, violation, events, reason, source, "
+                        "rule_version, ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (next_id, _text_hash(item["text"]), item["text"], int(bool(item["violation"])),
+                         json.dumps(events, ensure_ascii=False), item.get("reason", ""),
+                         item.get("source", "llm"), item.get("rule_version", ""), item.get("ts") or time.time()))
+                    if not cursor.rowcount:
+                        continue
+                    mask = 0
+                    for event in events:
+                        bit = self._event_bit(conn, event)
+                        if bit is not None:
+                            mask |= 1 << bit
+                    new_vectors.append(np.asarray(vector, dtype=np.float32))
+                    new_masks.append(mask)
+                    next_id += 1
+                if not new_vectors:
+                    return 0
+                if self._index is None:
+                    self._create(len(new_vectors[0]))
+                self._pending.extend(new_vectors)
+                self._flush_pending()
+                self._masks = np.concatenate([self._masks, np.asarray(new_masks, dtype=np.uint64)])
+                self._bitmaps.clear()
+                added = len(new_vectors)
+            self._unsaved += added
+            if self._unsaved >= self.save_every:
+                self.save()
+        return added
+
+    def add(self, text: str, result: Dict[str, Any], vector: Optional[np.ndarray] = None) -> bool:
+        return self.add_many([{**result, "text": text}], None if vector is None else [vector]) > 0
+
+    def _flush_pending(self) -> None:
+        """pending 中的向量加入 FAISS 索引；需要训练的索引攒够 train_size 条才训练"""
+        if not self._pending:
+            return
+        if not self._index.is_trained:
+            if len(self._pending) < self.train_size:
+                return
+            print(f"训练历史案例索引（{self.factory}，{len(self._pending)} 条样本）")
+            self._index.train(np.vstack(self._pending))
+        self._index.add(np.vstack(self._pending))
+        self._pending = []
+
+    # ---------- 检索 ----------
+    def __len__(self) -> int:
+        return len(self._masks)
+
+    def _bitmap(self, events: Iterable[str]) -> Optional[np.ndarray]:
+        """事件集合（任一命中）-> 按 id 的位图，缓存到下一次写入"""
+        mask = 0
+        for event in events:
+            if event in self._bits:
+                mask |= 1 << self._bits[event]
+        if not mask:
+            return None
+        bitmap = self._bitmaps.get(mask)
+        if bitmap is None:
+            selected = (self._masks & np.uint64(mask)) != 0
+            bitmap = self._bitmaps[mask] = np.packbits(selected, bitorder="little")
+        return bitmap
+
+    def _search_params(self, bitmap: Optional[np.ndarray]):
+        import faiss
+
+        selector = faiss.IDSelectorBitmap(len(self._masks), faiss.swig_ptr(bitmap)) if bitmap is not None else None
+        if faiss.try_extract_index_ivf(self._index) is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe), selector
+        if "HNSW" in self.factory:
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search), selector
+        return faiss.SearchParameters(sel=selector), selector
+
+    def search(self, text: Optional[str] = None, k: int = 5, events: Optional[Iterable[str]] = None,
+               min_score: Optional[float] = None, vector: Optional[np.ndarray] = None) -> List[SimilarCase]:
+        """
+        相似历史案例 top-k（按相似度降序）。events 不为空时只在触发过其中任一事件的案例里检索；
+        传入 vector 时不再重复编码 text
+        """
+        if vector is None:
+            vector = self.embed(text)
+        query = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            if not len(self._masks):
+                return []
+            bitmap = None
+            if events is not None:
+                bitmap = self._bitmap(events)
+                if bitmap is None:
+                    return []
+            candidates: Dict[int, float] = {}
+            if self._index.ntotal:
+                params, _selector = self._search_params(bitmap)
+                scores, ids = self._index.search(query, k, params=params)
+                candidates.update((int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i >= 0)
+            if self._pending:
+                # 未训练前的暂存向量：暴力检索，先按事件位图过滤再取 top-k
+                offset = self._index.ntotal
+                scores = np.vstack(self._pending) @ query[0]
+                ids = np.arange(offset, offset + len(scores))
+                if bitmap is not None:
+                    keep = np.unpackbits(bitmap, count=len(self._masks), bitorder="little")[offset:].astype(bool)
+                    ids, scores = ids[keep], scores[keep]
+                for j in np.argsort(-scores)[:k]:
+                    candidates[int(ids[j])] = float(scores[j])
+        ranked = sorted(candidates.items(), key=lambda x: -x[1])
+        if min_score is not None:
+            ranked = [(i, s) for i, s in ranked if s >= min_score]
+        return self.get([i for i, _ in ranked[:k]], dict(ranked))
+
+    def get(self, ids: Sequence[int], scores: Optional[Dict[int, float]] = None) -> List[SimilarCase]:
+        if not ids:
+            return []
+        rows = self._connect().execute(
+            f"SELECT id, text, violation, events, reason, rule_version, ts FROM cases "
+            f"WHERE id IN ({','.join('?' * len(ids))})", list(ids)).fetchall()
+        by_id = {row[0]: row for row in rows}
+        cases = []
+        for i in ids:
+            row = by_id.get(i)
+            if row is None:
+                continue
+            cases.append(SimilarCase(row[0], (scores or {}).get(i, 0.0), row[1], bool(row[2]),
+                                     join_events(json.loads(row[3])), row[4], row[5], row[6]))
+        return cases
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cases": len(self),
+            "case_index_pending": len(self._pending),
+            "case_index_unsaved": self._unsaved,
+            "case_index_unmasked_events": len(self._unmasked),
+        }
+
+
+def build_from_store(index: CaseIndex, store, start: Any = None, end: Any = None,
+                     batch_size: int = 1024, include_local: bool = False) -> int:
+    """
+    从结果库（ResultStore）批量收录历史判定。默认只收录 LLM 判定的结果，
+    本地 / 近似重复 / 蒸馏放行 / 降级结论不作为案例
+    """
+    frame = store.scan(start, end, columns=["ts", "text", "violation", "triggered_event",
+                                             "reason", "source", "rule_version", "degraded"])
+    if frame.empty:
+        return 0
+    if not include_local:
+        frame = frame[(frame["source"] == "llm") & ~frame["degraded"].astype(bool)]
+    records = frame.to_dict("records")
+    added = 0
+    for i in range(0, len(records), batch_size):
+        added += index.add_many(records[i:i + batch_size])
+    index.save()
+    return added
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .result_store import ResultStore
+
+    parser = argparse.ArgumentParser(description="历史判定案例索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="从结果库增量收录历史判定")
+    build.add_argument("--store", default=None, help="结果库目录（默认 RESULT_STORE_DIR）")
+    build.add_argument("--start")
+    build.add_argument("--end")
+    build.add_argument("--factory", default="HNSW32")
+    query = sub.add_parser("query", help="检索相似案例")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=5)
+    query.add_argument("--event", action="append")
+    parser.add_argument("--root", default=None, help="索引目录（默认 CASE_INDEX_DIR）")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        case_index = CaseIndex(args.root, factory=args.factory)
+        n = build_from_store(case_index, ResultStore(args.store), args.start, args.end)
+        print(f"新收录 {n} 条，索引共 {len(case_index)} 条")
+    else:
+        case_index = CaseIndex(args.root, mmap=True)
+        for case in case_index.search(args.text, args.k, args.event):
+            label = "违规" if case.violation else "不违规"
+            print(f"[{case.score:.3f}] {label}（{case.triggered_event}）{case.text}\n    {case.reason}")
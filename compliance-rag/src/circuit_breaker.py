@@ -0,0 +1,119 @@
+# src/circuit_breaker.py
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from .concurrency import classify_error
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    LLM 调用熔断器。
+    - closed：正常放行，最近 window 次调用中失败数达到 failure_threshold 且失败率
+      超过 failure_rate 时打开
+    - open：直接拒绝，recovery_timeout 秒后进入 half_open
+    - half_open：最多放行 half_open_max_calls 个探测请求，成功则关闭，失败重新打开
+    只有限流/5xx/超时/连接错误计入失败；参数错误等致命错误由调用方自行处理。
+    """
+
+    def __init__(self, failure_threshold: int = 5, failure_rate: float = 0.5,
+                 window: int = 20, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1,
+                 on_state_change: Optional[Callable[[str, str], None]] = None):
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.on_state_change = on_state_change
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._results = deque(maxlen=window)  # True 表示失败
+        self._opens = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _set_state(self, state: str) -> None:
+        old, self._state = self._state, state
+        if old != state:
+            print(f"LLM 熔断器状态: {old} -> {state}")
+            if self.on_state_change:
+                self.on_state_change(old, state)
+
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._half_open_calls = 0
+            self._set_state(HALF_OPEN)
+
+    def allow(self) -> bool:
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._results.append(False)
+            if self._state == HALF_OPEN:
+                self._results.clear()
+                self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._results.append(True)
+            if self._state == HALF_OPEN:
+                self._open()
+                return
+            failures = sum(self._results)
+            if failures >= self.failure_threshold and failures / len(self._results) >= self.failure_rate:
+                self._open()
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._opens += 1
+        self._set_state(OPEN)
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if not self.allow():
+            raise CircuitOpenError("LLM 服务熔断中")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if classify_error(e) == "fatal":
+                # 致命错误说明服务可达，仅释放 half_open 探测名额
+                with self._lock:
+                    if self._state == HALF_OPEN:
+                        self._half_open_calls = max(0, self._half_open_calls - 1)
+            else:
+                self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                "circuit_state": self._state,
+                "circuit_opens": self._opens,
+                "recent_failures": sum(self._results),
+            }
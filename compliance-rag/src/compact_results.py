@@ -0,0 +1,268 @@
+# src/compact_results.py
+"""
+百万行批量结果的紧凑表示。
+
+批量路径原来每行一个 dict（原文、合规状态字符串、事件字符串、完整理由、raw_response），
+最后再整体拷贝进 DataFrame，峰值内存随输入线性增长。这里改为列式存储：
+- 原文 / 理由：UTF-8 字节拼接在 bytearray 中，只存偏移量；理由可选 zlib 压缩
+- 触发事件：事件名驻留为编号，每行一个 64 位掩码；前 64 种以外的事件名（LLM 自由文本）按原字符串另存一列
+- 是否违规 / 降级 / 来源：array 中的单字节
+- raw_response：默认丢弃，可选 zlib 压缩或原样保留
+- 内存中的行数达到 chunk_rows 后溢写为 Parquet 分块，只在需要时逐块读回
+DataFrame 只在 to_frame / iter_frames 时按需生成。
+"""
+import shutil
+import tempfile
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .local_screen import join_events, split_events
+
+RAW_DROP, RAW_ZLIB, RAW_KEEP = "drop", "zlib", "keep"
+MAX_EVENTS = 64
+
+
+class VerdictRecord:
+    """单行结果（迭代时按需构造）"""
+
+    __slots__ = ("text", "violation", "triggered_event", "reason", "raw_response", "source", "degraded")
+
+    def __init__(self, text: str, violation: bool, triggered_event: str, reason: str,
+                 raw_response: str, source: str, degraded: bool):
+        self.text = text
+        self.violation = violation
+        self.triggered_event = triggered_event
+        self.reason = reason
+        self.raw_response = raw_response
+        self.source = source
+        self.degraded = degraded
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class _Interner:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def lookup(self, name: str) -> Optional[int]:
+        """驻留编号，驻留表已满时返回 None"""
+        value = self.ids.get(name)
+        if value is None:
+            if len(self.names) >= self.limit:
+                return None
+            value = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return value
+
+    def id(self, name: str) -> int:
+        value = self.lookup(name)
+        if value is None:
+            raise ValueError(f"驻留表已满（最多 {self.limit} 项）: {name}")
+        return value
+
+
+class _StringColumn:
+    """变长字符串列：字节拼接 + 结束偏移"""
+
+    def __init__(self, compress: bool = False):
+        self.compress = compress
+        self.data = bytearray()
+        self.ends = array("Q")
+
+    def append(self, value: str) -> None:
+        raw = value.encode("utf-8")
+        self.data += zlib.compress(raw) if self.compress and raw else raw
+        self.ends.append(len(self.data))
+
+    def get(self, i: int) -> str:
+        start = self.ends[i - 1] if i else 0
+        chunk = bytes(self.data[start:self.ends[i]])
+        if self.compress and chunk:
+            chunk = zlib.decompress(chunk)
+        return chunk.decode("utf-8")
+
+    def nbytes(self) -> int:
+        return len(self.data) + self.ends.itemsize * len(self.ends)
+
+
+class CompactResults:
+    """见模块说明；spill_dir 为空时使用临时目录，close() 时删除"""
+
+    def __init__(self, chunk_rows: int = 100_000, spill_dir: Optional[str] = None,
+                 raw: str = RAW_DROP, compress_reason: bool = False, keep_text: bool = True):
+        if raw not in (RAW_DROP, RAW_ZLIB, RAW_KEEP):
+            raise ValueError(f"未知的 raw_response 保留方式: {raw}")
+        self.chunk_rows = chunk_rows
+        self.raw_mode = raw
+        self.compress_reason = compress_reason
+        self.keep_text = keep_text
+        self._own_dir = spill_dir is None
+        self._spill_dir = Path(spill_dir) if spill_dir else None
+        self._chunks: List[Path] = []
+        self._spilled_rows = 0
+        self.events = _Interner(MAX_EVENTS)
+        self.sources = _Interner(255)
+        self._mask_names: Dict[int, str] = {0: "无"}
+        self._reset()
+
+    def _reset(self) -> None:
+        self._text = _StringColumn()
+        self._reason = _StringColumn(self.compress_reason)
+        self._raw = _StringColumn(self.raw_mode == RAW_ZLIB)
+        self._extra = _StringColumn()
+        self._violation = array("b")
+        self._degraded = array("b")
+        self._source = array("B")
+        self._mask = array("Q")
+
+    # ---------- 写入 ----------
+    def append(self, text: str, result: Dict[str, Any]) -> None:
+        mask, extra = 0, []
+        for event in split_events(result["triggered_event"]):
+            i = self.events.lookup(event)
+            if i is None:
+                extra.append(event)
+            else:
+                mask |= 1 << i
+        self._extra.append(",".join(extra))
+        self._text.append(text if self.keep_text else "")
+        self._reason.append(result.get("reason", ""))
+        self._raw.append(result.get("raw_response", "") if self.raw_mode != RAW_DROP else "")
+        self._violation.append(1 if result["violation"] else 0)
+        self._degraded.append(1 if result.get("degraded") else 0)
+        self._source.append(self.sources.id(result.get("source", "llm")))
+        self._mask.append(mask)
+        if len(self._mask) >= self.chunk_rows:
+            self._spill()
+
+    def extend(self, pairs) -> None:
+        for text, result in pairs:
+            self.append(text, result)
+
+    def _spill(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not len(self._mask):
+            return
+        if self._spill_dir is None:
+            self._spill_dir = Path(tempfile.mkdtemp(prefix="compact-results-"))
+        self._spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self._spill_dir / f"chunk-{len(self._chunks):05d}.parquet"
+        n = len(self._mask)
+        table = pa.table({
+            "text": [self._text.get(i) for i in range(n)],
+            "reason": [self._reason.get(i) for i in range(n)],
+            "raw_response": [self._raw.get(i) for i in range(n)],
+            "violation": pa.array(self._violation.tolist(), pa.int8()),
+            "degraded": pa.array(self._degraded.tolist(), pa.int8()),
+            "source": pa.array(self._source.tolist(), pa.uint8()),
+            "mask": pa.array(self._mask.tolist(), pa.uint64()),
+            "extra_events": [self._extra.get(i) for i in range(n)],
+        })
+        pq.write_table(table, path, compression="zstd")
+        self._chunks.append(path)
+        self._spilled_rows += n
+        self._reset()
+
+    # ---------- 读取 ----------
+    def __len__(self) -> int:
+        return self._spilled_rows + len(self._mask)
+
+    def event_names(self, mask: int, extra: str = "") -> str:
+        name = self._mask_names.get(mask)
+        if name is None:
+            name = self._mask_names[mask] = join_events(
+                [e for i, e in enumerate(self.events.names) if mask >> i & 1])
+        if extra:
+            return join_events(split_events(name) + extra.split(","))
+        return name
+
+    def _columns(self) -> Iterator[Tuple[Sequence, ...]]:
+        """逐块产出 (text, reason, raw, violation, degraded, source, mask, extra_events)"""
+        import pyarrow.parquet as pq
+
+        for path in self._chunks:
+            t = pq.read_table(path).to_pydict()
+            yield (t["text"], t["reason"], t["raw_response"], t["violation"], t["degraded"], t["source"],
+                   t["mask"], t["extra_events"])
+        n = len(self._mask)
+        if n:
+            yield ([self._text.get(i) for i in range(n)], [self._reason.get(i) for i in range(n)],
+                   [self._raw.get(i) for i in range(n)], self._violation, self._degraded, self._source, self._mask,
+                   [self._extra.get(i) for i in range(n)])
+
+    def __iter__(self) -> Iterator[VerdictRecord]:
+        for text, reason, raw, violation, degraded, source, mask, extra in self._columns():
+            for i in range(len(mask)):
+                yield VerdictRecord(text[i], bool(violation[i]), self.event_names(mask[i], extra[i]), reason[i],
+                                    raw[i], self.sources.names[source[i]], bool(degraded[i]))
+
+    def counts(self) -> Dict[str, int]:
+        """不生成 DataFrame 的统计：总数、违规数、各事件命中数"""
+        counts = {"total": 0, "violation": 0}
+        per_event = [0] * len(self.events.names)
+        overflow: Dict[str, int] = {}
+        for _, _, _, violation, _, _, mask, extra in self._columns():
+            counts["total"] += len(mask)
+            counts["violation"] += sum(violation)
+            for m in mask:
+                while m:
+                    low = m & -m
+                    per_event[low.bit_length() - 1] += 1
+                    m ^= low
+            for names in extra:
+                for e in names.split(",") if names else ():
+                    overflow[e] = overflow.get(e, 0) + 1
+        counts.update({e: per_event[i] for i, e in enumerate(self.events.names)})
+        counts.update(overflow)
+        return counts
+
+    def iter_frames(self, labels: Optional[Dict[str, str]] = None):
+        """逐块生成 DataFrame；labels 可把列名映射为界面展示用的中文列名"""
+        import pandas as pd
+
+        for text, reason, raw, violation, degraded, source, mask, extra in self._columns():
+            frame = pd.DataFrame({
+                "text": text,
+                "violation": [bool(v) for v in violation],
+                "triggered_event": [self.event_names(m, x) for m, x in zip(mask, extra)],
+                "reason": reason,
+                "source": [self.sources.names[s] for s in source],
+                "degraded": [bool(d) for d in degraded],
+            })
+            if self.raw_mode != RAW_DROP:
+                frame["raw_response"] = raw
+            yield frame.rename(columns=labels) if labels else frame
+
+    def to_frame(self, labels: Optional[Dict[str, str]] = None):
+        import pandas as pd
+
+        frames = list(self.iter_frames(labels))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def to_csv(self, path: str, labels: Optional[Dict[str, str]] = None) -> None:
+        """逐块追加写 CSV，导出时内存只占一块"""
+        first = True
+        for frame in self.iter_frames(labels):
+            frame.to_csv(path, mode="w" if first else "a", header=first, index=False,
+                         encoding="utf-8-sig" if first else "utf-8")
+            first = False
+
+    def nbytes(self) -> int:
+        """内存中（未溢写部分）的大致字节数"""
+        arrays = (self._violation, self._degraded, self._source, self._mask)
+        return (self._text.nbytes() + self._reason.nbytes() + self._raw.nbytes() + self._extra.nbytes()
+                + sum(a.itemsize * len(a) for a in arrays))
+
+    def close(self) -> None:
+        if self._own_dir and self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+        self._chunks = []
+        self._spilled_rows = 0
+        self._reset()
@@ -0,0 +1,190 @@
+# src/concurrency.py
+import math
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+# 视为“被限流”的状态码与视为“服务端异常”的状态码
+THROTTLE_STATUS = {429}
+RETRYABLE_STATUS = {500, 502, 503, 504}
+
+
+def extract_status(exc: BaseException) -> Optional[int]:
+    """从 openai / httpx 异常中取出 HTTP 状态码，取不到返回 None"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_retry_after(exc: BaseException) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），取不到返回 None"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(exc: BaseException) -> str:
+    """把异常归类为 throttle / server / timeout / fatal"""
+    status = extract_status(exc)
+    if status in THROTTLE_STATUS:
+        return "throttle"
+    if status in RETRYABLE_STATUS:
+        return "server"
+    name = type(exc).__name__
+    if "Timeout" in name or "Connection" in name:
+        return "timeout"
+    return "fatal"
+
+
+class AdaptiveConcurrencyController:
+    """
+    AIMD 自适应并发控制器。
+    - 成功且延迟健康：每完成一个“窗口”（当前并发数个请求）并发上限 +increase_step
+    - 429 / 5xx / 超时 / 延迟超过基线 latency_tolerance 倍：并发上限乘以 decrease_factor
+    - 响应携带 Retry-After 时，在该时间内暂停发放新的并发名额
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        increase_step: int = 1,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        default_backoff: float = 1.0,
+        max_attempts: int = 4,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.default_backoff = default_backoff
+        self.max_attempts = max_attempts
+
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._blocked_until = 0.0
+        self._window_successes = 0
+        self._last_decrease = 0.0
+        # 基线延迟取近期最小值的慢速 EWMA，当前延迟取快速 EWMA
+        self._baseline_latency: Optional[float] = None
+        self._recent_latency: Optional[float] = None
+        self._counters = {"success": 0, "throttle": 0, "server": 0, "timeout": 0, "fatal": 0}
+
+    # ---------- 名额管理 ----------
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait_for = None
+                if now < self._blocked_until:
+                    wait_for = self._blocked_until - now
+                elif self._inflight < int(self.limit):
+                    self._inflight += 1
+                    return True
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return False
+                    wait_for = remaining if wait_for is None else min(wait_for, remaining)
+                self._cond.wait(wait_for)
+
+    def release(self, latency: Optional[float] = None, outcome: str = "success",
+                retry_after: Optional[float] = None) -> None:
+        with self._cond:
+            self._inflight = max(0, self._inflight - 1)
+            self._counters[outcome] = self._counters.get(outcome, 0) + 1
+            if outcome == "success":
+                self._on_success(latency)
+            elif outcome in ("throttle", "server", "timeout"):
+                self._on_congestion(retry_after if outcome == "throttle" else None)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """with controller.slot() as report: ...; 默认按成功计，异常时自动归类"""
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            outcome = classify_error(e)
+            self.release(time.monotonic() - started, outcome, extract_retry_after(e))
+            raise
+        else:
+            self.release(time.monotonic() - started, "success")
+
+    # ---------- AIMD ----------
+    def _on_success(self, latency: Optional[float]) -> None:
+        if latency is not None:
+            self._recent_latency = latency if self._recent_latency is None else 0.7 * self._recent_latency + 0.3 * latency
+            if self._baseline_latency is None or latency < self._baseline_latency:
+                self._baseline_latency = latency
+            else:
+                self._baseline_latency = 0.98 * self._baseline_latency + 0.02 * latency
+            if self._recent_latency > self._baseline_latency * self.latency_tolerance:
+                self._on_congestion(None)
+                return
+        self._window_successes += 1
+        if self._window_successes >= int(self.limit):
+            self._window_successes = 0
+            self.limit = min(self.max_limit, self.limit + self.increase_step)
+
+    def _on_congestion(self, retry_after: Optional[float]) -> None:
+        now = time.monotonic()
+        if retry_after is not None:
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+        # 同一批并发请求同时失败时只降一次
+        if now - self._last_decrease >= (self._recent_latency or 0.0):
+            self.limit = max(self.min_limit, math.floor(self.limit * self.decrease_factor))
+            self._last_decrease = now
+            self._window_successes = 0
+
+    # ---------- 调用封装 ----------
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在并发名额内调用 fn，遇到限流/5xx/超时按退避重试，致命错误直接抛出"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self.slot():
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                outcome = classify_error(e)
+                if outcome == "fatal" or attempt >= self.max_attempts:
+                    raise
+                retry_after = extract_retry_after(e)
+                if retry_after is None:
+                    time.sleep(self.default_backoff * (2 ** (attempt - 1)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "concurrency_limit": int(self.limit),
+                "inflight": self._inflight,
+                "blocked_for": max(0.0, self._blocked_until - time.monotonic()),
+                "baseline_latency": self._baseline_latency,
+                "recent_latency": self._recent_latency,
+                **{f"count_{k}": v for k, v in self._counters.items()},
+            }
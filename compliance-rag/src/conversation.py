@@ -0,0 +1,159 @@
+# src/conversation.py
+"""
+长对话按轮次切分滑动窗口。
+
+整段聊天记录直接送进单条 Prompt 时可能超出上下文或挤占 max_tokens 的输出预算。
+这里先按说话人切分轮次，再按估算 token 数把连续轮次打包成窗口，相邻窗口重叠
+overlap_turns 轮，窗口边界不会切断一轮发言（单轮超长时才按句子拆开）。
+各窗口的判定再映射回轮次下标，重叠窗口中同一事件落在相交轮次上的只算一次违规。
+"""
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+from .local_screen import split_events
+
+# "客户：" "销售:" "[10:01] 张三：" "2024-01-01 10:01 顾问：" 这类行首视为新一轮发言
+_SPEAKER = re.compile(
+    r"^\s*(?:[\[【(（]?\d{1,4}[-/:：]\d{1,2}(?:[-/:：]\d{1,2})?(?:\s+\d{1,2}:\d{2}(?::\d{2})?)?[\]】)）]?\s*)?"
+    r"(?P<speaker>[^\s：:，,。]{1,12})[：:]\s*(?P<text>.*)$"
+)
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;\n])")
+_CJK = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+_QUOTED = re.compile(r"[“\"「『](.{2,40}?)[”\"」』]")
+
+
+class Turn(NamedTuple):
+    index: int
+    speaker: str
+    text: str
+
+    def render(self) -> str:
+        return f"{self.speaker}：{self.text}" if self.speaker else self.text
+
+
+class Window(NamedTuple):
+    turns: Tuple[int, ...]
+    text: str
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：汉字按 1 个 token，其余字符按 4 个字符 1 个 token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def split_turns(text: str) -> List[Turn]:
+    """按说话人切分轮次；没有说话人标记的续行并入上一轮，整段都没有标记时每个非空行算一轮"""
+    turns: List[List[str]] = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        m = _SPEAKER.match(line)
+        if m:
+            turns.append([m.group("speaker"), m.group("text").strip()])
+        elif turns and turns[-1][0]:
+            turns[-1][1] = (turns[-1][1] + "\n" + line.strip()).strip()
+        else:
+            turns.append(["", line.strip()])
+    return [Turn(i, speaker, body) for i, (speaker, body) in enumerate(turns)]
+
+
+def _split_long(text: str, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """单轮超长时按句子拆成不超过 max_tokens 的片段，单句仍超长则按字符硬切"""
+    pieces, current = [], ""
+    for sentence in (s for s in _SENTENCE_END.split(text) if s):
+        while count(sentence) > max_tokens:
+            cut = max(1, len(sentence) * max_tokens // count(sentence))
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:]
+        if current and count(current + sentence) > max_tokens:
+            pieces.append(current)
+            current = ""
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def build_windows(turns: Sequence[Turn], max_tokens: int = 1200, overlap_turns: int = 2,
+                  count: Callable[[str], int] = estimate_tokens) -> List[Window]:
+    """贪心打包连续轮次；下一个窗口从上一个窗口末尾往回 overlap_turns 轮开始"""
+    windows: List[Window] = []
+    start = 0
+    while start < len(turns):
+        first = turns[start]
+        if count(first.render()) > max_tokens:
+            for piece in _split_long(first.text, max_tokens, count):
+                windows.append(Window((first.index,), Turn(first.index, first.speaker, piece).render()))
+            start += 1
+            continue
+        end, used = start, 0
+        while end < len(turns):
+            cost = count(turns[end].render()) + 1
+            if end > start and used + cost > max_tokens:
+                break
+            used += cost
+            end += 1
+        chunk = turns[start:end]
+        windows.append(Window(tuple(t.index for t in chunk), "\n".join(t.render() for t in chunk)))
+        if end >= len(turns):
+            break
+        # 保证前进：重叠轮次数不能吃掉整个窗口
+        start = max(start + 1, end - overlap_turns)
+    return windows
+
+
+def attribute_turns(event: str, result: Dict[str, Any], window: Window, turns: Sequence[Turn],
+                    turn_hits: Sequence[Dict[str, Any]]) -> List[int]:
+    """
+    把窗口级事件落到具体轮次：
+    1. 理由中引用的原文片段所在轮次
+    2. 该事件的关键词命中所在轮次
+    3. 都没有时归到整个窗口
+    """
+    quotes = [q for q in _QUOTED.findall(result.get("reason", "")) if q.strip()]
+    quoted = [i for i in window.turns if any(q in turns[i].text for q in quotes)]
+    if quoted:
+        return quoted
+    hit = [i for i in window.turns if event in turn_hits[i]]
+    if hit:
+        return hit
+    return list(window.turns)
+
+
+def merge_window_verdicts(windows: Sequence[Window], results: Sequence[Dict[str, Any]],
+                          turns: Sequence[Turn], turn_hits: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同一事件、轮次相交的窗口判定合并为一条违规，返回 [{event, turns, reasons, windows}]"""
+    occurrences: Dict[str, List[Dict[str, Any]]] = {}
+    for w_idx, (window, result) in enumerate(zip(windows, results)):
+        for event in split_events(result["triggered_event"]):
+            found = {
+                "event": event,
+                "turns": set(attribute_turns(event, result, window, turns, turn_hits)),
+                "reasons": [result["reason"]],
+                "windows": [w_idx],
+            }
+            merged = []
+            for occ in occurrences.get(event, []):
+                if occ["turns"] & found["turns"]:
+                    found["turns"] |= occ["turns"]
+                    found["reasons"] = occ["reasons"] + found["reasons"]
+                    found["windows"] = occ["windows"] + found["windows"]
+                else:
+                    merged.append(occ)
+            occurrences[event] = merged + [found]
+
+    violations = []
+    for event, occs in occurrences.items():
+        for occ in occs:
+            violations.append({
+                "event": event,
+                "turns": sorted(occ["turns"]),
+                "reasons": list(dict.fromkeys(occ["reasons"])),
+                "windows": sorted(set(occ["windows"])),
+            })
+    violations.sort(key=lambda v: (v["turns"][0], v["event"]))
+    return violations
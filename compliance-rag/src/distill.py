@@ -0,0 +1,258 @@
+# src/distill.py
+"""
+从 LLM 判定结果蒸馏本地 CPU 分类器。
+
+1. VerdictLog：predict 每次得到 LLM 结论时追加一行 JSONL（文本 -> 触发事件）
+2. train_distilled：字符 1~3-gram 哈希特征 + 每个事件一个逻辑回归（scikit-learn 训练），
+   留出集上为每个事件标定“放行阈值”，使该事件召回率不低于 target_recall
+3. 导出为 .npz（权重矩阵 + 阈值），推理只依赖 numpy
+4. DistilledClassifier.clears(text)：所有事件概率都低于放行阈值时，可以不调用 LLM
+
+命令行：
+    python -m src.distill train --log verdicts.jsonl --out models/distilled.npz
+    python -m src.distill report --log verdicts.jsonl --model models/distilled.npz
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from .local_screen import split_events
+
+DEFAULT_DIM = 1 << 18
+DEFAULT_NGRAMS = (1, 3)
+
+
+class VerdictLog:
+    """判定日志（JSONL，追加写，线程安全）"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def append(self, text: str, result: Dict[str, Any], **extra: Any) -> None:
+        record = {
+            "ts": time.time(),
+            "text": text,
+            "violation": bool(result["violation"]),
+            "events": split_events(result["triggered_event"]),
+            "source": result.get("source", "llm"),
+            **extra,
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def hashed_features(text: str, dim: int = DEFAULT_DIM,
+                    ngrams: Tuple[int, int] = DEFAULT_NGRAMS) -> List[int]:
+    """字符 n-gram 哈希特征下标（去重，二值特征）"""
+    lo, hi = ngrams
+    feats = set()
+    for n in range(lo, hi + 1):
+        for i in range(len(text) - n + 1):
+            feats.add(zlib.crc32(text[i:i + n].encode("utf-8")) % dim)
+    return sorted(feats)
+
+
+def _load_examples(records: Iterable[Dict[str, Any]], normalize=None) -> Tuple[List[str], List[List[str]]]:
+    texts, labels = [], []
+    for r in records:
+        if r.get("source", "llm") != "llm":
+            continue  # 只用 LLM 给出的标签，避免本地结论自我强化
+        text = r["text"]
+        texts.append(normalize(text).text if normalize else text)
+        labels.append(r["events"])
+    return texts, labels
+
+
+def _matrix(texts: List[str], dim: int, ngrams: Tuple[int, int]):
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    indptr, indices = [0], []
+    for t in texts:
+        indices.extend(hashed_features(t, dim, ngrams))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    return csr_matrix((data, indices, indptr), shape=(len(texts), dim))
+
+
+def _precision_recall(y_true, y_pred) -> Tuple[float, float, int]:
+    tp = sum(1 for t, p in zip(y_true, y_pred) if t and p)
+    fp = sum(1 for t, p in zip(y_true, y_pred) if not t and p)
+    fn = sum(1 for t, p in zip(y_true, y_pred) if t and not p)
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return precision, recall, tp + fn
+
+
+def train_distilled(log: VerdictLog, out_path: str, normalize=None,
+                    dim: int = DEFAULT_DIM, ngrams: Tuple[int, int] = DEFAULT_NGRAMS,
+                    holdout: float = 0.2, target_recall: float = 0.99,
+                    max_clear_threshold: float = 0.3, min_positives: int = 5, seed: int = 42) -> Dict[str, Dict[str, float]]:
+    """训练并导出模型，返回留出集上的逐事件精确率/召回率报告"""
+    import numpy as np
+    from sklearn.linear_model import LogisticRegression
+
+    texts, labels = _load_examples(log, normalize)
+    if not texts:
+        raise ValueError(f"判定日志为空: {log.path}")
+    order = list(range(len(texts)))
+    random.Random(seed).shuffle(order)
+    cut = int(len(order) * (1 - holdout))
+    train_idx, test_idx = order[:cut], order[cut:]
+
+    X = _matrix(texts, dim, ngrams)
+    X_train, X_test = X[train_idx], X[test_idx]
+    events = sorted({e for evs in labels for e in evs})
+
+    weights, bias, thresholds, report, trained = [], [], [], {}, []
+    for event in events:
+        y = np.array([event in evs for evs in labels], dtype=np.int8)
+        if y[train_idx].sum() < min_positives or y[train_idx].sum() == len(train_idx):
+            print(f"事件 {event} 正样本不足 {min_positives} 条，跳过（该事件始终交给 LLM）")
+            continue
+        clf = LogisticRegression(C=4.0, max_iter=1000, class_weight="balanced")
+        clf.fit(X_train, y[train_idx])
+        y_test = y[test_idx]
+        proba = clf.predict_proba(X_test)[:, 1] if len(test_idx) else np.array([])
+
+        # 放行阈值：留出集正样本概率的分位数，保证召回率 >= target_recall；
+        # 留出集较小时分位数偏乐观，再用 max_clear_threshold 封顶
+        positives = np.sort(proba[y_test == 1])
+        threshold = max_clear_threshold
+        if len(positives):
+            k = int(np.floor(len(positives) * (1 - target_recall)))
+            threshold = min(threshold, float(positives[min(k, len(positives) - 1)]) - 1e-6)
+        precision, recall, support = _precision_recall(y_test, proba >= 0.5)
+        _, clear_recall, _ = _precision_recall(y_test, proba >= threshold)
+        cleared = float((proba < threshold).mean()) if len(proba) else 0.0
+        report[event] = {
+            "support": support,
+            "precision@0.5": round(precision, 4),
+            "recall@0.5": round(recall, 4),
+            "clear_threshold": round(threshold, 6),
+            "recall@clear": round(clear_recall, 4),
+            "cleared_ratio": round(cleared, 4),
+        }
+        weights.append(clf.coef_[0].astype(np.float32))
+        bias.append(float(clf.intercept_[0]))
+        thresholds.append(threshold)
+        trained.append(event)
+
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        out_path,
+        weights=np.vstack(weights) if weights else np.zeros((0, dim), dtype=np.float32),
+        bias=np.array(bias, dtype=np.float32),
+        thresholds=np.array(thresholds, dtype=np.float32),
+        events=np.array(trained),
+        all_events=np.array(events),
+        dim=dim,
+        ngrams=np.array(ngrams),
+    )
+    print(f"蒸馏模型已导出: {out_path}（{len(trained)}/{len(events)} 个事件，样本 {len(texts)} 条）")
+    return report
+
+
+class DistilledClassifier:
+    """加载 .npz 蒸馏模型做 CPU 推理"""
+
+    def __init__(self, model_path: str):
+        import numpy as np
+
+        self._np = np
+        self.model_path = model_path
+        data = np.load(model_path)
+        self.weights = data["weights"]
+        self.bias = data["bias"]
+        self.thresholds = data["thresholds"]
+        self.events = [str(e) for e in data["events"]]
+        self.all_events = [str(e) for e in data["all_events"]]
+        self.dim = int(data["dim"])
+        self.ngrams = tuple(int(x) for x in data["ngrams"])
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        np = self._np
+        idx = hashed_features(text, self.dim, self.ngrams)
+        if not self.events:
+            return {}
+        logits = self.weights[:, idx].sum(axis=1) + self.bias
+        proba = 1.0 / (1.0 + np.exp(-logits))
+        return dict(zip(self.events, proba.tolist()))
+
+    def clears(self, text: str) -> bool:
+        """所有事件都低于放行阈值才放行；日志中出现过但没训练出模型的事件视为无法放行"""
+        if len(self.events) < len(self.all_events):
+            return False
+        proba = self.predict_proba(text)
+        return all(proba[e] < t for e, t in zip(self.events, self.thresholds.tolist()))
+
+
+def evaluate(log: VerdictLog, model: DistilledClassifier, normalize=None) -> Dict[str, Dict[str, float]]:
+    """在日志样本（建议使用训练后新积累的日志）上输出逐事件精确率/召回率"""
+    texts, labels = _load_examples(log, normalize)
+    probas = [model.predict_proba(t) for t in texts]
+    report = {}
+    for event, threshold in zip(model.events, model.thresholds.tolist()):
+        y_true = [event in evs for evs in labels]
+        precision, recall, support = _precision_recall(y_true, [p[event] >= 0.5 for p in probas])
+        _, clear_recall, _ = _precision_recall(y_true, [p[event] >= threshold for p in probas])
+        report[event] = {
+            "support": support,
+            "precision@0.5": round(precision, 4),
+            "recall@0.5": round(recall, 4),
+            "recall@clear": round(clear_recall, 4),
+        }
+    return report
+
+
+def _print_report(report: Dict[str, Dict[str, float]]) -> None:
+    for event, metrics in report.items():
+        print(f"{event:<24}" + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+
+
+def main():
+    from .normalizer import TextNormalizer
+    from .rule_loader import load_all_rules
+
+    parser = argparse.ArgumentParser(description="从 LLM 判定日志蒸馏本地分类器")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_train = sub.add_parser("train")
+    p_train.add_argument("--log", required=True)
+    p_train.add_argument("--out", default="models/distilled.npz")
+    p_train.add_argument("--target-recall", type=float, default=0.99)
+    p_report = sub.add_parser("report")
+    p_report.add_argument("--log", required=True)
+    p_report.add_argument("--model", default="models/distilled.npz")
+    for p in (p_train, p_report):
+        p.add_argument("--rules", default=str(Path(__file__).parent / "compliance_rules.yaml"))
+    args = parser.parse_args()
+
+    normalizer = TextNormalizer.from_rules(load_all_rules(args.rules))
+    log = VerdictLog(args.log)
+    if args.cmd == "train":
+        report = train_distilled(log, args.out, normalizer.normalize, target_recall=args.target_recall)
+    else:
+        report = evaluate(log, DistilledClassifier(args.model), normalizer.normalize)
+    _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
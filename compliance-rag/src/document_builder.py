@@ -24,5 +24,17 @@ def build_rule_documents(rules: List[ComplianceRule]) -> List[Document]:
             content_lines.append(f"- {label}: \"{ex.input}\" → {ex.reason}")
         
         content = "\n".join(content_lines).strip()
-        docs.append(Document(page_content=content))
-    return docs
\ No newline at end of file
+        docs.append(Document(page_content=content, metadata={"event_name": rule.event_name}))
+    return docs
+
+
+def build_example_documents(rules: List[ComplianceRule]) -> List[Document]:
+    """每条 few-shot 示例单独成文档，供检索相似示例"""
+    docs = []
+    for rule in rules:
+        for ex in rule.few_shot:
+            docs.append(Document(
+                page_content=ex.input,
+                metadata={"event_name": rule.event_name, "violation": ex.violation, "reason": ex.reason},
+            ))
+    return docs
@@ -0,0 +1,56 @@
+# src/embeddings.py
+import os
+import threading
+from typing import Any, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def load_embeddings(model_name: str = DEFAULT_EMBEDDING_MODEL, onnx_dir: Optional[str] = None) -> Any:
+    """
+    加载本地嵌入模型，供检索与相似度分类共用。
+    设置了 onnx_dir / 环境变量 EMBEDDING_ONNX_DIR 且目录存在时，使用 int8 量化的
+    ONNX 模型（见 onnx_embeddings.py），否则回退到 PyTorch 版 HuggingFaceEmbeddings。
+    """
+    onnx_dir = onnx_dir or os.getenv("EMBEDDING_ONNX_DIR")
+    if onnx_dir and os.path.isdir(onnx_dir):
+        from .onnx_embeddings import OnnxEmbeddings
+
+        print(f"使用 ONNX 嵌入模型: {onnx_dir}")
+        return OnnxEmbeddings(onnx_dir)
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        encode_kwargs={"normalize_embeddings": True},
+    )
+
+
+class SharedEmbeddings(Embeddings):
+    """
+    多个引擎（多租户）共享的嵌入模型：首次使用时才加载，之后所有调用方共用同一份权重。
+    接口与 langchain Embeddings 一致。
+    """
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, onnx_dir: Optional[str] = None):
+        self.model_name = model_name
+        self.onnx_dir = onnx_dir
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> Any:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = load_embeddings(self.model_name, self.onnx_dir)
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
@@ -0,0 +1,270 @@
+# src/engine_registry.py
+"""
+进程级引擎注册表：多个浏览器会话共用引擎。
+
+Streamlit 每个会话、每次重跑都会重新执行页面脚本，app.py 每次重跑都新建引擎，
+各页面之间也没有共享任何东西，30 个审核员同时使用时 LLM 并发没有上限。这里：
+- 模块级单例 get_registry()，同一进程内所有页面、所有会话共用
+- 每套配置（名称 -> ComplianceRAGEngine 构造参数）只在锁内构建一次，之后共享引擎内的
+  判定缓存、近似重复索引、编译好的规则匹配器
+- 所有引擎共享一个 httpx 连接池（各 LLM 后端复用 keep-alive 连接）、LLM 后端池、
+  AIMD 并发控制器、优先级调度器、熔断器和嵌入模型
+- 全局在途请求上限（ENGINE_MAX_INFLIGHT）：超过时排队，等待超过 ENGINE_ACQUIRE_TIMEOUT 秒抛出 EngineBusyError
+- bulk 优先级（后台批量任务）另有独立的在途上限（ENGINE_MAX_BULK_INFLIGHT），不占交互请求的名额，
+  满了只排队不超时；批量与交互请求之间的先后由优先级调度器决定
+- 按会话统计请求数、在途数、最近活动时间
+页面通过 registry.session(session_id) 取得会话句柄，句柄的 predict 等方法经过全局上限，
+其他属性（rules、stats() 等）直接转发给共享引擎。
+"""
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from .circuit_breaker import CircuitBreaker
+from .concurrency import AdaptiveConcurrencyController
+from .embeddings import SharedEmbeddings
+from .llm_pool import LLMPool
+from .priority_scheduler import BULK, INTERACTIVE, PriorityScheduler
+from .rag_engine import ComplianceRAGEngine
+
+DEFAULT = "default"
+# 最近这么多秒内有请求的会话算作活跃，超过 EXPIRE_SECONDS 没有活动的会话不再统计
+ACTIVE_SECONDS = 600
+EXPIRE_SECONDS = 24 * 3600
+
+
+class EngineBusyError(RuntimeError):
+    """全局在途请求已满且等待超时"""
+
+
+class EngineSession:
+    """一个浏览器会话的句柄：判定方法经过注册表的全局上限，其余属性转发给共享引擎"""
+
+    _BOUNDED = ("predict", "predict_conversation", "predict_batch", "predict_stream", "predict_compact")
+
+    def __init__(self, registry: "EngineRegistry", session_id: str, name: str):
+        self.registry = registry
+        self.session_id = session_id
+        self.name = name
+        self.engine = registry.get(name)
+
+    def __getattr__(self, attr: str) -> Any:
+        value = getattr(self.engine, attr)
+        if attr in self._BOUNDED:
+            return lambda *args, **kwargs: self.registry.run(self.session_id, value, *args, **kwargs)
+        return value
+
+
+class EngineRegistry:
+    """见模块说明；configs 为 {配置名: ComplianceRAGEngine 构造参数}，未登记的名称按默认参数构建"""
+
+    def __init__(self, configs: Optional[Dict[str, Dict[str, Any]]] = None,
+                 max_inflight: Optional[int] = None,
+                 acquire_timeout: Optional[float] = None,
+                 backends_file: Optional[str] = None,
+                 max_connections: int = 100):
+        self.configs: Dict[str, Dict[str, Any]] = dict(configs or {})
+        # 所有引擎共享的部分
+        self.http_client = _http_client(max_connections)
+        llm_kwargs = {"http_client": self.http_client} if self.http_client is not None else {}
+        self.llm_pool = LLMPool.from_config(backends_file, temperature=0.0, max_tokens=500, max_retries=0,
+                                            **llm_kwargs)
+        self.concurrency = AdaptiveConcurrencyController(
+            max_limit=sum(b.config.max_concurrency for b in self.llm_pool.backends))
+        self.scheduler = PriorityScheduler(lambda: int(self.concurrency.limit))
+        self.breaker = CircuitBreaker()
+        self.embeddings = SharedEmbeddings()
+
+        self.max_inflight = max_inflight or int(
+            os.getenv("ENGINE_MAX_INFLIGHT", max(4, 2 * self.concurrency.max_limit)))
+        self.acquire_timeout = acquire_timeout if acquire_timeout is not None else float(
+            os.getenv("ENGINE_ACQUIRE_TIMEOUT", 60))
+        self._slots = threading.BoundedSemaphore(self.max_inflight)
+        self.max_bulk_inflight = int(os.getenv("ENGINE_MAX_BULK_INFLIGHT", self.max_inflight))
+        self._bulk_slots = threading.BoundedSemaphore(self.max_bulk_inflight)
+
+        self._engines: Dict[str, Any] = {}
+        self._building: Dict[str, threading.Lock] = {}
+        self._build_seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self.inflight = self.peak_inflight = self.waiting = 0
+        self.bulk_inflight = self.bulk_waiting = 0
+        self.requests = self.rejected = self.errors = 0
+
+    def register(self, name: str, **engine_kwargs) -> None:
+        """登记一套配置；已构建的同名引擎不受影响"""
+        with self._lock:
+            self.configs[name] = engine_kwargs
+
+    def get(self, name: str = DEFAULT):
+        """取共享引擎，不存在时构建；并发的首次请求只构建一次，构建失败不缓存"""
+        with self._lock:
+            engine = self._engines.get(name)
+            if engine is not None:
+                return engine
+            build_lock = self._building.setdefault(name, threading.Lock())
+        with build_lock:
+            with self._lock:
+                engine = self._engines.get(name)
+            if engine is None:
+                engine = self._build(name)
+                with self._lock:
+                    self._engines[name] = engine
+                    self._building.pop(name, None)
+        return engine
+
+    def _build(self, name: str):
+        print(f"构建共享引擎: {name}")
+        started = time.monotonic()
+        engine = ComplianceRAGEngine(
+            concurrency=self.concurrency,
+            llm_pool=self.llm_pool,
+            breaker=self.breaker,
+            scheduler=self.scheduler,
+            embeddings=self.embeddings,
+            **self.configs.get(name, {}),
+        )
+        self._build_seconds[name] = time.monotonic() - started
+        return engine
+
+    def session(self, session_id: str, name: str = DEFAULT) -> EngineSession:
+        now = time.time()
+        with self._lock:
+            for sid in [sid for sid, s in self._sessions.items()
+                        if not s["inflight"] and now - s.get("last_seen", s["first_seen"]) > EXPIRE_SECONDS]:
+                del self._sessions[sid]
+            self._sessions.setdefault(session_id, {"requests": 0, "inflight": 0, "errors": 0,
+                                                   "first_seen": time.time(), "last_seen": time.time()})
+        return EngineSession(self, session_id, name)
+
+    def run(self, session_id: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在全局在途上限内执行一次判定调用"""
+        return self._run(session_id, False, fn, *args, **kwargs)
+
+    def run_bulk(self, session_id: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在 bulk 在途上限内执行一次判定调用，名额已满时一直等待"""
+        return self._run(session_id, True, fn, *args, **kwargs)
+
+    def _run(self, session_id: str, bulk: bool, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        slots = self._bulk_slots if bulk else self._slots
+        with self._lock:
+            if bulk:
+                self.bulk_waiting += 1
+            else:
+                self.waiting += 1
+        acquired = slots.acquire(timeout=None if bulk else self.acquire_timeout)
+        with self._lock:
+            if bulk:
+                self.bulk_waiting -= 1
+                self.bulk_inflight += 1
+            else:
+                self.waiting -= 1
+                if acquired:
+                    self.inflight += 1
+                    self.peak_inflight = max(self.peak_inflight, self.inflight)
+            if not acquired:
+                self.rejected += 1
+            else:
+                self.requests += 1
+                session = self._sessions.setdefault(session_id, {"requests": 0, "inflight": 0, "errors": 0,
+                                                                 "first_seen": time.time()})
+                session["requests"] += 1
+                session["inflight"] += 1
+                session["last_seen"] = time.time()
+        if not acquired:
+            raise EngineBusyError(f"检测请求过多（在途上限 {self.max_inflight}），请稍后重试")
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            slots.release()
+            with self._lock:
+                if bulk:
+                    self.bulk_inflight -= 1
+                else:
+                    self.inflight -= 1
+                session["inflight"] -= 1
+                if failed:
+                    self.errors += 1
+                    session["errors"] += 1
+
+    def predict(self, text: str, session_id: str = "", name: str = DEFAULT,
+                priority: str = INTERACTIVE) -> Dict[str, Any]:
+        """bulk 优先级走独立的 bulk 名额，其余走全局在途上限"""
+        run = self.run_bulk if priority == BULK else self.run
+        return run(session_id, self.get(name).predict, text, priority)
+
+    def close(self) -> None:
+        with self._lock:
+            engines, self._engines = list(self._engines.values()), {}
+        for engine in engines:
+            engine.close()
+        if self.http_client is not None:
+            self.http_client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            sessions = {sid: dict(s) for sid, s in self._sessions.items()}
+            stats = {
+                "engines": {name: round(self._build_seconds.get(name, 0.0), 2) for name in self._engines},
+                "requests_inflight": self.inflight,
+                "requests_max_inflight": self.max_inflight,
+                "requests_peak_inflight": self.peak_inflight,
+                "requests_waiting": self.waiting,
+                "requests_bulk_inflight": self.bulk_inflight,
+                "requests_bulk_max_inflight": self.max_bulk_inflight,
+                "requests_bulk_waiting": self.bulk_waiting,
+                "requests_total": self.requests,
+                "requests_rejected": self.rejected,
+                "requests_failed": self.errors,
+            }
+        stats["sessions"] = len(sessions)
+        stats["active_sessions"] = sum(now - s.get("last_seen", s["first_seen"]) <= ACTIVE_SECONDS
+                                       for s in sessions.values())
+        stats["session_detail"] = sessions
+        return {
+            **stats,
+            **self.concurrency.stats(),
+            **self.breaker.stats(),
+            "priorities": self.scheduler.stats(),
+            "backends": self.llm_pool.stats(),
+        }
+
+
+def _http_client(max_connections: int):
+    """所有 LLM 后端共用的 httpx 连接池；httpx 不可用时各后端使用各自的默认客户端"""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx.Client(limits=httpx.Limits(max_connections=max_connections,
+                                            max_keepalive_connections=max_connections),
+                        timeout=httpx.Timeout(60.0, connect=10.0))
+
+
+_registry: Optional[EngineRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry(**kwargs) -> EngineRegistry:
+    """进程级单例，首次调用的参数生效"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = EngineRegistry(**kwargs)
+    return _registry
+
+
+def session_for(state, name: str = DEFAULT) -> EngineSession:
+    """state 为会话级字典（Streamlit 的 st.session_state），会话 ID 首次使用时生成并保存在其中"""
+    if "engine_session_id" not in state:
+        state["engine_session_id"] = uuid.uuid4().hex
+    return get_registry().session(state["engine_session_id"], name)
@@ -0,0 +1,516 @@
+# src/fulltext.py
+"""
+已稽核对话的中文全文倒排索引。
+
+合规经常临时提问，比如“上季度哪些会话同时提到了华泰证券和最低佣金”，原来只能重新上传文件或 grep CSV。
+这里把结果库（ResultStore）中的文本增量导入 SQLite 中的位置倒排索引（<root>/fulltext.sqlite）：
+
+- 分词：词典匹配，词典 = 规则关键词 / 上下文词 / 规避写法 + 可选的自定义词典（FULLTEXT_DICT_FILE，每行一个词）。
+  建索引时每个汉字、每个字母数字字符、以及文中出现的每个词典词都记一个位置（字符偏移），
+  查询时对短语做正向最大匹配，所以任何子串（包括 "sh600519" 中的 "600519"）都能按短语查到，词典词只是让倒排表更短
+- 导入结果库分片时，倒排表与分片的导入记录在同一事务中提交，中途失败不会重复或漏导入；
+  分词规则变化后（TOKENIZER_VERSION）旧索引不再可用，需删除索引目录后重新导入
+- 段（segment）：每次导入按日期生成段，同一日期的段过多时自动合并；
+  每个 (词, 段) 一行，文档号 / 位置数 / 位置为 uint32 数组的二进制块，查询时直接 frombuffer
+- 词典变化不需要重建：每个词记录加入时的词典版本，查询某段时只使用该段建立时已有的词
+- 查询语法：空格或 AND 表示与，OR 表示或，NOT 或前缀 - 表示非，支持括号与 "引号短语"；
+  每个检索词都按短语（位置连续）匹配。日期过滤直接裁剪段，坐席过滤在段内文档表上完成
+"""
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .schemas import ComplianceRule
+
+MERGE_THRESHOLD = 8
+# 分词规则版本，记在 PRAGMA user_version 中；1: 字母数字按单字符索引
+TOKENIZER_VERSION = 1
+
+_TOKEN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]|[a-z0-9]")
+_QUERY = re.compile(r'\s*(\(|\)|"[^"]*"|[^\s()"]+)')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dictionary (
+    word TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    dict_version INTEGER NOT NULL,
+    docs INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_segments_date ON segments(date);
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    ts REAL NOT NULL,
+    conversation_id TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    violation INTEGER NOT NULL,
+    triggered_event TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_docs_segment_agent ON docs(segment, agent);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    docs BLOB NOT NULL,
+    counts BLOB NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (term, segment)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ingested_parts (
+    part TEXT PRIMARY KEY
+);
+"""
+
+
+def normalize(text: str) -> str:
+    """全角转半角、大写转小写；索引与查询使用同一规范化"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def rule_keywords(rules: List[ComplianceRule]) -> List[str]:
+    """规则中的关键词、上下文词与规避写法（含规范写法和变体），作为分词词典"""
+    words = []
+    for rule in rules:
+        trigger = rule.trigger
+        words += trigger.keywords + trigger.context_words
+        for canonical, variants in trigger.variants.items():
+            words += [canonical] + list(variants)
+    return words
+
+
+def load_dictionary(path: Optional[str] = None) -> List[str]:
+    path = path or os.getenv("FULLTEXT_DICT_FILE")
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+class Tokenizer:
+    """词典分词；words 为 {词: 加入时的词典版本}"""
+
+    def __init__(self, words: Dict[str, int]):
+        self.words = words
+        self.version = max(words.values(), default=0)
+        # 首字 -> 以该字开头的词长（降序），大部分位置不需要查词典
+        self.lengths: Dict[str, List[int]] = {}
+        for word in words:
+            self.lengths.setdefault(word[0], []).append(len(word))
+        for first, lengths in self.lengths.items():
+            self.lengths[first] = sorted(set(lengths), reverse=True)
+
+    def index_tokens(self, text: str) -> Dict[str, List[int]]:
+        """建索引：单个汉字 / 字母数字 + 文中出现的所有词典词 -> 位置列表"""
+        tokens: Dict[str, List[int]] = {}
+        for m in _TOKEN.finditer(text):
+            tokens.setdefault(m.group(), []).append(m.start())
+        for i, ch in enumerate(text):
+            for n in self.lengths.get(ch, ()):
+                word = text[i:i + n]
+                if len(word) == n and word in self.words and not _TOKEN.fullmatch(word):
+                    tokens.setdefault(word, []).append(i)
+        return tokens
+
+    def query_tokens(self, phrase: str, version: int) -> List[Tuple[str, int]]:
+        """查询短语正向最大匹配，只使用版本不高于 version 的词典词；返回 [(词, 相对偏移)]"""
+        tokens = []
+        i = 0
+        while i < len(phrase):
+            for n in self.lengths.get(phrase[i], ()):
+                word = phrase[i:i + n]
+                if len(word) == n and self.words.get(word, version + 1) <= version and not _TOKEN.fullmatch(word):
+                    tokens.append((word, i))
+                    i += n
+                    break
+            else:
+                m = _TOKEN.match(phrase, i)
+                if m:
+                    tokens.append((m.group(), i))
+                    i = m.end()
+                else:
+                    i += 1
+        return [(t, off - tokens[0][1]) for t, off in tokens] if tokens else []
+
+
+def parse_query(query: str) -> Any:
+    """
+    查询串 -> 语法树：("and", a, b) / ("or", a, b) / ("not", a) / ("phrase", 文本)
+    优先级 NOT > AND > OR
+    """
+    tokens = _QUERY.findall(query)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or():
+        node = parse_and()
+        while peek() == "OR":
+            take()
+            node = ("or", node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() not in (None, ")", "OR"):
+            if peek() == "AND":
+                take()
+            node = ("and", node, parse_not())
+        return node
+
+    def parse_not():
+        token = peek()
+        if token == "NOT":
+            take()
+            return ("not", parse_not())
+        if token is not None and token.startswith("-"):
+            if len(token) > 1:
+                tokens[pos] = token[1:]
+            else:
+                take()
+            return ("not", parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        token = take() if peek() is not None else None
+        if token is None:
+            raise ValueError(f"查询不完整: {query}")
+        if token == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError(f"括号不匹配: {query}")
+            take()
+            return node
+        if token.startswith('"'):
+            token = token.strip('"')
+        if not token:
+            raise ValueError(f"空短语: {query}")
+        return ("phrase", normalize(token))
+
+    tree = parse_or()
+    if peek() is not None:
+        raise ValueError(f"无法解析的查询: {query}")
+    return tree
+
+
+class FullTextIndex:
+    """见模块说明；keywords 一般为 rule_keywords(rules)"""
+
+    def __init__(self, root: Optional[str] = None, keywords: Iterable[str] = (),
+                 dictionary_file: Optional[str] = None):
+        self.root = Path(root or os.getenv("FULLTEXT_DIR", "fulltext"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / "fulltext.sqlite"
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._connect()
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._check_tokenizer_version(conn)
+            words = dict(conn.execute("SELECT word, version FROM dictionary").fetchall())
+            new = {normalize(w) for w in list(keywords) + load_dictionary(dictionary_file)}
+            new = {w for w in new if len(w) > 1 and w not in words}
+            if new:
+                # 新词的版本号高于已有的所有段，旧段查询时不会使用这些词
+                version = max(self.dict_version(conn), self._max_segment_version(conn)) + 1
+                conn.executemany("INSERT INTO dictionary (word, version) VALUES (?, ?)",
+                                 [(w, version) for w in sorted(new)])
+                words.update({w: version for w in new})
+        self.tokenizer = Tokenizer(words)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _check_tokenizer_version(conn: sqlite3.Connection) -> None:
+        """空索引直接记上当前分词版本；已有数据且版本不同的索引查询结果不可信，拒绝打开"""
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        if current == TOKENIZER_VERSION:
+            return
+        if conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]:
+            raise ValueError(f"全文索引的分词版本为 {current}，当前为 {TOKENIZER_VERSION}，"
+                             f"请删除索引目录后重新导入")
+        conn.execute(f"PRAGMA user_version = {TOKENIZER_VERSION}")
+
+    @staticmethod
+    def dict_version(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM dictionary").fetchone()[0]
+
+    @staticmethod
+    def _max_segment_version(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(MAX(dict_version), 0) FROM segments").fetchone()[0]
+
+    # ---------- 导入 ----------
+    def add(self, records: Sequence[Dict[str, Any]], part: Optional[str] = None) -> int:
+        """
+        导入一批记录（result_store.make_record 的输出），按日期各建一个段，返回导入条数。
+        part 为结果库分片名时，导入记录与倒排表在同一事务中提交；该分片已导入过则什么都不做，返回 0
+        """
+        by_date: Dict[str, List[Dict[str, Any]]] = {}
+        for r in records:
+            by_date.setdefault(r["date"], []).append(r)
+        with self._write_lock:
+            conn = self._connect()
+            # 段的词典版本取本进程分词器实际使用的版本（其他进程可能已写入更新的词）
+            version = self.tokenizer.version
+            with conn:
+                if part is not None and not conn.execute(
+                        "INSERT OR IGNORE INTO ingested_parts (part) VALUES (?)", (part,)).rowcount:
+                    return 0
+                for date, rows in by_date.items():
+                    segment = conn.execute("INSERT INTO segments (date, dict_version, docs) VALUES (?, ?, ?)",
+                                           (date, version, len(rows))).lastrowid
+                    postings: Dict[str, Tuple[array, array, array]] = {}
+                    for r in rows:
+                        doc = conn.execute(
+                            "INSERT INTO docs (segment, date, ts, conversation_id, agent, violation, "
+                            "triggered_event, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (segment, date, float(r["ts"]), r.get("conversation_id") or "", r.get("agent") or "",
+                             int(bool(r["violation"])), r["triggered_event"], r["text"])).lastrowid
+                        for term, positions in self.tokenizer.index_tokens(normalize(r["text"])).items():
+                            entry = postings.get(term)
+                            if entry is None:
+                                entry = postings[term] = (array("I"), array("I"), array("I"))
+                            entry[0].append(doc)
+                            entry[1].append(len(positions))
+                            entry[2].extend(positions)
+                    conn.executemany(
+                        "INSERT INTO postings (term, segment, docs, counts, positions) VALUES (?, ?, ?, ?, ?)",
+                        [(term, segment, d.tobytes(), c.tobytes(), p.tobytes())
+                         for term, (d, c, p) in postings.items()])
+            for date in by_date:
+                self._maybe_merge(date)
+        return len(records)
+
+    def ingest_store(self, store, start: Any = None, end: Any = None) -> int:
+        """增量导入结果库中尚未导入的 Parquet 分片（分片写入后不再修改，按文件名去重）"""
+        import pyarrow.parquet as pq
+
+        conn = self._connect()
+        done = {row[0] for row in conn.execute("SELECT part FROM ingested_parts")}
+        total = 0
+        for part_dir in sorted(store.parquet_dir.glob("date=*")):
+            date = part_dir.name[len("date="):]
+            if (start and date < str(start)[:10]) or (end and date > str(end)[:10]):
+                continue
+            for path in sorted(part_dir.glob("*.parquet")):
+                part = f"{part_dir.name}/{path.name}"
+                if part in done:
+                    continue
+                total += self.add(pq.read_table(path).to_pylist(), part)
+        return total
+
+    def _maybe_merge(self, date: str) -> None:
+        segments = [row[0] for row in self._connect().execute(
+            "SELECT id FROM segments WHERE date = ? ORDER BY id", (date,))]
+        if len(segments) >= MERGE_THRESHOLD:
+            self.merge(date)
+
+    def merge(self, date: str) -> None:
+        """把某日期的所有段合并为一个（文档号按段递增，倒排表直接按段顺序拼接）"""
+        conn = self._connect()
+        rows = conn.execute("SELECT id, dict_version, docs FROM segments WHERE date = ? ORDER BY id",
+                            (date,)).fetchall()
+        if len(rows) < 2:
+            return
+        ids = [r[0] for r in rows]
+        target = ids[0]
+        marks = ",".join("?" * len(ids))
+        with conn:
+            merged: Dict[str, List[bytes]] = {}
+            for term, docs, counts, positions in conn.execute(
+                    f"SELECT term, docs, counts, positions FROM postings WHERE segment IN ({marks}) "
+                    f"ORDER BY term, segment", ids):
+                entry = merged.setdefault(term, [b"", b"", b""])
+                entry[0] += docs
+                entry[1] += counts
+                entry[2] += positions
+            conn.execute(f"DELETE FROM postings WHERE segment IN ({marks})", ids)
+            conn.executemany("INSERT INTO postings (term, segment, docs, counts, positions) VALUES (?, ?, ?, ?, ?)",
+                             [(term, target, *blobs) for term, blobs in merged.items()])
+            conn.execute(f"UPDATE docs SET segment = ? WHERE segment IN ({marks})", [target] + ids)
+            # 合并后只能使用所有原段都有的词
+            conn.execute("UPDATE segments SET dict_version = ?, docs = ? WHERE id = ?",
+                         (min(r[1] for r in rows), sum(r[2] for r in rows), target))
+            conn.execute(f"DELETE FROM segments WHERE id IN ({','.join('?' * (len(ids) - 1))})", ids[1:])
+
+    # ---------- 查询 ----------
+    def _postings(self, segment: int, term: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        row = self._connect().execute(
+            "SELECT docs, counts, positions FROM postings WHERE term = ? AND segment = ?", (term, segment)).fetchone()
+        if row is None:
+            return None
+        docs, counts, positions = (np.frombuffer(b, dtype=np.uint32) for b in row)
+        starts = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=starts[1:])
+        return docs, starts, positions
+
+    def _phrase(self, segment: int, version: int, phrase: str) -> np.ndarray:
+        tokens = self.tokenizer.query_tokens(phrase, version)
+        if not tokens:
+            return np.zeros(0, dtype=np.uint32)
+        lists = {}
+        for term, _ in tokens:
+            if term not in lists:
+                lists[term] = self._postings(segment, term)
+                if lists[term] is None:
+                    return np.zeros(0, dtype=np.uint32)
+        order = sorted(lists, key=lambda t: len(lists[t][0]))
+        candidates = lists[order[0]][0]
+        for term in order[1:]:
+            candidates = np.intersect1d(candidates, lists[term][0], assume_unique=True)
+            if not len(candidates):
+                return candidates
+        if len(tokens) == 1:
+            return candidates
+        # 位置校验（向量化）：每个词的 (文档号, 位置 - 相对偏移) 编成 64 位键，各词的键取交集
+        keys = None
+        for term, offset in tokens:
+            docs, starts, positions = lists[term]
+            counts = np.diff(starts)
+            doc_of = np.repeat(docs, counts)
+            keep = np.repeat(np.isin(docs, candidates, assume_unique=True), counts) & (positions >= offset)
+            term_keys = (doc_of[keep].astype(np.uint64) << np.uint64(32)) | (
+                positions[keep].astype(np.uint64) - np.uint64(offset))
+            keys = term_keys if keys is None else np.intersect1d(keys, term_keys, assume_unique=True)
+            if not len(keys):
+                return np.zeros(0, dtype=np.uint32)
+        return np.unique((keys >> np.uint64(32)).astype(np.uint32))
+
+    def _evaluate(self, node, segment: int, version: int, within: Optional[np.ndarray]) -> np.ndarray:
+        """within 为候选文档范围（坐席过滤 / AND 左侧结果），None 表示整段；只有 NOT 需要整段文档表"""
+        kind = node[0]
+        if kind == "phrase":
+            hits = self._phrase(segment, version, node[1])
+            return hits if within is None else np.intersect1d(hits, within, assume_unique=True)
+        if kind == "not":
+            base = within if within is not None else self._universe(segment, None)
+            return np.setdiff1d(base, self._evaluate(node[1], segment, version, base), assume_unique=True)
+        left = self._evaluate(node[1], segment, version, within)
+        if kind == "and":
+            if not len(left):
+                return left
+            return self._evaluate(node[2], segment, version, left)
+        return np.union1d(left, self._evaluate(node[2], segment, version, within))
+
+    def _universe(self, segment: int, agents: Optional[Sequence[str]]) -> np.ndarray:
+        sql, params = "SELECT id FROM docs WHERE segment = ?", [segment]
+        if agents:
+            sql += f" AND agent IN ({','.join('?' * len(agents))})"
+            params += list(agents)
+        return np.fromiter((row[0] for row in self._connect().execute(sql + " ORDER BY id", params)),
+                           dtype=np.uint32)
+
+    def search_ids(self, query: str, start: Any = None, end: Any = None,
+                   agents: Optional[Sequence[str]] = None) -> List[int]:
+        """命中的文档号（按导入顺序）"""
+        tree = parse_query(query)
+        sql, params = "SELECT id, dict_version FROM segments", []
+        clauses = []
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(str(start)[:10])
+        if end is not None:
+            clauses.append("date <= ?")
+            params.append(str(end)[:10])
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        hits: List[int] = []
+        for segment, version in self._connect().execute(sql + " ORDER BY id", params).fetchall():
+            within = self._universe(segment, agents) if agents else None
+            if within is not None and not len(within):
+                continue
+            hits.extend(int(d) for d in self._evaluate(tree, segment, version, within))
+        return hits
+
+    def search(self, query: str, start: Any = None, end: Any = None,
+               agents: Optional[Sequence[str]] = None, limit: Optional[int] = 1000):
+        """
+        全文检索，返回 (DataFrame（按时间倒序，最多 limit 条）, 命中总数, 用时毫秒)。
+        例：search('华泰证券 最低佣金', start="2024-07-01", end="2024-09-30", agents=["张三"])
+        """
+        import pandas as pd
+
+        began = time.perf_counter()
+        ids = self.search_ids(query, start, end, agents)
+        total = len(ids)
+        ids = ids[::-1][:limit] if limit is not None else ids[::-1]
+        columns = ["id", "date", "ts", "conversation_id", "agent", "violation", "triggered_event", "text"]
+        rows = []
+        conn = self._connect()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows += conn.execute(f"SELECT {', '.join(columns)} FROM docs WHERE id IN ({','.join('?' * len(chunk))})",
+                                 chunk).fetchall()
+        frame = pd.DataFrame(rows, columns=columns)
+        if not frame.empty:
+            frame["violation"] = frame["violation"].astype(bool)
+            frame = frame.sort_values("ts", ascending=False, ignore_index=True)
+        return frame, total, (time.perf_counter() - began) * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        return {
+            "docs": conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0],
+            "segments": conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0],
+            "terms": conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0],
+            "dictionary_words": len(self.tokenizer.words),
+        }
+
+
+def main():
+    from .result_store import ResultStore
+    from .rule_loader import load_all_rules
+
+    parser = argparse.ArgumentParser(description="已稽核对话全文检索")
+    parser.add_argument("cmd", choices=["ingest", "query"])
+    parser.add_argument("query", nargs="?", help='如：华泰证券 "最低佣金" -开户')
+    parser.add_argument("--root", default=None, help="索引目录（默认 FULLTEXT_DIR）")
+    parser.add_argument("--store", default=None, help="结果库目录（默认 RESULT_STORE_DIR）")
+    parser.add_argument("--rules", default=str(Path(__file__).parent / "compliance_rules.yaml"))
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--agent", action="append")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    index = FullTextIndex(args.root, rule_keywords(load_all_rules(args.rules)))
+    if args.cmd == "ingest":
+        n = index.ingest_store(ResultStore(args.store), args.start, args.end)
+        print(f"新导入 {n} 条，{index.stats()}")
+        return
+    if not args.query:
+        parser.error("query 命令需要查询串")
+    frame, total, elapsed_ms = index.search(args.query, args.start, args.end, args.agent, args.limit)
+    print(f"共 {total} 条，显示 {len(frame)} 条，用时 {elapsed_ms:.0f} ms")
+    for row in frame.itertuples():
+        print(f"{row.date} {row.agent or '-'} [{row.triggered_event}] {row.text[:80]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# src/line_index.py
+"""
+大文件聊天记录的按行索引与并行初筛。
+
+整份导出文件 read().decode().split("\\n") 会在内存里同时放原始字节、解码文本和切分结果多份拷贝，
+而且只能单线程切分。这里：
+- 文件以只读 mmap 打开，换行位置一次性扫描成 uint64 偏移数组，保存在文件旁边（<文件>.lines），
+  文件大小或修改时间变化时重建；索引本身也以 memmap 方式加载
+- 第 N 行随机访问：两次数组取值 + mmap 切片，供界面下钻
+- 按字节数把行切成若干分片，工作进程只收到 (文件路径, 行范围)，各自 mmap 同一文件，
+  在进程内解码并做本地规则初筛；文件内容经页缓存共享，不在进程间复制
+"""
+import argparse
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+INDEX_SUFFIX = ".lines"
+_MAGIC = b"LINEIDX1"
+_HEADER = struct.Struct("<8sQQQ")  # magic, 文件大小, 修改时间(ns), 行数
+SCAN_CHUNK = 64 * 1024 * 1024
+
+
+class LineIndex:
+    """见模块说明；index_path 默认为 path + ".lines"，目录不可写时索引只保存在内存中"""
+
+    def __init__(self, path: str, index_path: Optional[str] = None, rebuild: bool = False):
+        self.path = str(path)
+        self.index_path = index_path or self.path + INDEX_SUFFIX
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        self._mtime = stat.st_mtime_ns
+        self._file = open(self.path, "rb")
+        # 空文件不能 mmap
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.offsets = None if rebuild else self._load()
+        if self.offsets is None:
+            self.offsets = self._build()
+            self._save()
+
+    def _load(self) -> Optional[np.ndarray]:
+        try:
+            with open(self.index_path, "rb") as f:
+                magic, size, mtime, count = _HEADER.unpack(f.read(_HEADER.size))
+        except (OSError, struct.error):
+            return None
+        if magic != _MAGIC or size != self.size or mtime != self._mtime:
+            return None
+        return np.memmap(self.index_path, dtype="<u8", mode="r", offset=_HEADER.size, shape=(count + 1,))
+
+    def _build(self) -> np.ndarray:
+        """offsets[i] 为第 i 行起点，offsets[-1] 为文件末尾；分块扫描，峰值内存与块大小相关"""
+        parts = [np.zeros(1, dtype="<u8")]
+        for pos in range(0, self.size, SCAN_CHUNK):
+            chunk = np.frombuffer(self._mm, dtype=np.uint8, count=min(SCAN_CHUNK, self.size - pos), offset=pos)
+            parts.append((np.flatnonzero(chunk == 0x0A) + pos + 1).astype("<u8"))
+            del chunk
+        offsets = np.concatenate(parts)
+        if offsets[-1] != self.size:
+            # 最后一行没有换行符
+            offsets = np.append(offsets, np.array([self.size], dtype="<u8"))
+        return offsets
+
+    def _save(self) -> None:
+        tmp = self.index_path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, self.size, self._mtime, len(self)))
+                self.offsets.tofile(f)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            print(f"行索引无法保存，仅在内存中使用: {self.index_path} ({e})")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def byte_range(self, n: int) -> Tuple[int, int]:
+        """第 n 行（从 0 开始）的字节区间，不含行尾的 \\r\\n"""
+        if not 0 <= n < len(self):
+            raise IndexError(f"行号越界: {n}（共 {len(self)} 行）")
+        start, end = int(self.offsets[n]), int(self.offsets[n + 1])
+        while end > start and self._mm[end - 1] in (0x0A, 0x0D):
+            end -= 1
+        return start, end
+
+    def line_bytes(self, n: int) -> memoryview:
+        """零拷贝的行内容；持有返回值期间不能 close()"""
+        start, end = self.byte_range(n)
+        return memoryview(self._mm)[start:end]
+
+    def line(self, n: int) -> str:
+        start, end = self.byte_range(n)
+        text = self._mm[start:end].decode("utf-8", errors="replace")
+        return text.lstrip("﻿") if n == 0 else text
+
+    def iter_lines(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """(行号, 去掉首尾空白的文本)，包括空行"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for n in range(start, stop):
+            yield n, self.line(n).strip()
+
+    def shards(self, count: int) -> List[Tuple[int, int]]:
+        """按字节数大致均分的行范围 [(起始行, 结束行), ...]，不产生空分片"""
+        if not len(self):
+            return []
+        targets = np.linspace(0, self.size, count + 1)[1:-1]
+        cuts = np.searchsorted(self.offsets, targets.astype("<u8")).tolist()
+        bounds = sorted({0, len(self), *(min(max(c, 0), len(self)) for c in cuts)})
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self) -> "LineIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# ---------- 并行初筛 ----------
+_worker_screener = None
+
+
+def _init_worker(rules_file: str) -> None:
+    """每个工作进程加载一次规则，只用关键词/正则/白名单，不加载嵌入模型"""
+    global _worker_screener
+    from .local_screen import LocalScreener
+    from .rule_loader import load_all_rules
+
+    _worker_screener = LocalScreener(load_all_rules(rules_file), use_similarity=False)
+
+
+def _screen_shard(path: str, index_path: str, start: int, stop: int) -> Tuple[int, List[Dict[str, Any]]]:
+    from .result_store import parse_input_line
+
+    hits = []
+    scanned = 0
+    with LineIndex(path, index_path) as index:
+        for n, line in index.iter_lines(start, stop):
+            if not line:
+                continue
+            scanned += 1
+            item = parse_input_line(line)
+            verdict = _worker_screener.verdict(item["text"])
+            if verdict["violation"]:
+                hits.append({"line": n, "text": item["text"], "agent": item["agent"],
+                             "triggered_event": verdict["triggered_event"], "reason": verdict["reason"]})
+    return scanned, hits
+
+
+def screen_file(path: str, rules_file: str, workers: Optional[int] = None,
+                shards_per_worker: int = 4) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    多进程本地规则初筛，按分片完成顺序产出 (扫描行数, 命中列表)。
+    索引在主进程建好并落盘，工作进程直接加载。
+    """
+    workers = workers or os.cpu_count() or 1
+    with LineIndex(path) as index:
+        shards = index.shards(workers * shards_per_worker)
+        index_path = index.index_path
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(rules_file,)) as pool:
+        futures = [pool.submit(_screen_shard, path, index_path, start, stop) for start, stop in shards]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="聊天记录大文件：建行索引 / 查看指定行 / 并行本地初筛")
+    parser.add_argument("cmd", choices=["index", "line", "screen"])
+    parser.add_argument("path")
+    parser.add_argument("--n", type=int, default=1, help="line 命令的行号（从 1 开始）")
+    parser.add_argument("--rules", default=str(Path(__file__).parent / "compliance_rules.yaml"))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="screen 命令的命中输出（jsonl），默认打印前 20 条")
+    args = parser.parse_args()
+
+    began = time.perf_counter()
+    if args.cmd in ("index", "line"):
+        with LineIndex(args.path, rebuild=args.cmd == "index") as index:
+            if args.cmd == "index":
+                print(f"共 {len(index)} 行，{index.size} 字节，耗时 {time.perf_counter() - began:.2f}s -> {index.index_path}")
+            else:
+                print(index.line(args.n - 1))
+        return
+
+    scanned, hits = 0, []
+    for count, shard_hits in screen_file(args.path, args.rules, args.workers):
+        scanned += count
+        hits.extend(shard_hits)
+    hits.sort(key=lambda h: h["line"])
+    print(f"扫描 {scanned} 条，本地规则命中 {len(hits)} 条，耗时 {time.perf_counter() - began:.2f}s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for hit in hits:
+                f.write(json.dumps(hit, ensure_ascii=False) + "\n")
+    else:
+        for hit in hits[:20]:
+            print(f"第 {hit['line'] + 1} 行 [{hit['triggered_event']}] {hit['text'][:60]}")
+
+
+if __name__ == "__main__":
+    main()
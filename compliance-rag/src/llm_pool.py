@@ -0,0 +1,262 @@
+# src/llm_pool.py
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import yaml
+
+from .concurrency import extract_retry_after, extract_status
+from .conversation import estimate_tokens
+from .schemas import LLMBackendConfig
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+_ENV_PATTERN = re.compile(r"\$\{(\w+)\}")
+AUTH_STATUS = {401, 403}
+
+# 当前请求的 LLM 用量累计（见 track_usage），分片并发调用时各线程共享同一个 dict
+_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_usage", default=None)
+_usage_lock = threading.Lock()
+
+
+@contextmanager
+def track_usage() -> Iterator[Dict[str, Any]]:
+    """
+    累计 with 块内（含 contextvars 传递到的线程）所有 LLM 调用的次数、token 数和耗时。
+    后端没有返回 usage_metadata 时按字符数估算，estimated 置为 True
+    """
+    usage = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "llm_ms": 0.0, "estimated": False}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def _record_usage(prompt_value: Any, result: Any, elapsed: float) -> None:
+    usage = _usage.get()
+    if usage is None:
+        return
+    meta = getattr(result, "usage_metadata", None) or {}
+    estimated = not meta
+    if estimated:
+        prompt = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+        meta = {"input_tokens": estimate_tokens(prompt),
+                "output_tokens": estimate_tokens(str(getattr(result, "content", result)))}
+    with _usage_lock:
+        usage["llm_calls"] += 1
+        usage["input_tokens"] += int(meta.get("input_tokens", 0))
+        usage["output_tokens"] += int(meta.get("output_tokens", 0))
+        usage["llm_ms"] += elapsed * 1000
+        usage["estimated"] = usage["estimated"] or estimated
+
+
+class TokenBucket:
+    """令牌桶：rate 个/秒补充，最多攒 capacity 个"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = max(rate, 1e-6)
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """距离下一个令牌可用还需等待的秒数，0 表示立即可用"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+class LLMBackend:
+    def __init__(self, config: LLMBackendConfig, llm: Any):
+        self.config = config
+        self.llm = llm
+        self.bucket = TokenBucket(config.qps, config.burst)
+        self.inflight = 0
+        self.health = 1.0  # 成功率的 EWMA，0~1
+        self.consecutive_errors = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def load(self) -> float:
+        """负载：在途请求占并发上限的比例，按权重折算"""
+        return self.inflight / max(self.config.max_concurrency, 1) / max(self.config.weight, 1e-6)
+
+
+def _expand_env(value: str) -> str:
+    return _ENV_PATTERN.sub(lambda m: os.getenv(m.group(1), ""), value)
+
+
+def load_backend_configs(config_file: Optional[str] = None) -> List[LLMBackendConfig]:
+    """
+    读取后端配置，优先级：
+    1. 显式传入的 YAML 文件 / 环境变量 LLM_BACKENDS_FILE
+    2. 环境变量 DASHSCOPE_API_KEYS（逗号分隔多个 key，共用 base_url 和 model）
+    3. 环境变量 DASHSCOPE_API_KEY（单个 key）
+    YAML 中的 api_key 支持 ${ENV_NAME} 写法，避免把 key 写进仓库。
+    """
+    config_file = config_file or os.getenv("LLM_BACKENDS_FILE")
+    base_url = os.getenv("DASHSCOPE_API_BASE", DEFAULT_BASE_URL)
+
+    if config_file:
+        path = Path(config_file)
+        if not path.exists():
+            raise FileNotFoundError(f"LLM 后端配置未找到: {path.absolute()}")
+        with open(path, encoding="utf-8") as f:
+            data = yaml.safe_load(f) or []
+        if isinstance(data, dict):
+            data = data.get("backends", [])
+        configs = []
+        for i, item in enumerate(data):
+            item = {k: _expand_env(v) if isinstance(v, str) else v for k, v in item.items()}
+            item.setdefault("name", f"backend-{i + 1}")
+            if not item.get("api_key"):
+                print(f"跳过未配置 key 的后端: {item['name']}")
+                continue
+            configs.append(LLMBackendConfig(**item))
+        return configs
+
+    keys = [k.strip() for k in os.getenv("DASHSCOPE_API_KEYS", "").split(",") if k.strip()]
+    if not keys and os.getenv("DASHSCOPE_API_KEY"):
+        keys = [os.getenv("DASHSCOPE_API_KEY")]
+    return [LLMBackendConfig(name=f"key-{i + 1}", api_key=k, base_url=base_url) for i, k in enumerate(keys)]
+
+
+def _default_llm_factory(config: LLMBackendConfig, **llm_kwargs):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=config.model,
+        openai_api_key=config.api_key,
+        openai_api_base=config.base_url,
+        **llm_kwargs,
+    )
+
+
+class LLMPool:
+    """
+    多 key / 多 endpoint 的 LLM 后端池。
+    - 每个后端独立令牌桶限速
+    - 路由到负载最低的健康后端（负载相同时选健康分高的）
+    - 连续失败 eject_after 次后临时摘除（401/403 鉴权失败立即摘除），摘除时长按次数指数增长
+    """
+
+    def __init__(self, backends: List[LLMBackend], eject_after: int = 3,
+                 eject_seconds: float = 10.0, max_eject_seconds: float = 300.0):
+        if not backends:
+            raise ValueError("LLM 后端池为空，请配置 DASHSCOPE_API_KEY 或 LLM_BACKENDS_FILE")
+        self.backends = backends
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config_file: Optional[str] = None,
+                    llm_factory: Optional[Callable[..., Any]] = None, **llm_kwargs) -> "LLMPool":
+        factory = llm_factory or _default_llm_factory
+        configs = load_backend_configs(config_file)
+        backends = [LLMBackend(cfg, factory(cfg, **llm_kwargs)) for cfg in configs]
+        print(f"LLM 后端池: {', '.join(b.name for b in backends) or '空'}")
+        return cls(backends)
+
+    def _pick(self, now: float) -> Optional[LLMBackend]:
+        healthy = [b for b in self.backends
+                   if not b.is_ejected(now) and b.inflight < b.config.max_concurrency]
+        if not healthy:
+            # 全部被摘除时，放行最早恢复的那个作为探测
+            ejected = [b for b in self.backends if b.inflight < b.config.max_concurrency]
+            if not ejected:
+                return None
+            healthy = [min(ejected, key=lambda b: b.ejected_until)]
+        ready = [b for b in healthy if b.bucket.wait_time() == 0]
+        if not ready:
+            return None
+        return min(ready, key=lambda b: (b.load(), -b.health))
+
+    def acquire(self) -> LLMBackend:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                backend = self._pick(now)
+                if backend is not None:
+                    backend.bucket.take()
+                    backend.inflight += 1
+                    backend.calls += 1
+                    return backend
+                waits = [b.bucket.wait_time() for b in self.backends]
+                self._cond.wait(max(0.01, min(waits)))
+
+    def release(self, backend: LLMBackend, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            backend.inflight -= 1
+            if error is None:
+                backend.health = 0.9 * backend.health + 0.1
+                backend.consecutive_errors = 0
+                backend.ejections = 0
+            else:
+                backend.errors += 1
+                backend.health = 0.9 * backend.health
+                backend.consecutive_errors += 1
+                if extract_status(error) in AUTH_STATUS:
+                    # key 失效/被吊销：失败很快，负载最低会一直被选中，立即摘除
+                    backend.consecutive_errors = max(backend.consecutive_errors, self.eject_after)
+                now = time.monotonic()
+                retry_after = extract_retry_after(error)
+                if retry_after:
+                    backend.ejected_until = max(backend.ejected_until, now + retry_after)
+                if backend.consecutive_errors >= self.eject_after:
+                    backend.ejections += 1
+                    duration = min(self.max_eject_seconds,
+                                   self.eject_seconds * (2 ** (backend.ejections - 1)))
+                    backend.ejected_until = max(backend.ejected_until, now + duration)
+                    backend.consecutive_errors = 0
+                    print(f"LLM 后端 {backend.name} 连续失败，摘除 {duration:.0f} 秒")
+            self._cond.notify_all()
+
+    def invoke(self, prompt_value: Any) -> Any:
+        """可直接作为 Runnable 使用：prompt | RunnableLambda(pool.invoke)"""
+        backend = self.acquire()
+        started = time.monotonic()
+        try:
+            result = backend.llm.invoke(prompt_value)
+        except Exception as e:
+            self.release(backend, e)
+            raise
+        self.release(backend)
+        _record_usage(prompt_value, result, time.monotonic() - started)
+        return result
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._cond:
+            return [{
+                "name": b.name,
+                "model": b.config.model,
+                "inflight": b.inflight,
+                "health": round(b.health, 3),
+                "ejected_for": max(0.0, b.ejected_until - now),
+                "calls": b.calls,
+                "errors": b.errors,
+            } for b in self.backends]
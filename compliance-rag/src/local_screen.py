@@ -0,0 +1,196 @@
+# src/local_screen.py
+import math
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+from .normalizer import NormalizedText, TextNormalizer
+from .safe_regex import MultiPattern
+from .schemas import ComplianceRule
+
+# YAML 中的事件名与 Prompt 规则标题不完全一致，统一映射到 Prompt 标题（即 LLM 输出的事件名）
+EVENT_ALIASES = {
+    "承诺收益表述": "直接承诺收益",
+    "异常开户（FX）": "异常开户",
+}
+
+_REGEX_CHARS = re.compile(r"\\[dDwWsS]|[\[\]\(\)\*\+\?\{\}\|\^\$]")
+
+
+def canonical_event(name: str) -> str:
+    name = name.strip()
+    return EVENT_ALIASES.get(name, name)
+
+
+def split_events(triggered_event: str) -> List[str]:
+    """把 "A,B，C" 形式的触发事件字符串拆成列表，"无" 返回空列表"""
+    if not triggered_event or triggered_event.strip() in ("无", "[]"):
+        return []
+    text = triggered_event.strip().strip("[]")
+    events = [canonical_event(e.strip(" \"'")) for e in re.split(r"[,，、]", text)]
+    return list(dict.fromkeys(e for e in events if e and e != "无"))
+
+
+def join_events(events: List[str]) -> str:
+    return ",".join(events) if events else "无"
+
+
+class RuleHit(NamedTuple):
+    event: str
+    keyword: str
+    start: int
+    end: int
+    has_context: bool
+
+
+class RuleMatcher:
+    """
+    基于规则 YAML 中 trigger 配置的本地匹配器。
+    - keywords：字面量或正则（YAML 单引号里写的 '\\\\d' 会先还原成 '\\d'）；
+      正则由 safe_regex 编译成线性时间自动机，不可用的写法按字面量处理
+    - whitelist：命中任一白名单短语则整条规则豁免
+    - context_words：配置了上下文词的规则，只有同时出现上下文词才算强命中
+    关键词、白名单、上下文词与待测文本都先经过同一个 TextNormalizer，
+    命中区间映射回原文坐标。
+    """
+
+    def __init__(self, rules: List[ComplianceRule], normalizer: Optional[TextNormalizer] = None):
+        self.rules = rules
+        self.normalizer = normalizer or TextNormalizer.from_rules(rules)
+        norm = self.normalizer.normalize_term
+        sources: List[str] = []
+        entries = []
+        for rule in rules:
+            literals, patterns = [], []
+            for kw in rule.trigger.keywords + rule.trigger.regex_patterns:
+                kw = kw.replace("\\\\", "\\")
+                if _REGEX_CHARS.search(kw):
+                    # 正则源码不做规范化（避免 \D 被转成 \d），改为忽略大小写匹配
+                    patterns.append((kw, len(sources)))
+                    sources.append(kw)
+                else:
+                    literals.append((kw, norm(kw)))
+            entries.append((rule, literals, patterns))
+        # 全部规则的正则合并成一个线性时间自动机，每条文本只扫描一遍
+        self._regex = MultiPattern(sources)
+        self._compiled = []
+        for rule, literals, patterns in entries:
+            for kw, pid in patterns:
+                if pid in self._regex.rejected:
+                    print(f"规则 {rule.event_name} 的正则不可用，按字面量处理: {self._regex.rejected[pid]}")
+                    literals.append((kw, norm(kw)))
+            self._compiled.append((
+                canonical_event(rule.event_name),
+                literals,
+                [(kw, pid) for kw, pid in patterns if pid not in self._regex.rejected],
+                [norm(w) for w in rule.whitelist],
+                [norm(c) for c in rule.trigger.context_words],
+            ))
+
+    def match(self, text: Union[str, NormalizedText]) -> Dict[str, List[RuleHit]]:
+        """返回 {事件名: 命中列表}，已排除白名单豁免的规则"""
+        normalized = self.normalizer.normalize(text)
+        text = normalized.text
+        spans = self._regex.scan(text)
+        hits: Dict[str, List[RuleHit]] = {}
+        for event, literals, patterns, whitelist, context_words in self._compiled:
+            if any(w in text for w in whitelist):
+                continue
+            has_context = not context_words or any(c in text for c in context_words)
+            found = []
+            for kw, needle in literals:
+                start = text.find(needle)
+                if start >= 0:
+                    found.append(RuleHit(event, kw, *normalized.to_original(start, start + len(needle)), has_context))
+            for kw, pid in patterns:
+                if pid in spans:
+                    found.append(RuleHit(event, kw, *normalized.to_original(*spans[pid]), has_context))
+            if found:
+                hits[event] = found
+        return hits
+
+    def strong_events(self, text: Union[str, NormalizedText]) -> List[str]:
+        return [e for e, hs in self.match(text).items() if any(h.has_context for h in hs)]
+
+
+class FewShotSimilarityClassifier:
+    """
+    用规则 few_shot 示例做最近邻分类：与文本最相似的示例若为违规且相似度
+    超过阈值，则判定触发该示例所属规则。嵌入模型首次使用时才加载，
+    加载失败时分类器自动停用。
+    """
+
+    def __init__(self, rules: List[ComplianceRule], embeddings: Any = None,
+                 threshold: float = 0.82):
+        self.threshold = threshold
+        self._embeddings = embeddings
+        self._examples = [(canonical_event(r.event_name), ex.input, ex.violation)
+                          for r in rules for ex in r.few_shot]
+        self._vectors: Optional[List[List[float]]] = None
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def _ensure_index(self) -> bool:
+        if self._vectors is not None or self._disabled:
+            return not self._disabled
+        with self._lock:
+            if self._vectors is None and not self._disabled:
+                try:
+                    if self._embeddings is None:
+                        from .embeddings import load_embeddings
+                        self._embeddings = load_embeddings()
+                    self._vectors = [_normalize(v) for v in
+                                     self._embeddings.embed_documents([e[1] for e in self._examples])]
+                except Exception as e:
+                    print(f"相似度分类器不可用，仅使用关键词规则: {e}")
+                    self._disabled = True
+        return not self._disabled
+
+    def classify(self, text: str) -> Dict[str, float]:
+        """返回 {事件名: 相似度}，只包含超过阈值的违规示例"""
+        if not self._examples or not self._ensure_index():
+            return {}
+        query = _normalize(self._embeddings.embed_query(text))
+        best: Dict[str, float] = {}
+        for (event, _, violation), vec in zip(self._examples, self._vectors):
+            if not violation:
+                continue
+            score = sum(a * b for a, b in zip(query, vec))
+            if score >= self.threshold and score > best.get(event, 0.0):
+                best[event] = score
+        return best
+
+
+def _normalize(vec: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+class LocalScreener:
+    """不依赖 LLM 的本地判定：规则关键词 + few-shot 相似度"""
+
+    def __init__(self, rules: List[ComplianceRule], embeddings: Any = None,
+                 use_similarity: bool = True, normalizer: Optional[TextNormalizer] = None):
+        self.matcher = RuleMatcher(rules, normalizer)
+        self.similarity = FewShotSimilarityClassifier(rules, embeddings) if use_similarity else None
+
+    def verdict(self, text: Union[str, NormalizedText]) -> Dict[str, Any]:
+        hits = self.matcher.match(text)
+        if isinstance(text, NormalizedText):
+            text = text.original
+        events = [e for e, hs in hits.items() if any(h.has_context for h in hs)]
+        reasons = [f"{e}（命中：{'、'.join(h.keyword for h in hits[e])}）" for e in events]
+
+        similar = self.similarity.classify(text) if self.similarity else {}
+        for event, score in similar.items():
+            if event not in events:
+                events.append(event)
+                reasons.append(f"{event}（与违规示例相似度 {score:.2f}）")
+
+        return {
+            "raw_response": "",
+            "violation": bool(events),
+            "triggered_event": join_events(events),
+            "reason": "本地规则判定：" + ("；".join(reasons) if reasons else "未命中本地规则"),
+            "source": "local",
+        }
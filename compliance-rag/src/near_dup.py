@@ -0,0 +1,163 @@
+# src/near_dup.py
+"""
+模板化话术的近似重复判定复用。
+
+同一套销售话术只换了股票代码、日期、价格时，精确缓存无法命中。这里先把数字、
+代码、日期等实体掩码，再对掩码后的文本计算 64 位 SimHash，按 4 个 16 位分段建
+LSH 桶；海明距离不超过 max_distance（<=3 时由抽屉原理保证至少一段完全相同）即视为近似重复。
+
+复用判定前还要比较“规则相关签名”：关键词命中、数值规则结论以及数值规则无法
+确定时涉及的具体数字。签名不同说明差异落在规则相关片段上，不复用。
+
+内存有界：指纹、标签、签名存放在定长 array 环形缓冲区中，每个桶最多保留
+bucket_cap 个最近的槽位，总内存约为 capacity * 14 字节 + 4 * 65536 * bucket_cap * 4 字节。
+"""
+import hashlib
+import re
+import threading
+import zlib
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from .numeric_rules import NumericVerdict
+
+_MASKS = [
+    (re.compile(r"\d{4}[-/年]\d{1,2}[-/月]\d{1,2}日?|\d{1,2}月\d{1,2}[日号]"), "<日期>"),
+    # 股票代码连同紧邻的股票简称一起掩码：600519贵州茅台 / 贵州茅台(600519)
+    (re.compile(r"[\u4e00-\u9fa5]{2,4}\(\d{6}(?:\.(?:sh|sz|bj))?\)"), "<代码>"),
+    (re.compile(r"\d{6}(?:\.(?:sh|sz|bj))?[\u4e00-\u9fa5]{0,4}"), "<代码>"),
+    (re.compile(r"\d+(?:\.\d+)?[%％]?|[零一二两三四五六七八九十百千万亿]{2,}"), "<数>"),
+]
+_BANDS = 4
+_BAND_BITS = 16
+_MASK64 = (1 << 64) - 1
+
+
+def mask_entities(text: str) -> str:
+    for pattern, placeholder in _MASKS:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+def simhash(text: str, ngram: int = 3) -> int:
+    if len(text) < ngram:
+        shingles = [text] if text else []
+    else:
+        shingles = [text[i:i + ngram] for i in range(len(text) - ngram + 1)]
+    weights = [0] * 64
+    for sh in shingles:
+        h = int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "little")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    fp = 0
+    for bit, w in enumerate(weights):
+        if w > 0:
+            fp |= 1 << bit
+    return fp & _MASK64
+
+
+def rule_signature(hits: Dict[str, List[Any]], numeric: Dict[str, NumericVerdict]) -> int:
+    """规则相关签名：关键词命中 + 数值规则结论 + 不确定时涉及的数字原文"""
+    parts = []
+    for event in sorted(hits):
+        parts.append(event + ":" + "|".join(sorted({h.keyword for h in hits[event]})))
+    for event in sorted(numeric):
+        v = numeric[event]
+        parts.append(f"{event}={v.triggered}")
+        if v.triggered is None:
+            parts.append("|".join(s[2] for s in v.spans))
+    return zlib.crc32("\n".join(parts).encode("utf-8"))
+
+
+class NearDuplicateIndex:
+    """掩码后 SimHash 的 LSH 索引，见模块说明"""
+
+    def __init__(self, capacity: int = 1_000_000, max_distance: int = 3, bucket_cap: int = 64):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.bucket_cap = bucket_cap
+        self._fingerprints = array("Q", bytes(8 * capacity))
+        self._labels = array("H", bytes(2 * capacity))
+        self._signatures = array("I", bytes(4 * capacity))
+        self._size = 0
+        self._next = 0
+        self._buckets: List[Dict[int, array]] = [dict() for _ in range(_BANDS)]
+        # 标签表：(是否违规, 触发事件) 去重后只存编号
+        self._label_table: List[Tuple[bool, str]] = []
+        self._label_ids: Dict[Tuple[bool, str], int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    @staticmethod
+    def _bands(fp: int):
+        for i in range(_BANDS):
+            yield i, (fp >> (i * _BAND_BITS)) & 0xFFFF
+
+    def add(self, masked_text: str, signature: int, result: Dict[str, Any]) -> None:
+        fp = simhash(masked_text)
+        label = (bool(result["violation"]), result["triggered_event"])
+        with self._lock:
+            label_id = self._label_ids.get(label)
+            if label_id is None:
+                if len(self._label_table) >= 0xFFFF:
+                    return
+                label_id = self._label_ids[label] = len(self._label_table)
+                self._label_table.append(label)
+            slot = self._next
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            self._fingerprints[slot] = fp
+            self._labels[slot] = label_id
+            self._signatures[slot] = signature
+            for band, key in self._bands(fp):
+                bucket = self._buckets[band].get(key)
+                if bucket is None:
+                    bucket = self._buckets[band][key] = array("I")
+                bucket.append(slot)
+                if len(bucket) > self.bucket_cap:
+                    del bucket[: len(bucket) - self.bucket_cap]
+
+    def lookup(self, masked_text: str, signature: int) -> Optional[Tuple[bool, str, int]]:
+        """返回 (是否违规, 触发事件, 海明距离)，未找到可复用的近似判定返回 None"""
+        fp = simhash(masked_text)
+        best = None
+        with self._lock:
+            seen = set()
+            for band, key in self._bands(fp):
+                bucket = self._buckets[band].get(key)
+                if not bucket:
+                    continue
+                for slot in reversed(bucket):
+                    if slot in seen:
+                        continue
+                    seen.add(slot)
+                    stored = self._fingerprints[slot]
+                    # 槽位可能已被环形缓冲区覆盖，重新校验分段
+                    if (stored >> (band * _BAND_BITS)) & 0xFFFF != key:
+                        continue
+                    distance = bin(stored ^ fp).count("1")
+                    if distance > self.max_distance or self._signatures[slot] != signature:
+                        continue
+                    if best is None or distance < best[1]:
+                        best = (slot, distance)
+                        if distance == 0:
+                            break
+            if best is None:
+                return None
+            self.hits += 1
+            violation, events = self._label_table[self._labels[best[0]]]
+            return violation, events, best[1]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def nbytes(self) -> int:
+        """定长数组 + 各桶槽位数组占用的字节数"""
+        arrays = (self._fingerprints, self._labels, self._signatures)
+        total = sum(a.itemsize * len(a) for a in arrays)
+        with self._lock:
+            total += sum(4 * len(bucket) + 64 for band in self._buckets for bucket in band.values())
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        return {"near_dup_size": self._size, "near_dup_hits": self.hits}
@@ -0,0 +1,145 @@
+# src/normalizer.py
+"""
+文本规范化：把规避写法（V信、薇信、全角数字、插入空格、emoji 等）映射到统一写法，
+同时保留到原文的偏移映射。所有本地匹配器与缓存 key 都基于同一次规范化结果。
+
+两个阶段，均为线性时间：
+1. 预编译的 str.translate 表：全角转半角、ASCII 转小写、删除空白/零宽字符/emoji
+2. 变体词典：规则 YAML 中 trigger.variants 的 {规范写法: [变体...]}，编译成一个
+   最长优先的正则统一替换
+"""
+import re
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .schemas import ComplianceRule
+
+_DELETE_RANGES = [
+    (0x200B, 0x200F),    # 零宽字符
+    (0x2060, 0x2064),
+    (0xFE00, 0xFE0F),    # 变体选择符
+    (0x2600, 0x27BF),    # 杂项符号 / dingbats
+    (0x1F000, 0x1FAFF),  # emoji
+]
+_DELETE_CHARS = " \t\r\u00a0\u3000\ufeff"
+
+
+def _build_table() -> Dict[int, Optional[int]]:
+    table: Dict[int, Optional[int]] = {}
+    # 全角 ASCII -> 半角
+    for cp in range(0xFF01, 0xFF5F):
+        table[cp] = cp - 0xFEE0
+    # 大写 -> 小写（含全角大写）
+    for cp in range(ord("A"), ord("Z") + 1):
+        table[cp] = cp + 32
+        table[cp + 0xFEE0] = cp + 32
+    for lo, hi in _DELETE_RANGES:
+        for cp in range(lo, hi + 1):
+            table[cp] = None
+    for ch in _DELETE_CHARS:
+        table[ord(ch)] = None
+    return table
+
+
+_TRANSLATE_TABLE = _build_table()
+_DELETED = frozenset(cp for cp, v in _TRANSLATE_TABLE.items() if v is None)
+
+
+class NormalizedText:
+    """规范化后的文本 + 每个字符在原文中的 [start, end) 区间"""
+
+    __slots__ = ("text", "original", "_starts", "_ends")
+
+    def __init__(self, text: str, original: str,
+                 starts: Optional[array] = None, ends: Optional[array] = None):
+        self.text = text
+        self.original = original
+        self._starts = starts  # None 表示与原文逐字对应
+        self._ends = ends
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def to_original(self, start: int, end: int) -> Tuple[int, int]:
+        """规范化文本中的区间 -> 原文区间"""
+        if self._starts is None or end <= start:
+            return start, end
+        return self._starts[start], self._ends[end - 1]
+
+    def original_slice(self, start: int, end: int) -> str:
+        s, e = self.to_original(start, end)
+        return self.original[s:e]
+
+
+class TextNormalizer:
+    """全局共享的规范化器，编译一次后线程安全可复用"""
+
+    def __init__(self, variants: Optional[Dict[str, Iterable[str]]] = None):
+        self._variant_map: Dict[str, str] = {}
+        for canonical, forms in (variants or {}).items():
+            canonical = canonical.translate(_TRANSLATE_TABLE)
+            # 规范写法本身也加入，避免被更短的变体从中间截断
+            self._variant_map.setdefault(canonical, canonical)
+            for form in forms:
+                form = form.translate(_TRANSLATE_TABLE)
+                if form and form != canonical:
+                    self._variant_map[form] = canonical
+        keys = sorted(self._variant_map, key=len, reverse=True)
+        self._variant_re = re.compile("|".join(map(re.escape, keys))) if keys else None
+
+    @classmethod
+    def from_rules(cls, rules: List[ComplianceRule]) -> "TextNormalizer":
+        variants: Dict[str, List[str]] = {}
+        for rule in rules:
+            for canonical, forms in rule.trigger.variants.items():
+                variants.setdefault(canonical, []).extend(forms)
+        return cls(variants)
+
+    def normalize(self, text: Union[str, NormalizedText]) -> NormalizedText:
+        if isinstance(text, NormalizedText):
+            return text
+        translated = text.translate(_TRANSLATE_TABLE)
+        starts = ends = None
+        if len(translated) != len(text):
+            starts = array("I")
+            for i, ch in enumerate(text):
+                if ord(ch) not in _DELETED:
+                    starts.append(i)
+            ends = array("I", (s + 1 for s in starts))
+
+        if self._variant_re is None:
+            return NormalizedText(translated, text, starts, ends)
+
+        pieces, new_starts, new_ends = [], array("I"), array("I")
+        pos, changed = 0, False
+        for m in self._variant_re.finditer(translated):
+            canonical = self._variant_map[m.group(0)]
+            if canonical == m.group(0):
+                continue
+            changed = True
+            pieces.append(translated[pos:m.start()])
+            for i in range(pos, m.start()):
+                new_starts.append(starts[i] if starts is not None else i)
+                new_ends.append(ends[i] if ends is not None else i + 1)
+            src_start = starts[m.start()] if starts is not None else m.start()
+            src_end = ends[m.end() - 1] if ends is not None else m.end()
+            pieces.append(canonical)
+            for _ in canonical:
+                new_starts.append(src_start)
+                new_ends.append(src_end)
+            pos = m.end()
+        if not changed:
+            return NormalizedText(translated, text, starts, ends)
+        pieces.append(translated[pos:])
+        for i in range(pos, len(translated)):
+            new_starts.append(starts[i] if starts is not None else i)
+            new_ends.append(ends[i] if ends is not None else i + 1)
+        return NormalizedText("".join(pieces), text, new_starts, new_ends)
+
+    def normalize_term(self, term: str) -> str:
+        """规范化关键词 / 白名单等短语（不需要偏移映射）"""
+        return sys.intern(self.normalize(term).text)
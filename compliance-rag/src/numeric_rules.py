@@ -0,0 +1,260 @@
+# src/numeric_rules.py
+"""
+数值类规则的本地确定性判定：
+- 低投入高额回报表述：同一句中同时出现具体本金金额和具体收益金额/比例
+- 短期内可获高额回报表述：同一句中同时出现具体时间范围和具体收益金额/比例
+- 对标个股未来走势：对未来给出具体涨停数量或具体涨幅数字
+每条规则输出 True（确定违规）/ False（确定不违规）/ None（交给 LLM），
+只有整段文本既没有数字实体、也没有收益/涨停类表述时才输出 False，其余解析不全的情况一律交给 LLM；
+所有正则均为无嵌套量词的线性匹配，可以放在 LLM 之前跑全量。
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .normalizer import NormalizedText
+
+LOW_INPUT_HIGH_RETURN = "低投入高额回报表述"
+SHORT_TERM_HIGH_RETURN = "短期内可获高额回报表述"
+BENCHMARK_FUTURE_TREND = "对标个股未来走势"
+NUMERIC_EVENTS = (LOW_INPUT_HIGH_RETURN, SHORT_TERM_HIGH_RETURN, BENCHMARK_FUTURE_TREND)
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+              "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000}
+_CN_BIG_UNITS = {"万": 10_000, "亿": 100_000_000}
+_SUFFIX_UNITS = {"万": 10_000, "w": 10_000, "W": 10_000, "千": 1000, "k": 1000,
+                 "K": 1000, "百": 100, "亿": 100_000_000}
+
+# “千万不要/千万别”中的千万是副词，不是数字
+_NUM = r"(?:\d+(?:\.\d+)?|(?!千万\s*(?:不要|不能|不可|别|要|记|注意|莫|勿))[零〇一二两三四五六七八九十百千万亿半几]+)"
+# 时间范围：“3月”“15日”“2024年”是日期，只有后接“内/后”时才算时间范围；“3个月”“两年”“5天”照常
+_SPAN_END = r"(?=之?[内后]|以内)"
+_TIMESPAN = (rf"(?<![\d.]){_NUM}\s*(?:个?交易日|天|周|个?星期|个?礼拜|个月)"
+             rf"|(?<![\d.]){_NUM}\s*[月日]{_SPAN_END}"
+             rf"|(?<![\d.])(?!\d{{3,}}\s*年(?!之?[内后]|以内)){_NUM}\s*年"
+             r"|当天|当日|次日|隔日|本周|下周|本月|下个?月")
+
+_ENTITY = re.compile(
+    rf"(?P<limitup>(?:{_NUM}\s*[-~到至]\s*)?{_NUM}\s*个?(?:涨停|连板)|{_NUM}天{_NUM}板|连续{_NUM}个?涨停)"
+    rf"|(?P<percent>{_NUM}\s*[%％]|百分之{_NUM}|翻{_NUM}?倍|翻番|{_NUM}倍)"
+    rf"|(?P<timespan>{_TIMESPAN})"
+    rf"|(?P<amount>{_NUM}\s*[万千百亿wWkK]?\s*(?:元|块钱?|rmb|RMB)|{_NUM}\s*[万千亿wW])"
+)
+
+_SENTENCE_SPLIT = re.compile(r"[。！？!?；;\n]")
+_RETURN_VERB = re.compile(r"赚|获利|盈利|收益|回报|挣|翻倍|翻番|变成")
+_PRINCIPAL_CUE = re.compile(r"本金|投入|投资|拿出?|用了?|入金|资金|仓位")
+_PRICE_MOVE = re.compile(r"上涨|涨幅|大涨|涨了|拉升|涨")
+_HISTORY_CUE = re.compile(r"过去|之前|以前|曾经|历史|已经|上个?月|去年|前段时间|复盘|报喜|反馈")
+# 单字的“会/将”只在作助动词修饰走势时算未来语气：不匹配“机会”“大家会觉得”“将近”
+_FUTURE_CUE = re.compile(r"(?<![机社开学体领约聚误理])会(?=[涨有再继连拉冲走翻迎出达到上大暴])|将(?=[会要有涨迎出达到再继连拉冲走])"
+                         r"|即将|有望|至少|还有|还能|预计|下周|明天|接下来|后面|后续|不要等|再后悔|目标")
+_CLAUSE_SPLIT = re.compile(r"[，,、：:]")
+# 否定/劝诫语境（“千万不要拿本金去赚…”“别信…”）：证据不足，交给 LLM
+_NEGATION_CUE = re.compile(r"不要|别|不能|不会|不可能|没有|并非|不是|切勿|谨防|警惕|骗")
+_TREND_CUE = re.compile(r"接力|复制|对标|下一个|同样的走势|也能|涨停|连板")
+# 收益/涨停类线索：出现任意一个时，即使没解析出完整的数字组合也不能断定不违规
+_NUMERIC_CUE = re.compile(r"赚|获利|盈利|收益|回报|挣|翻倍|翻番|变成|到了|做到|拿到|个点|板|涨停|涨幅|本金|\d")
+
+
+def parse_cn_number(text: str) -> Optional[float]:
+    """解析阿拉伯数字或中文数字（十万、三千五百、两、半），无法解析返回 None"""
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if text == "半":
+        return 0.5
+    if text == "几":
+        return None
+    total, section, digit = 0, 0, None
+    for ch in text:
+        if ch in _CN_DIGITS:
+            digit = _CN_DIGITS[ch]
+        elif ch in _CN_UNITS:
+            section += (1 if digit is None else digit) * _CN_UNITS[ch]
+            digit = None
+        elif ch in _CN_BIG_UNITS:
+            section += digit or 0
+            total += (section or 1) * _CN_BIG_UNITS[ch]
+            section, digit = 0, None
+        elif ch == "半":
+            section += 0.5 * (_CN_UNITS.get(text[-2:-1], 1) if len(text) > 1 else 1)
+        else:
+            return None
+    return float(total + section + (digit or 0))
+
+
+def parse_amount(text: str) -> Optional[float]:
+    """解析金额（元），如 '10万'、'8.5w'、'三千块'、'十万元'"""
+    m = re.match(rf"({_NUM})\s*([万千百亿wWkK]?)", text)
+    if not m:
+        return None
+    value = parse_cn_number(m.group(1))
+    if value is None:
+        return None
+    return value * _SUFFIX_UNITS.get(m.group(2), 1)
+
+
+class NumericEntity(NamedTuple):
+    kind: str  # limitup / percent / timespan / amount
+    text: str
+    start: int
+    end: int
+
+
+class NumericVerdict(NamedTuple):
+    event: str
+    triggered: Optional[bool]
+    spans: List[Tuple[int, int, str]]
+    reason: str
+
+
+def extract_entities(text: str) -> List[NumericEntity]:
+    return [NumericEntity(m.lastgroup, m.group(0), m.start(), m.end())
+            for m in _ENTITY.finditer(text)]
+
+
+def _sentences(text: str) -> List[Tuple[int, str]]:
+    result, start = [], 0
+    for m in _SENTENCE_SPLIT.finditer(text):
+        result.append((start, text[start:m.start()]))
+        start = m.end()
+    result.append((start, text[start:]))
+    return [(s, t) for s, t in result if t.strip()]
+
+
+def _span(e: NumericEntity, offset: int) -> Tuple[int, int, str]:
+    return (offset + e.start, offset + e.end, e.text)
+
+
+def _clause(sent: str, e: NumericEntity) -> str:
+    """实体所在的分句（按逗号、顿号、冒号切分）"""
+    start = max((m.end() for m in _CLAUSE_SPLIT.finditer(sent, 0, e.start)), default=0)
+    end = _CLAUSE_SPLIT.search(sent, e.end)
+    return sent[start:end.start() if end else len(sent)]
+
+
+def _undecided(event: str, sentences) -> Optional[NumericVerdict]:
+    """文本里有数字实体或收益/涨停线索却没组成确定违规时返回 None 结论，交给 LLM"""
+    for offset, sent, entities in sentences:
+        if entities or _NUMERIC_CUE.search(sent):
+            spans = [_span(e, offset) for e in entities]
+            return NumericVerdict(event, None, spans, "出现数字或收益/涨停表述，但未能完整解析，需结合语义判断")
+    return None
+
+
+class NumericRuleEvaluator:
+    """三条数值类规则的确定性判定器，见模块说明"""
+
+    def evaluate(self, text: Union[str, NormalizedText]) -> Dict[str, NumericVerdict]:
+        """传入规范化文本时在规范化文本上匹配，返回的 spans 为原文坐标"""
+        normalized = text if isinstance(text, NormalizedText) else None
+        if normalized is not None:
+            text = normalized.text
+        sentences = [(offset, sent, extract_entities(sent)) for offset, sent in _sentences(text)]
+        verdicts = {
+            LOW_INPUT_HIGH_RETURN: self._low_input_high_return(sentences),
+            SHORT_TERM_HIGH_RETURN: self._short_term_high_return(sentences),
+            BENCHMARK_FUTURE_TREND: self._benchmark_future_trend(text, sentences),
+        }
+        if normalized is not None:
+            for event, v in verdicts.items():
+                spans = [(*normalized.to_original(s, e), normalized.original_slice(s, e)) for s, e, _ in v.spans]
+                verdicts[event] = v._replace(spans=spans)
+        return verdicts
+
+    @staticmethod
+    def _returns_after(sent: str, entities: List[NumericEntity], pos: int) -> List[NumericEntity]:
+        """pos 之后、且前面紧挨收益动词的金额/比例"""
+        found = []
+        for e in entities:
+            if e.start < pos or e.kind not in ("amount", "percent"):
+                continue
+            window = sent[max(pos, e.start - 6):e.start]
+            if _RETURN_VERB.search(window) or e.text.startswith("翻"):
+                found.append(e)
+        return found
+
+    def _low_input_high_return(self, sentences) -> NumericVerdict:
+        event = LOW_INPUT_HIGH_RETURN
+        for offset, sent, entities in sentences:
+            for e in entities:
+                if e.kind != "amount":
+                    continue
+                around = sent[max(0, e.start - 4):e.end + 3]
+                if not _PRINCIPAL_CUE.search(around):
+                    continue
+                returns = self._returns_after(sent, entities, e.end)
+                if not returns:
+                    continue
+                spans = [_span(e, offset)] + [_span(r, offset) for r in returns]
+                if _HISTORY_CUE.search(sent):
+                    return NumericVerdict(event, None, spans, "本金与收益同时出现，但语境疑似历史案例")
+                if _NEGATION_CUE.search(sent):
+                    return NumericVerdict(event, None, spans, "本金与收益同时出现，但处于否定/劝诫语境")
+                return NumericVerdict(event, True, spans,
+                                      f"同时出现具体本金“{e.text}”与具体收益“{returns[0].text}”")
+        return _undecided(event, sentences) or NumericVerdict(event, False, [], "未出现任何金额、收益或涨停表述")
+
+    def _short_term_high_return(self, sentences) -> NumericVerdict:
+        event = SHORT_TERM_HIGH_RETURN
+        ambiguous = None
+        for offset, sent, entities in sentences:
+            for e in entities:
+                if e.kind != "timespan":
+                    continue
+                returns = self._returns_after(sent, entities, e.end)
+                if returns:
+                    spans = [_span(e, offset)] + [_span(r, offset) for r in returns]
+                    if _HISTORY_CUE.search(sent):
+                        ambiguous = ambiguous or NumericVerdict(
+                            event, None, spans, "时间范围与收益同时出现，但语境疑似历史案例")
+                        continue
+                    if _NEGATION_CUE.search(sent):
+                        ambiguous = ambiguous or NumericVerdict(
+                            event, None, spans, "时间范围与收益同时出现，但处于否定/劝诫语境")
+                        continue
+                    return NumericVerdict(event, True, spans,
+                                          f"明确时间“{e.text}”内获得收益“{returns[0].text}”")
+                moves = [x for x in entities if x.start >= e.end and x.kind == "percent"]
+                if moves and _PRICE_MOVE.search(sent[e.end:moves[0].start]):
+                    ambiguous = ambiguous or NumericVerdict(
+                        event, None, [_span(e, offset), _span(moves[0], offset)],
+                        "时间范围与涨幅同时出现，需判断是否为收益承诺")
+        return ambiguous or _undecided(event, sentences) or NumericVerdict(
+            event, False, [], "未出现任何时间、收益或涨停表述")
+
+    def _benchmark_future_trend(self, text: str, sentences) -> NumericVerdict:
+        event = BENCHMARK_FUTURE_TREND
+        ambiguous = None
+        for offset, sent, entities in sentences:
+            future = _FUTURE_CUE.search(sent)
+            # 确定违规要求未来语气与数字在同一分句内，且没有历史/否定语境
+            weak = _HISTORY_CUE.search(sent) or _NEGATION_CUE.search(sent)
+            for e in entities:
+                span = [_span(e, offset)]
+                clause = _clause(sent, e)
+                if e.kind == "limitup":
+                    is_range = bool(re.search(r"[-~到至]|几", e.text))
+                    if (is_range or _FUTURE_CUE.search(clause)) and not weak:
+                        return NumericVerdict(event, True, span, f"对未来给出具体涨停数量“{e.text}”")
+                    if future or is_range:
+                        ambiguous = ambiguous or NumericVerdict(
+                            event, None, span, "涨停数量与未来语气不在同一分句，或处于历史/否定语境")
+                elif e.kind == "percent" and future:
+                    before = sent[max(0, e.start - 6):e.start]
+                    if not _PRICE_MOVE.search(before):
+                        continue
+                    if _FUTURE_CUE.search(clause) and not weak:
+                        return NumericVerdict(event, True, span, f"对未来给出具体涨幅“{e.text}”")
+                    ambiguous = ambiguous or NumericVerdict(
+                        event, None, span, "涨幅与未来语气不在同一分句，或处于历史/否定语境")
+        if ambiguous:
+            return ambiguous
+        if _TREND_CUE.search(text):
+            return NumericVerdict(event, None, [], "出现对标/涨停类表述，需结合语义判断")
+        return _undecided(event, sentences) or NumericVerdict(event, False, [], "未出现任何涨停、涨幅或收益表述")
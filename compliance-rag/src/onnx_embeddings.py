@@ -0,0 +1,169 @@
+# src/onnx_embeddings.py
+"""
+多语言 MiniLM 编码器的 ONNX int8 导出与 CPU 推理。
+
+    # 导出（需要 torch + transformers + onnx，只在构建机上跑一次）
+    python -m src.onnx_embeddings export --out models/minilm-onnx
+    # 与原始 PyTorch 向量对比精度漂移（规则文档 + few-shot 示例）
+    python -m src.onnx_embeddings check --dir models/minilm-onnx
+
+运行时只依赖 onnxruntime + tokenizers，通过 embeddings.load_embeddings()
+在设置 EMBEDDING_ONNX_DIR 后自动替换 HuggingFaceEmbeddings。
+"""
+import argparse
+import math
+from pathlib import Path
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from .embeddings import DEFAULT_EMBEDDING_MODEL
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def export_onnx(out_dir: str, model_name: str = DEFAULT_EMBEDDING_MODEL,
+                quantize: bool = True, opset: int = 14) -> Path:
+    """导出 transformer 编码器为 ONNX，并做 int8 动态量化"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(out)
+
+    sample = tokenizer(["合规检测示例文本"], return_tensors="pt")
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        str(out / FP32_FILE),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "seq"},
+            "attention_mask": {0: "batch", 1: "seq"},
+            "last_hidden_state": {0: "batch", 1: "seq"},
+        },
+        opset_version=opset,
+    )
+    print(f"已导出 ONNX: {out / FP32_FILE}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(out / FP32_FILE), str(out / INT8_FILE), weight_type=QuantType.QInt8)
+        print(f"已导出 int8 量化模型: {out / INT8_FILE}")
+    return out
+
+
+class OnnxEmbeddings(Embeddings):
+    """onnxruntime 推理的句向量（mean pooling + L2 归一化），接口同 HuggingFaceEmbeddings"""
+
+    def __init__(self, model_dir: str, quantized: bool = True, batch_size: int = 32,
+                 max_length: int = 128, num_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        model_file = model_dir / (INT8_FILE if quantized and (model_dir / INT8_FILE).exists() else FP32_FILE)
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length)
+        pad_token = "<pad>" if self.tokenizer.token_to_id("<pad>") is not None else "[PAD]"
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+        self.batch_size = batch_size
+        self.model_file = model_file
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = self.tokenizer.encode_batch(texts[i:i + self.batch_size])
+            ids = np.array([e.ids for e in batch], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in batch], dtype=np.int64)
+            hidden = self.session.run(None, {"input_ids": ids, "attention_mask": mask})[0]
+            weights = mask[..., None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a)) or 1.0
+    nb = math.sqrt(sum(y * y for y in b)) or 1.0
+    return dot / (na * nb)
+
+
+def drift_check(reference: Embeddings, candidate: Embeddings, texts: List[str],
+                min_cosine: float = 0.98) -> dict:
+    """逐条比较两套向量的余弦相似度，最差值低于 min_cosine 视为不通过"""
+    ref = reference.embed_documents(texts)
+    cand = candidate.embed_documents(texts)
+    sims = sorted(_cosine(a, b) for a, b in zip(ref, cand))
+    report = {
+        "count": len(sims),
+        "min_cosine": sims[0] if sims else 1.0,
+        "p05_cosine": sims[int(len(sims) * 0.05)] if sims else 1.0,
+        "mean_cosine": sum(sims) / len(sims) if sims else 1.0,
+    }
+    report["passed"] = report["min_cosine"] >= min_cosine
+    return report
+
+
+def drift_texts(rules_file: str) -> List[str]:
+    """精度检查语料：规则文档 + 全部 few-shot 示例"""
+    from .document_builder import build_rule_documents
+    from .rule_loader import load_all_rules
+
+    rules = load_all_rules(rules_file)
+    texts = [doc.page_content for doc in build_rule_documents(rules)]
+    texts += [ex.input for rule in rules for ex in rule.few_shot]
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多语言 MiniLM 的 ONNX 导出与精度检查")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_export = sub.add_parser("export")
+    p_export.add_argument("--out", default="models/minilm-onnx")
+    p_export.add_argument("--no-quantize", action="store_true")
+    p_check = sub.add_parser("check")
+    p_check.add_argument("--dir", default="models/minilm-onnx")
+    p_check.add_argument("--min-cosine", type=float, default=0.98)
+    p_check.add_argument("--rules", default=str(Path(__file__).parent / "compliance_rules.yaml"))
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        export_onnx(args.out, quantize=not args.no_quantize)
+        return
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    reference = HuggingFaceEmbeddings(model_name=DEFAULT_EMBEDDING_MODEL,
+                                      encode_kwargs={"normalize_embeddings": True})
+    report = drift_check(reference, OnnxEmbeddings(args.dir), drift_texts(args.rules), args.min_cosine)
+    for k, v in report.items():
+        print(f"{k}: {v}")
+    if not report["passed"]:
+        raise SystemExit("ONNX 量化模型精度漂移超出阈值")
+
+
+if __name__ == "__main__":
+    main()
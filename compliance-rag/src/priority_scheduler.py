@@ -0,0 +1,141 @@
+# src/priority_scheduler.py
+"""
+LLM 调用的优先级调度。
+
+同一个引擎同时服务在线检测和夜间批量稽核时，十万行的批量任务会占满 LLM 并发，
+在线请求只能排在后面。调度器放在并发控制器前面：
+- 三个优先级：interactive（在线检测）、near_real_time（准实时）、bulk（批量稽核）
+- 总并发名额跟随 AIMD 控制器的当前上限；每个优先级有占用上限 max_share，
+  在线请求排队时 bulk 的占用上限再收紧到 bulk_share_under_pressure，给在线请求留出空位
+- 名额在有排队的优先级之间按加权公平排队（WFQ）分配，代价为估算 token 数，
+  所以权重同时决定并发份额和 token 预算份额
+- 已发出的 HTTP 请求无法中断，“抢占”体现为排队：bulk 请求在在线流量高峰时留在队列里
+- 每个优先级输出排队深度、在途数、等待时间 p50/p95
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Optional
+
+INTERACTIVE = "interactive"
+NEAR_REAL_TIME = "near_real_time"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, NEAR_REAL_TIME, BULK)
+
+DEFAULT_WEIGHTS = {INTERACTIVE: 8.0, NEAR_REAL_TIME: 3.0, BULK: 1.0}
+DEFAULT_MAX_SHARE = {INTERACTIVE: 1.0, NEAR_REAL_TIME: 0.8, BULK: 0.6}
+
+
+class _PriorityClass:
+    def __init__(self, name: str, weight: float, max_share: float, window: int):
+        self.name = name
+        self.weight = weight
+        self.max_share = max_share
+        self.queue: Deque[int] = deque()
+        self.inflight = 0
+        self.vtime = 0.0
+        self.admitted = 0
+        self.waits: Deque[float] = deque(maxlen=window)
+
+
+class PriorityScheduler:
+    """见模块说明；limit 为返回当前总并发上限的函数，一般为 lambda: int(controller.limit)"""
+
+    def __init__(self, limit: Callable[[], int],
+                 weights: Optional[Dict[str, float]] = None,
+                 max_share: Optional[Dict[str, float]] = None,
+                 bulk_share_under_pressure: float = 0.25,
+                 metrics_window: int = 1000):
+        self.limit = limit
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        shares = {**DEFAULT_MAX_SHARE, **(max_share or {})}
+        self.classes = {p: _PriorityClass(p, weights[p], shares[p], metrics_window) for p in PRIORITIES}
+        self.bulk_share_under_pressure = bulk_share_under_pressure
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        self._inflight = 0
+
+    def _cap(self, cls: _PriorityClass, total: int) -> int:
+        share = cls.max_share
+        if cls.name == BULK and self.classes[INTERACTIVE].queue:
+            share = min(share, self.bulk_share_under_pressure)
+        return max(1, int(total * share))
+
+    def _next(self) -> Optional[_PriorityClass]:
+        """在有排队、且未超过占用上限的优先级中选虚拟时间最小的"""
+        total = max(1, self.limit())
+        if self._inflight >= total:
+            return None
+        candidates = [c for c in self.classes.values() if c.queue and c.inflight < self._cap(c, total)]
+        if not candidates:
+            return None
+        # 在线请求排队时严格优先
+        for c in candidates:
+            if c.name == INTERACTIVE:
+                return c
+        return min(candidates, key=lambda c: c.vtime)
+
+    def acquire(self, priority: str = INTERACTIVE, cost: float = 1.0) -> None:
+        cls = self.classes[priority]
+        enqueued = time.monotonic()
+        with self._cond:
+            ticket = next(self._tickets)
+            if not cls.queue and cls.inflight == 0:
+                # 空闲后重新进入竞争的优先级不能凭积攒的虚拟时间一次性抢占
+                busy = [c.vtime for c in self.classes.values() if c is not cls and (c.queue or c.inflight)]
+                if busy:
+                    cls.vtime = max(cls.vtime, min(busy))
+            cls.queue.append(ticket)
+            while True:
+                chosen = self._next()
+                if chosen is cls and cls.queue[0] == ticket:
+                    break
+                self._cond.wait(0.5)
+            cls.queue.popleft()
+            cls.inflight += 1
+            cls.admitted += 1
+            cls.vtime += cost / cls.weight
+            cls.waits.append(time.monotonic() - enqueued)
+            self._inflight += 1
+            self._cond.notify_all()
+
+    def release(self, priority: str = INTERACTIVE) -> None:
+        with self._cond:
+            self.classes[priority].inflight -= 1
+            self._inflight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE, cost: float = 1.0):
+        self.acquire(priority, cost)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def call(self, priority: str, cost: float, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self.slot(priority, cost):
+            return fn(*args, **kwargs)
+
+    @staticmethod
+    def _percentile(values, q: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各优先级的排队深度、在途数、累计放行数与等待时间分位数（秒）"""
+        with self._cond:
+            return {
+                name: {
+                    "queued": len(c.queue),
+                    "inflight": c.inflight,
+                    "admitted": c.admitted,
+                    "wait_p50": self._percentile(c.waits, 0.5),
+                    "wait_p95": self._percentile(c.waits, 0.95),
+                }
+                for name, c in self.classes.items()
+            }
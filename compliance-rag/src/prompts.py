@@ -0,0 +1,225 @@
+# src/prompts.py
+"""
+合规检测 Prompt 模板。规则按标题拆成独立段落，既可以拼出完整的 14 条规则 Prompt，
+也可以只拼出部分规则（检索裁剪、规则分片时使用），编号自动从 1 开始重排。
+"""
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .local_screen import canonical_event
+from .schemas import ComplianceRule
+
+PROMPT_HEADER = """
+你是一个违规风险检测员，你的任务是帮我判断用户的文本是否有违规项。
+
+## 违规规则如下：
+
+
+"""
+
+# 规则标题 -> 规则正文（不含编号，标题即 LLM 输出的“触发事件”名称）
+RULE_SECTIONS = {
+    "直接承诺收益": """直接承诺收益视为违规！！
+注意，只有服务方以明确、肯定的语气向客户直接承诺未来的投资结果或收益保障时才视为违规。客户主动反馈的过往收益情况、客户历史报喜案例展示、对已发生事实的描述均不视为违规。服务方引用客户历史反馈或展示客户过往案例不属于服务方对未来的收益承诺。"拍着胸脯讲"等自信表述不视为收益承诺。诱导和暗示等其他行为均视为不违规。
+
+**重要说明：**
+- 必须是对未来收益的明确保证才构成违规
+- 历史业绩展示不等于未来收益承诺
+
+
+
+""",
+    "低投入高额回报表述": """低投入高额回报表述视为违规！！
+注意，只有**明确同时出现具体数字的本金金额和具体数字的收益金额/比例**时才视为违规。
+
+**具体违规情形：**
+- "10万本金赚20万"（明确本金10万，收益20万）
+- "8万本金赚3.5万"（明确本金8万，收益3.5万）
+- "5万投入获利10万"（明确本金5万，收益10万）
+
+**重要说明：**
+- 必须同时出现**具体的数字本金**和**具体的数字收益**才构成违规
+- 仅展示历史个股表现、涨幅数据（如"12天11板，涨幅130%"）属于绩效展示，不视为违规
+- 仅展示客户收益但未提及具体本金数字属于收益展示，不视为违规
+- 营销话术属于邀约类表述，不视为违规
+- 比喻性、夸张性表述不视为违规
+- 仅展示客户收益但未提及具体本金数字（如"赚2万"）属于收益展示，不视为违规
+- 市场行情描述、投资机会分析、热点主线推荐均不视为违规
+- 所有的诱导和暗示视为不违规
+
+""",
+    "短期内可获高额回报表述": """短期内可获高额回报表述视为违规！！
+注意，只有**明确承诺在具体时间范围内获得具体金额或比例的收益**时才视为违规。
+
+**具体违规情形：**
+- "一周内赚10万"（明确时间"一周"，明确收益"10万"）
+- "3天获利50%"（明确时间"3天"，明确收益"50%"）
+- "一个月翻倍"（明确时间"一个月"，明确收益"翻倍"）
+
+**重要说明：**
+- 必须同时出现**具体时间范围**和**具体收益金额/比例**才构成违规
+- 市场行情描述（如"启动就是涨停"）属于正常市场分析，不视为违规
+- 个股特征描述（如"涨停就是连扳"）属于正常分析，不视为违规
+- 历史涨幅展示（如"大涨50%"）属于绩效展示，不视为违规
+- 介绍产品和过往示例视为不违规
+- 所有的诱导和暗示视为不违规
+
+""",
+    "对投研调研活动夸大宣传": """对投研调研活动夸大宣传视为违规！！
+注意，只有员工明确强调线下调研后能获取一手资料、知根底、了如指掌，或明确强调联合调研了解机构真实持仓情况且股价受调研影响时才视为违规。
+
+""",
+    "与客户进行私下联系": """与客户进行私下联系视为违规！！
+注意，只有明确索要客户手机号或私人微信，或提供员工个人手机号、私人微信、QQ号等非官方联系方式时才视为违规。通过企业微信、官方服务号等正规渠道的服务通知、产品策略推送不视为违规。办理服务后的正常流程对接（如"加一下老师的微信"进行服务对接）不视为违规。
+""",
+    "使用敏感词汇": """使用敏感词汇视为违规！！
+注意，只有对话中出现以下敏感词汇才视为违规：预期收益、预期空间、预期涨幅、吃肉、吃饭、捡漏、捡钱、成功率**%、收益率、胜率**%、翻身、妖龙、牛股、妖股、回血、回本、翻倍、翻番、暴涨、*连板、连板、*天*板、*天*个涨停、连续*个涨停、*字板、全胜、没有亏损、大赚小亏、大赚小赔、少赚就是亏、稳赚不赔、本金无忧、战胜、持续盈利、钱生钱、边学边赚、见效、立竿见影、赚回、10倍股、抓涨停、抓涨停、搏一搏、单车变摩托、一天一辆小汽车、大平层、一套房、翻蓓、抢钱。其他词汇严格不视为违规。
+
+""",
+    "异常开户": """异常开户视为违规！！
+注意，只有特定券商名称结合最低佣金/佣金优惠及加微信等诱导开户行为才视为违规。
+
+""",
+    "干扰风险测评独立性": """干扰风险测评独立性视为违规！！
+注意，只有直接告知客户风险测评题目答案（如"选A"、"选B"）或暗示测评中哪些题目要注意、应该如何选择时才视为违规。服务模式介绍、操作流程说明、投资建议分享等不涉及风险测评指导的内容不视为违规。"抄作业"等比喻性表述不视为对风险测评的干扰。
+""",
+    "错误表述服务合同生效起始周期": """错误表述服务合同生效起始周期视为违规！！
+注意，只有错误表述服务合同期起始时间，涉及虚假或误导性承诺时才视为违规。
+
+""",
+    "不文明用语": """不文明用语视为违规！！
+注意，只有使用具有侮辱、讽刺、歧视或攻击性内容的语言时才视为违规。
+
+""",
+    "以退款为营销卖点": """以退款为营销卖点视为违规！！
+注意，只有明确以软件或服务退款作为主要销售诱因时才视为违规。仅为说明订金/定金可退，或客户资金不足时提供订金选项，不视为违规。
+
+""",
+    "怂恿客户使用他人身份办理服务": """怂恿客户使用他人身份办理服务视为违规！！
+注意，只有引导客户使用他人身份购买办理服务时才视为违规。
+
+""",
+    "违规指导": """违规指导视为违规！！
+注意，只有向客户提供具体的股票买卖操作指令（如具体价格、具体时间点的买卖建议、具体买卖数量）时才视为违规。
+
+重要说明：
+- 正规投顾服务中展示的策略模板包含【股票代码】、【买点参考】、【仓位建议】、【推荐理由】等属于标准服务内容展示，不视为违规指导
+- 服务模式介绍、操作流程说明、邀约类话术、服务内容描述、行情分析、个股机会提示、投资方向建议、市场机会描述均不视为违规
+- "积极把握进场机会"、"抢跑的机会"、"布局的重要节点"等市场机会描述属于邀约类话术，不视为违规指导
+- 老师或投顾团队通过正规服务渠道提供的策略建议不视为违规指导
+
+""",
+    "对标个股未来走势": """对标个股未来走势视为违规！！
+注意，只有以个股历史走势为依据对未来涨跌方向做出确定性判断时才视为违规。
+
+**具体违规情形（属于对标个股未来走势）：**
+- 明确提及具体涨停数量预期（如"3-5个涨停"、"会有几个涨停"等）
+- 以"不要等...涨停再后悔"等暗示性话术表达涨停预期
+- 使用具体数字描述未来涨幅预期
+- 使用"有望接力"等表述将当前个股与历史高涨幅个股进行对标预期
+- 暗示当前个股将达到历史个股的涨幅水平
+
+**重要说明：**
+- "爆发力强"、"盘口较小"等个股特征描述属于正常分析，不视为违规
+- 展示老师信心属于正常营销话术，不视为违规
+- 描述过往表现、市场分析不视为违规
+- 只有涉及具体涨停数量、具体涨幅数字的未来预期才构成违规
+
+""",
+}
+RULE_TITLES: Tuple[str, ...] = tuple(RULE_SECTIONS)
+
+EXAMPLES_SECTION = """## 参考示例（与本条文本最相关的历史判定）：
+{examples}
+
+"""
+
+CASES_SECTION = """## 相似历史案例（既往人工/模型判定，仅作参考，必须以本条文本内容和上述规则为准）：
+{cases}
+
+"""
+
+PROMPT_FOOTER = """## 重要注意事项：
+注意，所有的诱导和暗示视为不违规！！！！！
+注意，所有的诱导和暗示视为不违规！！！！！
+
+以上规则单独判断！！！！！！
+以上规则单独判断！！！！！！
+
+## 输出要求
+请严格按规则判断文本是否违规，可能同时触发多个违规事件。
+若有违规，输出分析内容；若无违规，则不用输出分析内容。
+
+聊天内容：
+{input}
+
+你必须且只能按以下格式输出，不要任何其他文字：
+
+是否违规：是/否
+触发事件：[事件名称列表，用逗号分隔，必须且只能返回规则标题中"视为违规"前面的部分，如"直接承诺收益,低投入高额回报表述"，若不违规则写"无"]
+理由：[简明理由，引用规则中的关键词或逻辑]
+重要：触发事件必须与理由分析完全一致，如果理由中分析某规则不违规，触发事件中就不能包含该规则。
+"""
+
+
+def sections_for_rules(rules: List[ComplianceRule], overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    规则集对应的 Prompt 段落（多租户时每个租户一份）：
+    overrides 中的段落 > 内置段落 RULE_SECTIONS > 按 YAML description 生成。
+    内置规则按 RULE_TITLES 顺序排在前面，规则集与内置一致时结果等于 RULE_SECTIONS。
+    """
+    overrides = overrides or {}
+    titles = list(dict.fromkeys(canonical_event(r.event_name) for r in rules))
+    descriptions = {canonical_event(r.event_name): r.description for r in rules}
+    ordered = [t for t in RULE_TITLES if t in titles] + [t for t in titles if t not in RULE_SECTIONS]
+    sections = {}
+    for title in ordered:
+        if title in overrides:
+            # 外部文本中的花括号会被当成模板变量，需要转义
+            sections[title] = overrides[title].replace("{", "{{").replace("}", "}}")
+        elif title in RULE_SECTIONS:
+            sections[title] = RULE_SECTIONS[title]
+        else:
+            text = descriptions[title].replace("{", "{{").replace("}", "}}")
+            sections[title] = f"{title}视为违规！！\n{text.strip()}\n\n"
+    return sections
+
+
+def build_prompt_text(titles: Optional[Iterable[str]] = None, with_examples: bool = False,
+                      sections: Optional[Dict[str, str]] = None, with_cases: bool = False) -> str:
+    """拼接 Prompt 模板文本。titles 为 None 时包含全部规则，与原始完整 Prompt 一致"""
+    sections = RULE_SECTIONS if sections is None else sections
+    wanted = None if titles is None else set(titles)
+    selected = list(sections) if wanted is None else [t for t in sections if t in wanted]
+    body = "".join(f"{i}. {sections[t]}" for i, t in enumerate(selected, 1))
+    return (PROMPT_HEADER + body + (EXAMPLES_SECTION if with_examples else "")
+            + (CASES_SECTION if with_cases else "") + PROMPT_FOOTER)
+
+
+@lru_cache(maxsize=256)
+def build_prompt(titles: Optional[Tuple[str, ...]] = None, with_examples: bool = False,
+                 sections: Optional[Tuple[Tuple[str, str], ...]] = None, with_cases: bool = False):
+    """按规则子集构建（并缓存）ChatPromptTemplate；sections 为 (标题, 段落) 元组，默认内置段落"""
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate.from_template(
+        build_prompt_text(titles, with_examples, dict(sections) if sections else None, with_cases))
+
+
+def format_examples(examples: List[Tuple[str, bool, str]]) -> str:
+    """(文本, 是否违规, 理由) -> Prompt 中的示例行"""
+    lines = []
+    for text, violation, reason in examples:
+        label = "违规" if violation else "不违规"
+        lines.append(f"- {label}：\"{text}\" → {reason}")
+    return "\n".join(lines) if lines else "无"
+
+
+def format_cases(cases, max_chars: int = 200) -> str:
+    """相似历史案例（case_index.SimilarCase）-> Prompt 中的证据行，原文过长时截断"""
+    lines = []
+    for case in cases:
+        text = case.text if len(case.text) <= max_chars else case.text[:max_chars] + "…"
+        label = f"违规（{case.triggered_event}）" if case.violation else "不违规"
+        lines.append(f"- 相似度 {case.score:.2f}，{label}：\"{text}\" → {case.reason}")
+    return "\n".join(lines) if lines else "无"
@@ -1,19 +1,62 @@
 # src/rag_engine.py
+import contextvars
 import os
-import yaml
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+import time
+from langchain_core.runnables import RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
-from typing import Dict, Any
-
-# 设置 DashScope API Key
-# os.environ["DASHSCOPE_API_KEY"] = "sk-2061ea9f55e446ffa570d8ac2510d401"
-os.environ["DASHSCOPE_API_KEY"] = "sk-a677631fd47a4e2184b6836f6097f0b5"
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .concurrency import AdaptiveConcurrencyController, classify_error
+from .llm_pool import LLMPool, track_usage
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN
+from .local_screen import LocalScreener, join_events, split_events
+from .numeric_rules import NumericRuleEvaluator
+from .normalizer import TextNormalizer
+from .verdict_cache import VerdictCache
+from .near_dup import NearDuplicateIndex, mask_entities, rule_signature
+from .distill import DistilledClassifier, VerdictLog
+from .prompts import build_prompt, build_prompt_text, format_cases, format_examples, sections_for_rules
+from .reranker import CrossEncoderReranker
+from .retrieval import RuleRetriever
+from .case_index import CaseIndex
+from .compact_results import CompactResults
+from .conversation import build_windows, estimate_tokens, merge_window_verdicts, split_turns
+from .priority_scheduler import BULK, INTERACTIVE, NEAR_REAL_TIME, PriorityScheduler
+from .rule_versions import RuleSetVersion, RuleVersionRegistry, prescreen_events
+from .rule_shards import load_shards, merge_shard_verdicts, restrict_shards, shards_by_risk_level
+from .recheck_queue import RecheckQueue
+from .rule_loader import load_all_rules
+
+
+# DashScope API Key 由部署环境提供（DASHSCOPE_API_KEY / DASHSCOPE_API_KEYS / LLM_BACKENDS_FILE），见 llm_pool.load_backend_configs
 class ComplianceRAGEngine:
-    def __init__(self, rules_file: str = None):
+    def __init__(self, rules_file: str = None,
+                 concurrency: Optional[AdaptiveConcurrencyController] = None,
+                 llm_pool: Optional[LLMPool] = None,
+                 backends_file: Optional[str] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 degraded_fallback: bool = True,
+                 local_first: bool = False,
+                 cache_size: int = 50000,
+                 near_dup: Optional[NearDuplicateIndex] = None,
+                 verdict_log_file: Optional[str] = None,
+                 distilled_model_file: Optional[str] = None,
+                 retrieval_scope: bool = False,
+                 retriever: Optional[RuleRetriever] = None,
+                 retrieval_top_k: Optional[int] = None,
+                 rerank_min_score: Optional[float] = None,
+                 sharded: bool = False,
+                 shards: Optional[List[List[str]]] = None,
+                 skip_clear_shards: bool = True,
+                 scheduler: Optional[PriorityScheduler] = None,
+                 prompt_sections: Optional[Dict[str, str]] = None,
+                 embeddings: Any = None,
+                 case_index: Optional[CaseIndex] = None,
+                 similar_cases: int = 3,
+                 similar_min_score: float = 0.6,
+                 record_verdicts: bool = True):
         # from .rule_loader import load_all_rules
         # from .document_builder import build_rule_documents
         
@@ -33,140 +76,109 @@ class ComplianceRAGEngine:
         # self.vectorstore = FAISS.from_documents(documents, embeddings)
         # self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": 3})
         
-        # 使用 DashScope 的 Qwen 模型
-        self.llm = ChatOpenAI(
-            model="qwen-max",
-            openai_api_key=os.getenv("DASHSCOPE_API_KEY"),
-            openai_api_base="https://dashscope.aliyuncs.com/compatible-mode/v1",
+        # 本地规则（熔断降级时使用）
+        if rules_file is None:
+            rules_file = self._find_or_create_rules_file()
+        self.rules_file = rules_file
+        self.rules = load_all_rules(rules_file)
+        # 规则集对应的 Prompt 段落（多租户时各租户不同，prompt_sections 覆盖内置段落）
+        self.rule_sections = sections_for_rules(self.rules, prompt_sections)
+        self.rule_titles = tuple(self.rule_sections)
+        self._sections_key = tuple(self.rule_sections.items())
+        # 规范化只做一次，关键词匹配、数值规则和缓存 key 共用同一结果
+        self.normalizer = TextNormalizer.from_rules(self.rules)
+        # embeddings 可由多个引擎共享（见 tenants.py），为空时首次使用才加载
+        self.embeddings = embeddings
+        self.local_screener = LocalScreener(self.rules, embeddings=embeddings, normalizer=self.normalizer)
+        self.verdict_cache = VerdictCache(cache_size)
+        # 近似重复复用：掩码数字/代码/日期后的 SimHash 索引
+        self.near_dup = near_dup or NearDuplicateIndex()
+        # LLM 判定日志（蒸馏训练数据）与蒸馏分类器（首轮放行过滤）
+        # record_verdicts=False 时判定不写入判定日志和历史案例库（影子评估的候选配置，见 shadow_eval.py）
+        self.record_verdicts = record_verdicts
+        verdict_log_file = verdict_log_file or os.getenv("VERDICT_LOG_FILE")
+        self.verdict_log = VerdictLog(verdict_log_file) if verdict_log_file and record_verdicts else None
+        # 规则集版本：判定记录带上版本号，规则变更后只复审受影响的文本（见 rule_versions.py）
+        self.rule_version = RuleSetVersion.from_rules(self.rules, self.rule_sections)
+        if self.verdict_log is not None:
+            RuleVersionRegistry.for_log(self.verdict_log).register(self.rule_version)
+        distilled_model_file = distilled_model_file or os.getenv("DISTILLED_MODEL_FILE")
+        self.distilled = None
+        if distilled_model_file and os.path.exists(distilled_model_file):
+            self.distilled = DistilledClassifier(distilled_model_file)
+            print(f"已加载蒸馏分类器: {distilled_model_file}")
+        # 数值类规则（低投入高额回报 / 短期高额回报 / 对标个股未来走势）本地确定性判定
+        # local_first=True 时，数值规则全部可判定且其他规则无任何关键词命中的文本不再调用 LLM
+        self.numeric_rules = NumericRuleEvaluator()
+        self.local_first = local_first
+        # 抽样稽核发现本地放行漏判过多的规则：这些规则不再本地放行，一律交给 LLM（见 sampling_audit.py）
+        self.llm_required_events: Set[str] = set()
+        self.auditor = None
+        # 影子评估：抽样把线上请求同时交给候选配置判定（见 shadow_eval.py）
+        self.shadow = None
+        # 检索裁剪 Prompt：只带入与文本相关的规则和 few-shot 示例；
+        # 设置 RERANKER_MODEL 时在 FAISS 召回后用交叉编码器重排，再截断到 top_k（RETRIEVAL_TOP_K），
+        # 并丢弃分数低于 min_score（RERANK_MIN_SCORE，交叉编码器原始分数）的规则与示例
+        if retriever is None and retrieval_scope:
+            reranker_model = os.getenv("RERANKER_MODEL")
+            if retrieval_top_k is None:
+                retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+            if rerank_min_score is None and os.getenv("RERANK_MIN_SCORE"):
+                rerank_min_score = float(os.getenv("RERANK_MIN_SCORE"))
+            retriever = RuleRetriever(
+                self.rules,
+                embeddings=embeddings,
+                reranker=CrossEncoderReranker(reranker_model) if reranker_model else None,
+                top_k=retrieval_top_k,
+                min_score=rerank_min_score,
+            )
+        self.retriever = retriever
+        # 相似历史案例：检索已判定的相似文本作为 Prompt 证据，LLM 判定后增量收录（见 case_index.py）
+        case_index_dir = os.getenv("CASE_INDEX_DIR")
+        if case_index is None and case_index_dir:
+            case_index = CaseIndex(case_index_dir, embeddings=embeddings)
+        self.case_index = case_index
+        self.similar_cases = similar_cases
+        self.similar_min_score = similar_min_score
+
+        # 熔断器 + 降级复核队列
+        self.breaker = breaker or CircuitBreaker()
+        self.degraded_fallback = degraded_fallback
+        self.recheck_queue = RecheckQueue()
+
+        # 使用 DashScope 的 Qwen 模型，支持多 key / 多 endpoint（见 llm_pool.load_backend_configs）
+        # 重试交给并发控制器处理，这样 429/5xx 才能反馈到并发上限上
+        self.llm_pool = llm_pool or LLMPool.from_config(
+            backends_file,
             temperature=0.0,
             max_tokens=500,
+            max_retries=0,
+        )
+        self.llm = self.llm_pool.backends[0].llm
+        # 并发上限随后端数量线性扩展
+        self.concurrency = concurrency or AdaptiveConcurrencyController(
+            max_limit=sum(b.config.max_concurrency for b in self.llm_pool.backends)
+        )
+        # 优先级调度：在线检测 / 准实时 / 批量稽核按权重分享并发名额与 token 预算
+        self.scheduler = scheduler or PriorityScheduler(lambda: int(self.concurrency.limit))
+        self._prompt_tokens = estimate_tokens(build_prompt_text(sections=self.rule_sections))
+        # 规则分片并行判定：每个分片一个短 Prompt 并发调用，结论合并（见 rule_shards.py）
+        # skip_clear_shards=True 时，分片内没有关键词命中、也没有数值规则待定的分片不调用 LLM
+        if shards is None and sharded:
+            shards = load_shards(titles=self.rule_titles) or shards_by_risk_level(self.rules, titles=self.rule_titles)
+        self.shards = [tuple(s) for s in shards] if shards else None
+        self.skip_clear_shards = skip_clear_shards
+        self._shard_executor = (
+            ThreadPoolExecutor(max_workers=self.concurrency.max_limit, thread_name_prefix="rule-shard")
+            if self.shards else None
         )
         
-        # 定义带结构化输出的 Prompt
-        prompt = ChatPromptTemplate.from_template("""
-你是一个违规风险检测员，你的任务是帮我判断用户的文本是否有违规项。
-
-## 违规规则如下：
-
-
-1. 直接承诺收益视为违规！！
-注意，只有服务方以明确、肯定的语气向客户直接承诺未来的投资结果或收益保障时才视为违规。客户主动反馈的过往收益情况、客户历史报喜案例展示、对已发生事实的描述均不视为违规。服务方引用客户历史反馈或展示客户过往案例不属于服务方对未来的收益承诺。"拍着胸脯讲"等自信表述不视为收益承诺。诱导和暗示等其他行为均视为不违规。
-
-**重要说明：**
-- 必须是对未来收益的明确保证才构成违规
-- 历史业绩展示不等于未来收益承诺
-
-
-
-2. 低投入高额回报表述视为违规！！
-注意，只有**明确同时出现具体数字的本金金额和具体数字的收益金额/比例**时才视为违规。
-
-**具体违规情形：**
-- "10万本金赚20万"（明确本金10万，收益20万）
-- "8万本金赚3.5万"（明确本金8万，收益3.5万）
-- "5万投入获利10万"（明确本金5万，收益10万）
-
-**重要说明：**
-- 必须同时出现**具体的数字本金**和**具体的数字收益**才构成违规
-- 仅展示历史个股表现、涨幅数据（如"12天11板，涨幅130%"）属于绩效展示，不视为违规
-- 仅展示客户收益但未提及具体本金数字属于收益展示，不视为违规
-- 营销话术属于邀约类表述，不视为违规
-- 比喻性、夸张性表述不视为违规
-- 仅展示客户收益但未提及具体本金数字（如"赚2万"）属于收益展示，不视为违规
-- 市场行情描述、投资机会分析、热点主线推荐均不视为违规
-- 所有的诱导和暗示视为不违规
-
-3. 短期内可获高额回报表述视为违规！！
-注意，只有**明确承诺在具体时间范围内获得具体金额或比例的收益**时才视为违规。
-
-**具体违规情形：**
-- "一周内赚10万"（明确时间"一周"，明确收益"10万"）
-- "3天获利50%"（明确时间"3天"，明确收益"50%"）
-- "一个月翻倍"（明确时间"一个月"，明确收益"翻倍"）
-
-**重要说明：**
-- 必须同时出现**具体时间范围**和**具体收益金额/比例**才构成违规
-- 市场行情描述（如"启动就是涨停"）属于正常市场分析，不视为违规
-- 个股特征描述（如"涨停就是连扳"）属于正常分析，不视为违规
-- 历史涨幅展示（如"大涨50%"）属于绩效展示，不视为违规
-- 介绍产品和过往示例视为不违规
-- 所有的诱导和暗示视为不违规
-
-4. 对投研调研活动夸大宣传视为违规！！
-注意，只有员工明确强调线下调研后能获取一手资料、知根底、了如指掌，或明确强调联合调研了解机构真实持仓情况且股价受调研影响时才视为违规。
-
-5. 与客户进行私下联系视为违规！！
-注意，只有明确索要客户手机号或私人微信，或提供员工个人手机号、私人微信、QQ号等非官方联系方式时才视为违规。通过企业微信、官方服务号等正规渠道的服务通知、产品策略推送不视为违规。办理服务后的正常流程对接（如"加一下老师的微信"进行服务对接）不视为违规。
-6. 使用敏感词汇视为违规！！
-注意，只有对话中出现以下敏感词汇才视为违规：预期收益、预期空间、预期涨幅、吃肉、吃饭、捡漏、捡钱、成功率**%、收益率、胜率**%、翻身、妖龙、牛股、妖股、回血、回本、翻倍、翻番、暴涨、*连板、连板、*天*板、*天*个涨停、连续*个涨停、*字板、全胜、没有亏损、大赚小亏、大赚小赔、少赚就是亏、稳赚不赔、本金无忧、战胜、持续盈利、钱生钱、边学边赚、见效、立竿见影、赚回、10倍股、抓涨停、抓涨停、搏一搏、单车变摩托、一天一辆小汽车、大平层、一套房、翻蓓、抢钱。其他词汇严格不视为违规。
-
-7. 异常开户视为违规！！
-注意，只有特定券商名称结合最低佣金/佣金优惠及加微信等诱导开户行为才视为违规。
-
-8. 干扰风险测评独立性视为违规！！
-注意，只有直接告知客户风险测评题目答案（如"选A"、"选B"）或暗示测评中哪些题目要注意、应该如何选择时才视为违规。服务模式介绍、操作流程说明、投资建议分享等不涉及风险测评指导的内容不视为违规。"抄作业"等比喻性表述不视为对风险测评的干扰。
-9. 错误表述服务合同生效起始周期视为违规！！
-注意，只有错误表述服务合同期起始时间，涉及虚假或误导性承诺时才视为违规。
-
-10. 不文明用语视为违规！！
-注意，只有使用具有侮辱、讽刺、歧视或攻击性内容的语言时才视为违规。
-
-11. 以退款为营销卖点视为违规！！
-注意，只有明确以软件或服务退款作为主要销售诱因时才视为违规。仅为说明订金/定金可退，或客户资金不足时提供订金选项，不视为违规。
-
-12. 怂恿客户使用他人身份办理服务视为违规！！
-注意，只有引导客户使用他人身份购买办理服务时才视为违规。
-
-13. 违规指导视为违规！！
-注意，只有向客户提供具体的股票买卖操作指令（如具体价格、具体时间点的买卖建议、具体买卖数量）时才视为违规。
-
-重要说明：
-- 正规投顾服务中展示的策略模板包含【股票代码】、【买点参考】、【仓位建议】、【推荐理由】等属于标准服务内容展示，不视为违规指导
-- 服务模式介绍、操作流程说明、邀约类话术、服务内容描述、行情分析、个股机会提示、投资方向建议、市场机会描述均不视为违规
-- "积极把握进场机会"、"抢跑的机会"、"布局的重要节点"等市场机会描述属于邀约类话术，不视为违规指导
-- 老师或投顾团队通过正规服务渠道提供的策略建议不视为违规指导
-
-14. 对标个股未来走势视为违规！！
-注意，只有以个股历史走势为依据对未来涨跌方向做出确定性判断时才视为违规。
-
-**具体违规情形（属于对标个股未来走势）：**
-- 明确提及具体涨停数量预期（如"3-5个涨停"、"会有几个涨停"等）
-- 以"不要等...涨停再后悔"等暗示性话术表达涨停预期
-- 使用具体数字描述未来涨幅预期
-- 使用"有望接力"等表述将当前个股与历史高涨幅个股进行对标预期
-- 暗示当前个股将达到历史个股的涨幅水平
-
-**重要说明：**
-- "爆发力强"、"盘口较小"等个股特征描述属于正常分析，不视为违规
-- 展示老师信心属于正常营销话术，不视为违规
-- 描述过往表现、市场分析不视为违规
-- 只有涉及具体涨停数量、具体涨幅数字的未来预期才构成违规
-
-## 重要注意事项：
-注意，所有的诱导和暗示视为不违规！！！！！
-注意，所有的诱导和暗示视为不违规！！！！！
-
-以上规则单独判断！！！！！！
-以上规则单独判断！！！！！！
-
-## 输出要求
-请严格按规则判断文本是否违规，可能同时触发多个违规事件。
-若有违规，输出分析内容；若无违规，则不用输出分析内容。
-
-聊天内容：
-{input}
-
-你必须且只能按以下格式输出，不要任何其他文字：
-
-是否违规：是/否
-触发事件：[事件名称列表，用逗号分隔，必须且只能返回规则标题中"视为违规"前面的部分，如"直接承诺收益,低投入高额回报表述"，若不违规则写"无"]
-理由：[简明理由，引用规则中的关键词或逻辑]
-重要：触发事件必须与理由分析完全一致，如果理由中分析某规则不违规，触发事件中就不能包含该规则。
-""")
+        # 定义带结构化输出的 Prompt（规则正文见 prompts.py）
+        prompt = build_prompt(sections=self._sections_key)
         
         self.chain = (
              prompt
-            | self.llm
+            | RunnableLambda(self.llm_pool.invoke)
             | StrOutputParser()
         )
 
@@ -188,9 +200,246 @@ class ComplianceRAGEngine:
         return rules_path
 
 
-    def predict(self, text: str) -> Dict[str, Any]:
-        raw_response = self.chain.invoke(text).strip()
-
+    def _invoke_llm(self, text: str, scope: Optional[Tuple[Tuple[str, ...], Optional[str]]] = None,
+                    priority: str = INTERACTIVE, cases: Optional[str] = None) -> str:
+        """
+        scope=(规则标题, 示例文本或 None) 时使用裁剪后的 Prompt，否则使用完整 Prompt；
+        cases 为相似历史案例文本，不为空时加入 Prompt 作为参考证据
+        """
+        if scope is None and cases is None:
+            chain, inputs = self.chain, text
+        else:
+            titles, examples = scope if scope is not None else (None, None)
+            prompt = build_prompt(titles, examples is not None, self._sections_key, cases is not None)
+            chain = prompt | RunnableLambda(self.llm_pool.invoke) | StrOutputParser()
+            inputs = {"input": text}
+            if examples is not None:
+                inputs["examples"] = examples
+            if cases is not None:
+                inputs["cases"] = cases
+        # 调度代价按 token 估算：规则越少 Prompt 越短
+        prompt_tokens = self._prompt_tokens if scope is None else self._prompt_tokens * len(scope[0]) // len(self.rule_titles)
+        cost = prompt_tokens + estimate_tokens(text) + (estimate_tokens(cases) if cases else 0)
+        return self.breaker.call(self.scheduler.call, priority, cost,
+                                 self.concurrency.call, chain.invoke, inputs).strip()
+
+    def _prompt_scope(self, normalized, hits, numeric) -> Tuple[Tuple[str, ...], str]:
+        """检索召回的规则 ∪ 关键词命中的规则 ∪ 数值无法确定的规则，去掉数值规则已确定违规的规则"""
+        titles, examples = self.retriever.retrieve(normalized.text)
+        scope = set(titles) | set(hits) | self.llm_required_events
+        scope |= {e for e, v in numeric.items() if v.triggered is None}
+        # 数值规则的 False 不代表 LLM 不会报，只去掉已确定违规（结果必然加上）的规则
+        scope -= {e for e, v in numeric.items() if v.triggered is True}
+        return tuple(t for t in self.rule_titles if t in scope), format_examples(examples)
+
+    def _plan_shards(self, hits, numeric, scope, skip_clear: bool = True) -> List[Tuple[str, ...]]:
+        """本条文本需要调用的分片：去掉数值规则已确定违规的规则，按预筛结果跳过无触发迹象的分片"""
+        decided = {e for e, v in numeric.items() if v.triggered is True}
+        if scope is not None:
+            # 检索裁剪已经综合了召回、关键词和数值结果，范围内的规则都需要判断
+            allowed = flagged = set(scope[0])
+        else:
+            allowed = set(self.rule_titles) - decided
+            flagged = set(hits) | {e for e, v in numeric.items() if v.triggered is None}
+        flagged |= self.llm_required_events
+        shards = restrict_shards(self.shards, allowed)
+        if self.skip_clear_shards and skip_clear:
+            shards = [s for s in shards if flagged.intersection(s)]
+        return shards
+
+    def _sharded_llm(self, text: str, shards: List[Tuple[str, ...]], examples: Optional[str],
+                     priority: str = INTERACTIVE, cases: Optional[str] = None) -> Dict[str, Any]:
+        """各分片并发调用 LLM，任一分片失败即整体失败（交给降级逻辑）"""
+        # 复制 contextvars，分片线程里的 LLM 用量计入本次请求
+        futures = [self._shard_executor.submit(contextvars.copy_context().run,
+                                               self._invoke_llm, text, (shard, examples), priority, cases)
+                   for shard in shards]
+        return merge_shard_verdicts([(shard, self._parse_response(f.result())) for shard, f in zip(shards, futures)])
+
+    def _similar_cases(self, text: str):
+        """相似历史案例与本条文本的向量（判定后收录时复用，不再重复编码）"""
+        if self.case_index is None or self.similar_cases <= 0:
+            return [], None
+        vector = self.case_index.embed(text)
+        return self.case_index.search(k=self.similar_cases, min_score=self.similar_min_score, vector=vector), vector
+
+    def predict(self, text: str, priority: str = INTERACTIVE, full: bool = False) -> Dict[str, Any]:
+        """
+        priority 为调度优先级：interactive（默认）/ near_real_time / bulk。
+        full=True 时跳过缓存与所有本地放行（本地规则 / 近似重复 / 蒸馏分类器 / 分片预筛），
+        也不按数值规则裁剪判断范围，用完整 Prompt 调用 LLM，抽样稽核用它检验本地放行的结论。
+        结果带 usage（本次 LLM 调用次数 / token / 耗时）与 latency_ms
+        """
+        started = time.monotonic()
+        with track_usage() as usage:
+            result = self._predict(text, priority, full)
+        result["usage"] = usage
+        result["latency_ms"] = (time.monotonic() - started) * 1000
+        if self.shadow is not None and not full:
+            self.shadow.offer(text, result)
+        return result
+
+    def _predict(self, text: str, priority: str, full: bool) -> Dict[str, Any]:
+        normalized = self.normalizer.normalize(text)
+        numeric = self.numeric_rules.evaluate(normalized)
+        cached = None if full else self.verdict_cache.get(normalized.text)
+        if cached is not None:
+            cached["cached"] = True
+            cached["numeric_spans"] = {e: v.spans for e, v in numeric.items() if v.triggered}
+            return cached
+        hits = self.local_screener.matcher.match(normalized)
+        if self.local_first and not full:
+            local = self._local_decision(hits, numeric)
+            if local is not None:
+                return self._finish(normalized, local, hits, numeric)
+        masked = mask_entities(normalized.text)
+        signature = rule_signature(hits, numeric)
+        similar = None if full else self.near_dup.lookup(masked, signature)
+        if similar is not None:
+            violation, triggered_event, distance = similar
+            result = {
+                "raw_response": "",
+                "violation": violation,
+                "triggered_event": triggered_event,
+                "reason": f"与已判定的相似话术一致（海明距离 {distance}），差异不涉及规则相关片段",
+                "degraded": False,
+                "source": "near_dup",
+                "numeric_spans": {e: v.spans for e, v in numeric.items() if v.triggered},
+            }
+            return self._finish(normalized, result, hits, numeric)
+        if not full and self._distilled_clears(normalized, hits, numeric):
+            result = {
+                "raw_response": "",
+                "violation": False,
+                "triggered_event": "无",
+                "reason": "本地蒸馏分类器判定各规则概率均低于放行阈值",
+                "degraded": False,
+                "source": "distilled",
+            }
+            return self._finish(normalized, result, hits, numeric)
+        scope = None
+        if self.retriever is not None and not full:
+            scope = self._prompt_scope(normalized, hits, numeric)
+            if not scope[0]:
+                # 裁剪后没有需要 LLM 判断的规则，数值规则与关键词均已可本地确定
+                local = self._local_decision(hits, numeric)
+                if local is not None:
+                    return self._finish(normalized, local, hits, numeric)
+                scope = None
+        # full 时不按数值规则裁剪分片，稽核要让 LLM 独立判断这三条规则，才能发现数值规则的漏判
+        shards = self._plan_shards(hits, {} if full else numeric, scope, skip_clear=not full) if self.shards else None
+        if shards == []:
+            # 所有分片预筛均无触发迹象
+            local = self._local_decision(hits, numeric)
+            if local is not None:
+                local["reason"] = "各规则分片预筛均未命中，未调用 LLM"
+                return self._finish(normalized, local, hits, numeric)
+            shards = None
+        cases, vector = self._similar_cases(normalized.text)
+        cases_text = format_cases(cases) if cases else None
+        try:
+            if shards:
+                result = self._sharded_llm(text, shards, scope[1] if scope else None, priority, cases_text)
+            else:
+                result = self._parse_response(self._invoke_llm(text, scope, priority, cases_text))
+        except Exception as e:
+            # LLM 不可用（熔断中或重试耗尽）时降级为本地判定，并排队等待复核
+            if not self.degraded_fallback or (
+                    not isinstance(e, CircuitOpenError) and classify_error(e) == "fatal"):
+                raise
+            return self._degraded_predict(normalized, e, numeric)
+        result = self._apply_numeric(result, numeric)
+        self.near_dup.add(masked, signature, result)
+        if cases:
+            result["similar_cases"] = [case._asdict() for case in cases]
+        if vector is not None and self.record_verdicts and not self.case_index.read_only:
+            # _finish 才写入 rule_version，入库时先带上；案例收录失败不影响本次判定
+            try:
+                self.case_index.add(normalized.original, {**result, "rule_version": self.rule_version.id}, vector)
+            except Exception as e:
+                print(f"历史案例收录失败: {type(e).__name__}: {e}")
+        if shards:
+            in_scope = [t for shard in shards for t in shard]
+        else:
+            in_scope = scope[0] if scope else self.rule_titles
+        return self._finish(normalized, result, hits, numeric, in_scope)
+
+    def _finish(self, normalized, result: Dict[str, Any], hits, numeric,
+                in_scope: Sequence[str] = ()) -> Dict[str, Any]:
+        """写入缓存并记录判定：规则版本、交给 LLM 判断的规则、预筛涉及的规则"""
+        result["rule_version"] = self.rule_version.id
+        self.verdict_cache.put(normalized.text, result)
+        if self.auditor is not None:
+            self.auditor.offer(normalized.original, result)
+        if self.verdict_log is not None:
+            self.verdict_log.append(
+                normalized.original, result,
+                rule_version=self.rule_version.id,
+                in_scope=list(in_scope),
+                prescreen=prescreen_events(hits, numeric),
+            )
+        return result
+
+    def _distilled_clears(self, normalized, hits, numeric) -> bool:
+        """蒸馏分类器只负责放行：有关键词强命中或数值规则非确定不违规时一律交给 LLM"""
+        if self.distilled is None:
+            return False
+        if any(h.has_context for hs in hits.values() for h in hs):
+            return False
+        if any(v.triggered is not False for v in numeric.values()):
+            return False
+        return self.distilled.clears(normalized.text)
+
+    def _local_decision(self, hits, numeric) -> Optional[Dict[str, Any]]:
+        """数值规则全部可判定、且其他规则没有任何关键词命中时，直接给出本地结论"""
+        if any(v.triggered is None for v in numeric.values()):
+            return None
+        if any(event not in numeric for event in hits):
+            return None
+        if any(numeric.get(e) is None for e in self.llm_required_events):
+            return None
+        result = {
+            "raw_response": "",
+            "violation": False,
+            "triggered_event": "无",
+            "reason": "本地数值规则判定",
+            "degraded": False,
+            "source": "local",
+        }
+        return self._apply_numeric(result, numeric)
+
+    def _apply_numeric(self, result: Dict[str, Any], numeric) -> Dict[str, Any]:
+        """数值规则确定违规时补上对应事件；False/None 都保留 LLM 结论，不删除 LLM 报出的事件"""
+        events = split_events(result["triggered_event"])
+        notes = []
+        for event, verdict in numeric.items():
+            if verdict.triggered is True and event not in events:
+                events.append(event)
+                notes.append(f"{event}：{verdict.reason}")
+        result["numeric_spans"] = {e: v.spans for e, v in numeric.items() if v.triggered}
+        if notes:
+            result["triggered_event"] = join_events(events)
+            result["violation"] = bool(events)
+            result["reason"] = f"{result['reason']}\n【数值规则】" + "；".join(notes)
+        return result
+
+    def _degraded_predict(self, normalized, error: Exception, numeric) -> Dict[str, Any]:
+        result = self._apply_numeric(self.local_screener.verdict(normalized), numeric)
+        result["degraded"] = True
+        result["reason"] += f"（LLM 暂不可用：{type(error).__name__}，已加入复核队列）"
+        self.recheck_queue.put(normalized.original, result)
+        self.recheck_queue.start(recheck=self._recheck, is_available=lambda: self.breaker.state != OPEN)
+        return result
+
+    def _recheck(self, text: str) -> Dict[str, Any]:
+        """LLM 恢复后复核降级判定过的文本，结果写回缓存"""
+        normalized = self.normalizer.normalize(text)
+        numeric = self.numeric_rules.evaluate(normalized)
+        result = self._apply_numeric(self._parse_response(self._invoke_llm(text, priority=NEAR_REAL_TIME)), numeric)
+        hits = self.local_screener.matcher.match(normalized)
+        return self._finish(normalized, result, hits, numeric, self.rule_titles)
+
+    def _parse_response(self, raw_response: str) -> Dict[str, Any]:
         violation = False
         triggered_event = "无"
         reason = "未能解析模型响应"
@@ -212,5 +461,86 @@ class ComplianceRAGEngine:
             "raw_response": raw_response,
             "violation": violation,
             "triggered_event": triggered_event,
-            "reason": reason
+            "reason": reason,
+            "degraded": False,
+        }
+
+    def predict_batch(self, texts: List[str], max_workers: Optional[int] = None,
+                      priority: str = BULK) -> List[Dict[str, Any]]:
+        """并发批量检测，实际并发由 AIMD 控制器与优先级调度动态决定，结果顺序与输入一致"""
+        workers = max_workers or self.concurrency.max_limit
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda t: self.predict(t, priority), texts))
+
+    def predict_stream(self, texts: Iterable[str], max_workers: Optional[int] = None,
+                       priority: str = BULK) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """按输入顺序逐条产出 (文本, 结果)，在途条数有上限，输入可以是文件迭代器"""
+        workers = max_workers or self.concurrency.max_limit
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for text in texts:
+                pending.append((text, pool.submit(self.predict, text, priority)))
+                if len(pending) >= workers * 2:
+                    head, future = pending.popleft()
+                    yield head, future.result()
+            while pending:
+                head, future = pending.popleft()
+                yield head, future.result()
+
+    def predict_compact(self, texts: Iterable[str], max_workers: Optional[int] = None,
+                        priority: str = BULK, **compact_kwargs) -> CompactResults:
+        """百万行级批量检测：结果写入列式 CompactResults（见 compact_results.py），按需再转 DataFrame"""
+        results = CompactResults(**compact_kwargs)
+        results.extend(self.predict_stream(texts, max_workers, priority))
+        return results
+
+    def predict_conversation(self, text: str, max_window_tokens: int = 1200, overlap_turns: int = 2,
+                             max_workers: Optional[int] = None, priority: str = INTERACTIVE) -> Dict[str, Any]:
+        """
+        长对话检测：按轮次切分滑动窗口并发判定（见 conversation.py），
+        重叠窗口中的同一违规去重，每条违规映射回轮次下标
+        """
+        turns = split_turns(text)
+        windows = build_windows(turns, max_window_tokens, overlap_turns)
+        results = self.predict_batch([w.text for w in windows], max_workers, priority) if windows else []
+        turn_hits = [self.local_screener.matcher.match(self.normalizer.normalize(t.text)) for t in turns]
+        violations = merge_window_verdicts(windows, results, turns, turn_hits)
+
+        events = list(dict.fromkeys(v["event"] for v in violations))
+        reasons = [f"{v['event']}（第 {'、'.join(str(i + 1) for i in v['turns'])} 轮）：{v['reasons'][0]}"
+                   for v in violations]
+        return {
+            "violation": bool(violations),
+            "triggered_event": join_events(events),
+            "reason": "\n".join(reasons) if reasons else "各窗口均未发现违规",
+            "violations": violations,
+            "turns": turns,
+            "windows": [{"turns": list(w.turns), **r} for w, r in zip(windows, results)],
+            "degraded": any(r.get("degraded") for r in results),
+        }
+
+    def footprint(self) -> int:
+        """引擎私有缓存的大致内存占用（字节），多租户 LRU 淘汰时使用"""
+        return self.verdict_cache.nbytes() + self.near_dup.nbytes()
+
+    def close(self) -> None:
+        if self._shard_executor is not None:
+            self._shard_executor.shutdown(wait=False)
+        if self.case_index is not None:
+            self.case_index.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """运行指标（当前并发上限、在途请求数、各类错误计数、各后端健康度）"""
+        return {
+            **self.concurrency.stats(),
+            **self.breaker.stats(),
+            **self.verdict_cache.stats(),
+            **self.near_dup.stats(),
+            "recheck_pending": len(self.recheck_queue),
+            "recheck_failed": len(self.recheck_queue.failed),
+            "backends": self.llm_pool.stats(),
+            "priorities": self.scheduler.stats(),
+            **(self.case_index.stats() if self.case_index is not None else {}),
+            **(self.auditor.stats() if self.auditor is not None else {}),
+            **(self.shadow.stats() if self.shadow is not None else {}),
         }
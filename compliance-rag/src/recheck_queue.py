@@ -0,0 +1,89 @@
+# src/recheck_queue.py
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .circuit_breaker import CircuitOpenError
+from .concurrency import classify_error
+
+
+class RecheckQueue:
+    """
+    降级判定的待复核队列。LLM 恢复后由后台线程逐条重新走 LLM 判定，
+    复核结果保存在 rechecked 中（有上限），也可通过 on_recheck 回调写到别处。
+    复核失败的条目放到队尾重试；不可重试的错误（如内容审核拒绝的 400）或失败 max_attempts 次后
+    移入 failed，不再阻塞后面的条目。熔断器重新打开导致的失败不计次数。
+    """
+
+    def __init__(self, maxlen: int = 100000, keep_results: int = 10000, max_attempts: int = 5,
+                 on_recheck: Optional[Callable[[str, Dict[str, Any], Dict[str, Any]], None]] = None):
+        self._pending: Deque[Tuple[str, Dict[str, Any], int]] = deque(maxlen=maxlen)
+        self.rechecked: Deque[Tuple[str, Dict[str, Any]]] = deque(maxlen=keep_results)
+        self.failed: Deque[Tuple[str, Dict[str, Any], str]] = deque(maxlen=keep_results)
+        self.max_attempts = max_attempts
+        self.on_recheck = on_recheck
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, text: str, degraded_result: Dict[str, Any]) -> None:
+        with self._cond:
+            self._pending.append((text, degraded_result, 0))
+            self._cond.notify_all()
+
+    def pending(self) -> List[str]:
+        with self._cond:
+            return [text for text, _, _ in self._pending]
+
+    def start(self, recheck: Callable[[str], Dict[str, Any]],
+              is_available: Callable[[], bool], poll_interval: float = 2.0) -> None:
+        """启动后台复核线程（幂等）。is_available 为 False 时线程只等待不消费。"""
+        with self._cond:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._drain, args=(recheck, is_available, poll_interval),
+                name="llm-recheck", daemon=True,
+            )
+            self._worker.start()
+
+    def _drain(self, recheck, is_available, poll_interval) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            if not is_available():
+                time.sleep(poll_interval)
+                continue
+            with self._cond:
+                if not self._pending:
+                    continue
+                text, degraded, attempts = self._pending.popleft()
+            try:
+                result = recheck(text)
+            except Exception as e:
+                self._retry_or_park(text, degraded, attempts, e)
+                time.sleep(poll_interval)
+                continue
+            self.rechecked.append((text, result))
+            if self.on_recheck:
+                try:
+                    self.on_recheck(text, degraded, result)
+                except Exception as e:
+                    print(f"复核回调出错: {e}")
+
+    def _retry_or_park(self, text: str, degraded: Dict[str, Any], attempts: int, error: Exception) -> None:
+        """熔断打开：不计次数放回队尾；不可重试或次数用尽：移入 failed；其余计次后放回队尾"""
+        with self._cond:
+            if isinstance(error, CircuitOpenError):
+                self._pending.append((text, degraded, attempts))
+                return
+            attempts += 1
+            if classify_error(error) == "fatal" or attempts >= self.max_attempts:
+                self.failed.append((text, degraded, f"{type(error).__name__}: {error}"))
+                print(f"复核放弃（第 {attempts} 次失败）: {type(error).__name__}: {error}")
+                return
+            self._pending.append((text, degraded, attempts))
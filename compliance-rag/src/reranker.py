@@ -0,0 +1,64 @@
+# src/reranker.py
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+DEFAULT_RERANKER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+class CrossEncoderReranker:
+    """
+    CPU 交叉编码器重排：对 (查询, 候选) 成对打分，保留分数最高且超过 min_score 的 top_k。
+    分数按 (查询, 候选) 做 LRU 缓存——规则文档和 few-shot 示例是固定集合，
+    模板化话术反复出现时大部分打分可以直接命中缓存。
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANKER_MODEL, batch_size: int = 16,
+                 cache_size: int = 100000, max_length: int = 256, model=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.max_length = max_length
+        self._model = model
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+
+            self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        return self._model
+
+    def score(self, query: str, candidates: Sequence[str]) -> List[float]:
+        scores: List[Optional[float]] = []
+        missing = []
+        with self._lock:
+            for i, cand in enumerate(candidates):
+                cached = self._cache.get((query, cand))
+                if cached is not None:
+                    self._cache.move_to_end((query, cand))
+                else:
+                    missing.append(i)
+                scores.append(cached)
+        if missing:
+            pairs = [(query, candidates[i]) for i in missing]
+            fresh = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            with self._lock:
+                for i, value in zip(missing, fresh):
+                    scores[i] = float(value)
+                    self._cache[(query, candidates[i])] = float(value)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, candidates: Sequence[str], top_k: int,
+               min_score: Optional[float] = None) -> List[Tuple[int, float]]:
+        """返回 [(候选下标, 分数)]，按分数降序"""
+        if not candidates:
+            return []
+        ranked = sorted(enumerate(self.score(query, candidates)), key=lambda x: x[1], reverse=True)
+        if min_score is not None:
+            ranked = [r for r in ranked if r[1] >= min_score]
+        return ranked[:top_k]
@@ -0,0 +1,266 @@
+# src/result_store.py
+"""
+持久化判定结果库：Parquet 列存 + SQLite 索引。
+
+    <root>/parquet/date=2024-05-01/part-<时间戳>-<随机串>.parquet   每次 append 写一个新分片
+    <root>/index.sqlite                                              (会话, 坐席, 事件, 规则版本, 日期) -> (分片, 行号)
+
+- 追加写：分片文件名唯一，多线程 / 多进程并发写入互不覆盖；索引表用 WAL + busy_timeout
+- 查询：先在 SQLite 上按条件筛出 (分片, 行号)，只读取涉及的 Parquet 分片
+- 一条结果触发多个事件时，索引中每个事件一行；不违规的结果事件记为空串
+"""
+import datetime as dt
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .local_screen import split_events
+
+COLUMNS = ["ts", "date", "conversation_id", "agent", "text", "violation",
+           "triggered_event", "reason", "source", "rule_version", "degraded"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdict_index (
+    part TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    ts REAL NOT NULL,
+    conversation_id TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    event TEXT NOT NULL,
+    rule_version TEXT NOT NULL,
+    violation INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_event_agent_date ON verdict_index(event, agent, date);
+CREATE INDEX IF NOT EXISTS idx_agent_date ON verdict_index(agent, date);
+CREATE INDEX IF NOT EXISTS idx_conversation ON verdict_index(conversation_id);
+CREATE INDEX IF NOT EXISTS idx_rule_version ON verdict_index(rule_version, event);
+CREATE INDEX IF NOT EXISTS idx_date ON verdict_index(date);
+"""
+
+
+def _as_date(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (dt.date, dt.datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+def parse_ts(value: Any) -> float:
+    """
+    时间戳 -> epoch 秒。接受 epoch 秒/毫秒（数字或数字字符串）、ISO 字符串、datetime/date；
+    不带时区的按本地时间。None 或空串取当前时间，无法解析、非有限值或超出日期范围时抛 ValueError
+    """
+    if value is None or value == "":
+        return time.time()
+    if isinstance(value, bool):
+        raise ValueError(f"无法解析时间戳 ts={value!r}")
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+    if isinstance(value, (int, float)):
+        # 13 位的按毫秒
+        return _checked_ts(float(value) / 1000 if abs(value) > 1e11 else float(value), value)
+    import pandas as pd
+
+    try:
+        stamp = pd.Timestamp(value)
+    except (ValueError, TypeError, OverflowError) as e:
+        raise ValueError(f"无法解析时间戳 ts={value!r}") from e
+    if stamp is pd.NaT:
+        raise ValueError(f"无法解析时间戳 ts={value!r}")
+    return _checked_ts(stamp.to_pydatetime().timestamp(), value)
+
+
+def _checked_ts(ts: float, value: Any) -> float:
+    """拒绝 inf/nan 以及 fromtimestamp 无法表示的时间，保证 make_record 不会再抛 OverflowError"""
+    if not math.isfinite(ts):
+        raise ValueError(f"时间戳不是有限值 ts={value!r}")
+    try:
+        dt.datetime.fromtimestamp(ts)
+    except (OverflowError, OSError, ValueError) as e:
+        raise ValueError(f"时间戳超出范围 ts={value!r}") from e
+    return ts
+
+
+def make_record(text: str, result: Dict[str, Any], conversation_id: str = "", agent: str = "",
+                ts: Any = None) -> Dict[str, Any]:
+    """predict 结果 -> 结果库记录；ts 见 parse_ts，无法解析时抛 ValueError"""
+    ts = parse_ts(ts)
+    return {
+        "ts": ts,
+        "date": dt.datetime.fromtimestamp(ts).strftime("%Y-%m-%d"),
+        "conversation_id": conversation_id or "",
+        "agent": agent or "",
+        "text": text,
+        "violation": bool(result["violation"]),
+        "triggered_event": result["triggered_event"],
+        "reason": result.get("reason", ""),
+        "source": result.get("source", "llm"),
+        "rule_version": result.get("rule_version", ""),
+        "degraded": bool(result.get("degraded")),
+    }
+
+
+def parse_input_line(line: str, conversation_id: str = "") -> Dict[str, Any]:
+    """
+    批量输入的一行：纯文本，或带元数据的 JSON
+    {"text": ..., "agent": ..., "conversation_id": ..., "ts": ...}
+    """
+    line = line.strip()
+    if line.startswith("{"):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and "text" in data:
+            return {
+                "text": str(data["text"]),
+                "agent": str(data.get("agent", "")),
+                "conversation_id": str(data.get("conversation_id", conversation_id)),
+                "ts": data.get("ts"),
+            }
+    return {"text": line, "agent": "", "conversation_id": conversation_id, "ts": None}
+
+
+class ResultStore:
+    """见模块说明"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or os.getenv("RESULT_STORE_DIR", "results"))
+        self.parquet_dir = self.root / "parquet"
+        self.parquet_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.sqlite"
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程共享，每个线程一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.index_path), timeout=30)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def append(self, records: Sequence[Dict[str, Any]]) -> int:
+        """追加一批记录（make_record 的输出），按日期写入各自分区，返回写入条数"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        by_date: Dict[str, List[Dict[str, Any]]] = {}
+        for r in records:
+            by_date.setdefault(r["date"], []).append(r)
+
+        index_rows = []
+        for date, rows in by_date.items():
+            part_dir = self.parquet_dir / f"date={date}"
+            part_dir.mkdir(parents=True, exist_ok=True)
+            name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+            table = pa.table({c: [r[c] for r in rows] for c in COLUMNS})
+            # 先写临时文件再改名，查询方不会读到写了一半的分片
+            tmp = part_dir / (name + ".tmp")
+            pq.write_table(table, tmp, compression="zstd")
+            os.replace(tmp, part_dir / name)
+            part = f"date={date}/{name}"
+            for i, r in enumerate(rows):
+                for event in split_events(r["triggered_event"]) or [""]:
+                    index_rows.append((part, i, date, r["ts"], r["conversation_id"], r["agent"],
+                                       event, r["rule_version"], int(r["violation"])))
+
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT INTO verdict_index VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", index_rows)
+        return len(records)
+
+    @staticmethod
+    def _where(event=None, agent=None, conversation_id=None, rule_version=None,
+               start=None, end=None, violation=None):
+        clauses, params = [], []
+        for column, value in (("event", event), ("agent", agent),
+                              ("conversation_id", conversation_id), ("rule_version", rule_version)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(_as_date(start))
+        if end is not None:
+            clauses.append("date <= ?")
+            params.append(_as_date(end))
+        if violation is not None:
+            clauses.append("violation = ?")
+            params.append(int(violation))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, event: Optional[str] = None, agent: Optional[str] = None,
+              conversation_id: Optional[str] = None, rule_version: Optional[str] = None,
+              start: Any = None, end: Any = None, violation: Optional[bool] = None,
+              columns: Optional[Iterable[str]] = None, limit: Optional[int] = None):
+        """
+        按条件查询，返回 DataFrame（按时间排序）。
+        例：query(event="与客户进行私下联系", agent="X", start="2024-04-01", end="2024-04-30")
+        """
+        import pandas as pd
+        import pyarrow.parquet as pq
+
+        where, params = self._where(event, agent, conversation_id, rule_version, start, end, violation)
+        sql = f"SELECT DISTINCT part, row FROM verdict_index{where} ORDER BY ts"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        located = self._connect().execute(sql, params).fetchall()
+
+        columns = list(columns) if columns else COLUMNS
+        rows_by_part: Dict[str, List[int]] = {}
+        for part, row in located:
+            rows_by_part.setdefault(part, []).append(row)
+        frames = []
+        for part, rows in rows_by_part.items():
+            table = pq.read_table(self.parquet_dir / part, columns=columns)
+            frames.append(table.take(rows).to_pandas())
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(frames, ignore_index=True)
+        return df.sort_values("ts", ignore_index=True) if "ts" in df.columns else df
+
+    def summary(self, group_by: Sequence[str] = ("event",), **filters) -> List[Dict[str, Any]]:
+        """只走索引的聚合统计，如 summary(("agent", "event"), start=..., violation=True)"""
+        allowed = {"event", "agent", "conversation_id", "rule_version", "date"}
+        unknown = set(group_by) - allowed
+        if unknown:
+            raise ValueError(f"不支持的分组字段: {unknown}")
+        where, params = self._where(**filters)
+        cols = ", ".join(group_by)
+        sql = (f"SELECT {cols}, COUNT(DISTINCT part || ':' || row) AS n "
+               f"FROM verdict_index{where} GROUP BY {cols} ORDER BY n DESC")
+        cursor = self._connect().execute(sql, params)
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def scan(self, start: Any = None, end: Any = None, columns: Optional[Iterable[str]] = None):
+        """按日期分区整段读取（全量分析用，不经过索引）"""
+        import pandas as pd
+        import pyarrow.parquet as pq
+
+        start, end = _as_date(start), _as_date(end)
+        frames = []
+        for part_dir in sorted(self.parquet_dir.glob("date=*")):
+            date = part_dir.name[len("date="):]
+            if (start and date < start) or (end and date > end):
+                continue
+            for part in sorted(part_dir.glob("*.parquet")):
+                frames.append(pq.read_table(part, columns=list(columns) if columns else None).to_pandas())
+        if not frames:
+            return pd.DataFrame(columns=list(columns) if columns else COLUMNS)
+        return pd.concat(frames, ignore_index=True)
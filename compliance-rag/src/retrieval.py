@@ -0,0 +1,69 @@
+# src/retrieval.py
+import threading
+from typing import Any, List, Optional, Tuple
+
+from .document_builder import build_example_documents, build_rule_documents
+from .local_screen import canonical_event
+from .reranker import CrossEncoderReranker
+from .schemas import ComplianceRule
+
+
+class RuleRetriever:
+    """
+    检索裁剪 Prompt 用的规则/示例召回：
+    1. FAISS 向量召回 fetch_k 条规则文档、example_fetch_k 条 few-shot 示例
+    2. 配置了 reranker 时用交叉编码器重排，只保留 top_k / example_k 条且分数不低于 min_score
+    没有 reranker 时直接取向量相似度最高的 top_k。
+    """
+
+    def __init__(self, rules: List[ComplianceRule], embeddings: Any = None,
+                 reranker: Optional[CrossEncoderReranker] = None,
+                 fetch_k: int = 8, top_k: int = 4,
+                 example_fetch_k: int = 10, example_k: int = 4,
+                 min_score: Optional[float] = None):
+        self.rules = rules
+        self.reranker = reranker
+        self.fetch_k = fetch_k
+        self.top_k = top_k
+        self.example_fetch_k = example_fetch_k
+        self.example_k = example_k
+        self.min_score = min_score
+        self._embeddings = embeddings
+        self._rule_store = None
+        self._example_store = None
+        self._lock = threading.Lock()
+
+    def _ensure_index(self) -> None:
+        if self._rule_store is not None:
+            return
+        with self._lock:
+            if self._rule_store is not None:
+                return
+            from langchain_community.vectorstores import FAISS
+
+            if self._embeddings is None:
+                from .embeddings import load_embeddings
+                self._embeddings = load_embeddings()
+            example_docs = build_example_documents(self.rules)
+            if example_docs:
+                self._example_store = FAISS.from_documents(example_docs, self._embeddings)
+            self._rule_store = FAISS.from_documents(build_rule_documents(self.rules), self._embeddings)
+
+    def _select(self, text: str, docs: List[Any], k: int) -> List[Any]:
+        if self.reranker is None:
+            return docs[:k]
+        ranked = self.reranker.rerank(text, [d.page_content for d in docs], k, self.min_score)
+        return [docs[i] for i, _ in ranked]
+
+    def retrieve(self, text: str) -> Tuple[List[str], List[Tuple[str, bool, str]]]:
+        """返回 (规则标题列表, [(示例文本, 是否违规, 理由)])"""
+        self._ensure_index()
+        rule_docs = self._rule_store.similarity_search(text, k=self.fetch_k)
+        titles = [canonical_event(d.metadata["event_name"]) for d in self._select(text, rule_docs, self.top_k)]
+
+        examples = []
+        if self._example_store is not None and self.example_k > 0:
+            example_docs = self._example_store.similarity_search(text, k=self.example_fetch_k)
+            for d in self._select(text, example_docs, self.example_k):
+                examples.append((d.page_content, bool(d.metadata["violation"]), d.metadata["reason"]))
+        return titles, examples
@@ -0,0 +1,95 @@
+# src/rule_shards.py
+"""
+规则分片并行判定。
+
+Prompt 要求“以上规则单独判断”，所以可以把规则拆成若干分片，每个分片一个短 Prompt
+并发调用，再把各分片结论合并成 predict 的单个结果。分片来源：
+1. 显式配置（YAML 文件 / 环境变量 RULE_SHARDS_FILE），格式为规则标题列表的列表
+2. 按 risk_level 分组，组内再按 max_shard_size 切分
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import yaml
+
+from .local_screen import canonical_event, join_events, split_events
+from .prompts import RULE_TITLES
+from .schemas import ComplianceRule
+
+Shard = Tuple[str, ...]
+
+
+def _ordered(titles: Iterable[str], all_titles: Sequence[str] = RULE_TITLES) -> Shard:
+    wanted = set(titles)
+    return tuple(t for t in all_titles if t in wanted)
+
+
+def shards_by_risk_level(rules: List[ComplianceRule], max_shard_size: int = 4,
+                         titles: Sequence[str] = RULE_TITLES) -> List[Shard]:
+    """同一风险等级的规则放在一起，超过 max_shard_size 再切分；规则文件中没有的标题单独成组"""
+    groups: Dict[str, List[str]] = {}
+    for rule in rules:
+        event = canonical_event(rule.event_name)
+        if event in titles:
+            groups.setdefault(rule.risk_level, []).append(event)
+    covered = {e for events in groups.values() for e in events}
+    rest = [t for t in titles if t not in covered]
+    if rest:
+        groups.setdefault("其他", []).extend(rest)
+
+    shards = []
+    for events in groups.values():
+        events = list(_ordered(events, titles))
+        for i in range(0, len(events), max_shard_size):
+            shards.append(tuple(events[i:i + max_shard_size]))
+    return shards
+
+
+def load_shards(config_file: Optional[str] = None,
+                titles: Sequence[str] = RULE_TITLES) -> Optional[List[Shard]]:
+    """读取分片配置（YAML: shards: [[规则标题, ...], ...]），未配置返回 None"""
+    config_file = config_file or os.getenv("RULE_SHARDS_FILE")
+    if not config_file:
+        return None
+    with open(config_file, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    shards = []
+    for group in data.get("shards", []):
+        unknown = [t for t in group if canonical_event(t) not in titles]
+        if unknown:
+            raise ValueError(f"分片配置中存在未知规则: {unknown}")
+        shards.append(_ordered((canonical_event(t) for t in group), titles))
+    covered = {t for shard in shards for t in shard}
+    missing = [t for t in titles if t not in covered]
+    if missing:
+        # 未列出的规则不能被静默丢弃，合成最后一个分片
+        shards.append(tuple(missing))
+    return [s for s in shards if s]
+
+
+def restrict_shards(shards: Sequence[Shard], scope: Iterable[str]) -> List[Shard]:
+    """把分片限制在 scope 内（去掉数值规则已确定的规则等），空分片丢弃"""
+    scope = set(scope)
+    restricted = [tuple(t for t in shard if t in scope) for shard in shards]
+    return [s for s in restricted if s]
+
+
+def merge_shard_verdicts(results: List[Tuple[Shard, Dict[str, Any]]]) -> Dict[str, Any]:
+    """合并各分片结论：触发事件取并集（只认本分片内的规则），理由按分片拼接"""
+    events, reasons, raws = [], [], []
+    for shard, result in results:
+        shard_events = [e for e in split_events(result["triggered_event"]) if e in shard]
+        for e in shard_events:
+            if e not in events:
+                events.append(e)
+        if shard_events:
+            reasons.append(f"【{'/'.join(shard_events)}】{result['reason']}")
+        raws.append(result["raw_response"])
+    return {
+        "raw_response": "\n\n".join(raws),
+        "violation": bool(events),
+        "triggered_event": join_events(events),
+        "reason": "\n".join(reasons) if reasons else "各规则分片均未发现违规",
+        "degraded": False,
+        "shards": len(results),
+    }
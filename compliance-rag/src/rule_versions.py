@@ -0,0 +1,245 @@
+# src/rule_versions.py
+"""
+规则集版本与增量复审。
+
+1. RuleSetVersion：每条规则（YAML 定义 + Prompt 中对应段落）一个内容哈希，
+   整个规则集的版本号由逐条哈希再求哈希得到
+2. RuleVersionRegistry：版本号 -> 逐条哈希，存放在判定日志旁边的 JSON 文件里，
+   旧版本的规则内容不用保留，只要能比较出哪些规则变了
+3. 每条判定记录（VerdictLog）带上 rule_version、in_scope（交给 LLM 判断的规则）、
+   prescreen（关键词命中 / 数值规则未排除的规则）和 events（触发的规则）
+4. plan_reaudit：规则变更后，只有“预筛命中涉及变更规则”或“之前被变更规则判违规”
+   的文本需要重新判定；预筛同时按新旧两套规则计算，新增关键词命中的文本也会被选中
+
+命令行：
+    python -m src.rule_versions diff --log verdicts.jsonl
+    python -m src.rule_versions reaudit --log verdicts.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from .distill import VerdictLog
+from .local_screen import RuleMatcher, canonical_event, split_events
+from .normalizer import TextNormalizer
+from .numeric_rules import NumericVerdict
+from .prompts import RULE_SECTIONS
+from .schemas import ComplianceRule
+
+
+def _digest(payload: str) -> str:
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+class RuleSetVersion:
+    """规则集版本：{规则标题: 内容哈希}，id 为整体哈希"""
+
+    def __init__(self, hashes: Dict[str, str]):
+        self.hashes = dict(sorted(hashes.items()))
+        self.id = _digest(json.dumps(self.hashes, ensure_ascii=False))
+
+    @classmethod
+    def from_rules(cls, rules: List[ComplianceRule],
+                   sections: Optional[Dict[str, str]] = None) -> "RuleSetVersion":
+        """sections 为该规则集使用的 Prompt 段落，默认内置段落"""
+        sections = RULE_SECTIONS if sections is None else sections
+        hashes = {}
+        for rule in rules:
+            event = canonical_event(rule.event_name)
+            payload = json.dumps(rule.model_dump(), ensure_ascii=False, sort_keys=True)
+            hashes[event] = _digest(payload + "\n" + sections.get(event, ""))
+        # 只在 Prompt 中出现、规则文件里没有的规则也纳入版本
+        for event, section in sections.items():
+            hashes.setdefault(event, _digest(section))
+        return cls(hashes)
+
+    def changed_since(self, old: Dict[str, str]) -> Set[str]:
+        """与旧版本相比新增、删除或内容变化的规则"""
+        return {e for e in set(old) | set(self.hashes) if old.get(e) != self.hashes.get(e)}
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """跨进程互斥锁（<path>.lock 上的独占锁），web 应用、worker 和命令行共用同一个版本文件"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(path) + ".lock", "a+b") as f:
+        try:
+            import fcntl
+        except ImportError:  # Windows
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class RuleVersionRegistry:
+    """
+    版本号 -> 逐条规则哈希（JSON 文件）。多个进程共用同一个文件：
+    注册时在文件锁内重新读取并合并，再写临时文件后原子替换，不会截断或丢失其他进程写入的版本
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._versions: Dict[str, Dict[str, str]] = self._read()
+
+    def _read(self) -> Dict[str, Dict[str, str]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @classmethod
+    def for_log(cls, log: VerdictLog) -> "RuleVersionRegistry":
+        return cls(str(log.path.with_suffix(".versions.json")))
+
+    def register(self, version: RuleSetVersion) -> None:
+        with self._lock:
+            if version.id in self._versions:
+                return
+            with _file_lock(self.path):
+                versions = self._read()
+                versions.update(self._versions)
+                versions[version.id] = version.hashes
+                tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(versions, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            self._versions = versions
+
+    def get(self, version_id: str) -> Optional[Dict[str, str]]:
+        """本进程未见过的版本从文件重新读取（可能由其他进程注册）"""
+        with self._lock:
+            if version_id not in self._versions:
+                self._versions = {**self._read(), **self._versions}
+            return self._versions.get(version_id)
+
+
+def prescreen_events(hits: Dict[str, List[Any]], numeric: Dict[str, NumericVerdict]) -> List[str]:
+    """预筛涉及的规则：关键词命中的规则 + 数值规则判定违规或无法确定的规则"""
+    events = set(hits) | {e for e, v in numeric.items() if v.triggered is not False}
+    return sorted(events)
+
+
+def latest_records(log: VerdictLog) -> Dict[str, Dict[str, Any]]:
+    """日志为追加写，同一文本以最后一条记录为准"""
+    latest = {}
+    for record in log:
+        latest[record["text"]] = record
+    return latest
+
+
+def plan_reaudit(log: VerdictLog, registry: RuleVersionRegistry, current: RuleSetVersion,
+                 rules: List[ComplianceRule], evaluate_numeric=None) -> Dict[str, Any]:
+    """
+    计算需要重新判定的最小文本集合。
+    evaluate_numeric 为 NumericRuleEvaluator().evaluate，传入时预筛包含数值规则。
+    返回 {"texts": [...], "changed": {旧版本: [变更规则]}, "total": 记录数, "unknown_version": 数量}
+    """
+    normalizer = TextNormalizer.from_rules(rules)
+    matcher = RuleMatcher(rules, normalizer=normalizer)
+    changed_by_version: Dict[str, Set[str]] = {}
+    texts, unknown = [], 0
+    records = latest_records(log)
+    for text, record in records.items():
+        version_id = record.get("rule_version")
+        if version_id == current.id:
+            continue
+        old = registry.get(version_id) if version_id else None
+        if old is None:
+            # 没有版本信息的历史记录无法判断影响范围，只能重判
+            unknown += 1
+            texts.append(text)
+            continue
+        changed = changed_by_version.get(version_id)
+        if changed is None:
+            changed = changed_by_version[version_id] = current.changed_since(old)
+        if not changed:
+            continue
+        touched = set(record.get("prescreen", [])) | set(record.get("events", []))
+        if not touched & changed:
+            normalized = normalizer.normalize(text)
+            numeric = evaluate_numeric(normalized) if evaluate_numeric else {}
+            touched = set(prescreen_events(matcher.match(normalized), numeric))
+        if touched & changed:
+            texts.append(text)
+    return {
+        "texts": texts,
+        "changed": {v: sorted(c) for v, c in changed_by_version.items()},
+        "total": len(records),
+        "unknown_version": unknown,
+    }
+
+
+def run_reaudit(engine, texts: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """用当前规则重新判定选中的文本，新结论由引擎追加写入判定日志"""
+    texts = list(texts)
+    log = engine.verdict_log
+    previous = latest_records(log) if log is not None else {}
+    results = engine.predict_batch(texts, max_workers) if texts else []
+    flipped = []
+    for text, result in zip(texts, results):
+        old = previous.get(text)
+        new_events = split_events(result["triggered_event"])
+        if old is not None and set(old["events"]) != set(new_events):
+            flipped.append({"text": text, "before": old["events"], "after": new_events})
+    return {"rejudged": len(texts), "flipped": flipped}
+
+
+def main():
+    from .numeric_rules import NumericRuleEvaluator
+    from .rule_loader import load_all_rules
+
+    parser = argparse.ArgumentParser(description="规则变更后的增量复审")
+    parser.add_argument("cmd", choices=["diff", "reaudit"])
+    parser.add_argument("--log", required=True)
+    parser.add_argument("--rules", default=str(Path(__file__).parent / "compliance_rules.yaml"))
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    rules = load_all_rules(args.rules)
+    log = VerdictLog(args.log)
+    registry = RuleVersionRegistry.for_log(log)
+    current = RuleSetVersion.from_rules(rules)
+    plan = plan_reaudit(log, registry, current, rules, NumericRuleEvaluator().evaluate)
+    print(f"当前规则版本: {current.id}")
+    for version_id, changed in plan["changed"].items():
+        print(f"  相对 {version_id} 变更的规则: {'、'.join(changed) or '无'}")
+    print(f"需要重新判定 {len(plan['texts'])}/{plan['total']} 条（其中无版本信息 {plan['unknown_version']} 条）")
+    if args.cmd == "diff":
+        return
+
+    from .rag_engine import ComplianceRAGEngine
+
+    engine = ComplianceRAGEngine(args.rules, verdict_log_file=args.log)
+    report = run_reaudit(engine, plan["texts"], args.workers)
+    print(f"已重新判定 {report['rejudged']} 条，结论变化 {len(report['flipped'])} 条")
+    for item in report["flipped"]:
+        print(f"  {item['before']} -> {item['after']}: {item['text'][:60]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,669 @@
+# src/safe_regex.py
+"""
+规则正则的线性时间匹配。
+
+规则 YAML 里的 regex_patterns 和正则式关键词（赚\\d+元、收益\\d+% 等）由合规同事编写，
+Python re 是回溯引擎，一个写法不当的模式（如 (\\d+)+元）在长聊天文本上可能把一个 CPU 核跑满。
+这里用自动机实现规则正则：
+- 解析：只接受正则语言内的语法（字面量、. 、字符类、\\d\\w\\s 及其否定、分组、|、* + ? {m,n}、^ $）；
+  反向引用、环视、原子组、占有量词等无法线性匹配的写法在编译期拒绝
+- 复杂度检查：嵌套的无界量词（(a+)+ 之类，回溯引擎下的灾难性写法）、过大的计数重复、
+  展开后状态数超过上限的模式都在编译期拒绝
+- 匹配：所有模式编译成一个 Thompson NFA，按需构造 DFA（子集构造 + 转移缓存），
+  每个字符的处理代价只与程序大小有关，整体对文本长度线性；缓存超过上限时换新缓存，内存有界
+- 归因：一次扫描得到每个模式最早的结束位置，再用该模式的反向自动机求最左起点、
+  正向锚定自动机求最长终点，得到命中区间
+- 预过滤：每个模式提取必须出现的字面量，文本中都不出现时不运行自动机
+匹配默认忽略大小写（与原来 re.IGNORECASE 一致）；$ 只匹配文本末尾。
+"""
+import argparse
+import threading
+import time
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+MAX_PATTERN_STATES = 5_000
+MAX_PROGRAM_STATES = 100_000
+MAX_REPEAT = 1_000
+MAX_DFA_STATES = 10_000
+
+Span = Tuple[int, int]
+
+
+class RegexSafetyError(ValueError):
+    """模式不合法，或包含无法线性匹配 / 回溯下有灾难性风险的写法"""
+
+
+# ---------- 字符集 ----------
+_CLASS_TESTS = {
+    "d": str.isdecimal,
+    "w": lambda c: c.isalnum() or c == "_",
+    "s": str.isspace,
+}
+
+
+class CharSet:
+    """字符集：区间 + 类别（d/w/s 及大写否定），可整体取反；ignore_case 时同时检查大小写形式"""
+
+    __slots__ = ("ranges", "classes", "negate", "ignore_case")
+
+    def __init__(self, ranges=(), classes=(), negate: bool = False, ignore_case: bool = True):
+        self.ranges = tuple(ranges)
+        self.classes = tuple(classes)
+        self.negate = negate
+        self.ignore_case = ignore_case
+
+    @classmethod
+    def any_but_newline(cls) -> "CharSet":
+        return cls(ranges=[("\n", "\n")], negate=True, ignore_case=False)
+
+    def _test(self, c: str) -> bool:
+        for lo, hi in self.ranges:
+            if lo <= c <= hi:
+                return True
+        for name in self.classes:
+            if _CLASS_TESTS[name.lower()](c) != name.isupper():
+                return True
+        return False
+
+    def matches(self, c: str) -> bool:
+        hit = self._test(c)
+        if not hit and self.ignore_case:
+            for variant in (c.lower(), c.upper()):
+                if len(variant) == 1 and variant != c and self._test(variant):
+                    hit = True
+                    break
+        return hit != self.negate
+
+    def single(self) -> Optional[str]:
+        """只含一个无大小写区别的字符时返回该字符（用于提取必现字面量）"""
+        if self.negate or self.classes or len(self.ranges) != 1:
+            return None
+        lo, hi = self.ranges[0]
+        if lo != hi or (self.ignore_case and lo.lower() != lo.upper()):
+            return None
+        return lo
+
+
+# ---------- 解析 ----------
+class _Parser:
+    """正则源码 -> 语法树：("lit", CharSet) / ("cat", [...]) / ("alt", [...]) / ("rep", node, min, max) /
+    ("bol",) / ("eol",) / ("empty",)"""
+
+    def __init__(self, pattern: str, ignore_case: bool):
+        self.s = pattern
+        self.i = 0
+        self.ignore_case = ignore_case
+
+    def error(self, message: str) -> RegexSafetyError:
+        return RegexSafetyError(f"{message}（位置 {self.i}）: {self.s}")
+
+    def peek(self) -> Optional[str]:
+        return self.s[self.i] if self.i < len(self.s) else None
+
+    def parse(self):
+        node = self.parse_alt()
+        if self.i < len(self.s):
+            raise self.error("多余的右括号")
+        return node
+
+    def parse_alt(self):
+        branches = [self.parse_cat()]
+        while self.peek() == "|":
+            self.i += 1
+            branches.append(self.parse_cat())
+        return branches[0] if len(branches) == 1 else ("alt", branches)
+
+    def parse_cat(self):
+        items = []
+        while self.peek() not in (None, "|", ")"):
+            items.append(self.parse_repeat())
+        if not items:
+            return ("empty",)
+        return items[0] if len(items) == 1 else ("cat", items)
+
+    def parse_repeat(self):
+        node = self.parse_atom()
+        quantified = False
+        while True:
+            bounds = self.parse_quantifier()
+            if bounds is None:
+                return node
+            if quantified:
+                raise self.error("重复的量词")
+            if node[0] in ("bol", "eol"):
+                raise self.error("锚点不能加量词")
+            lo, hi = bounds
+            if self.peek() == "?":
+                # 非贪婪只影响回溯顺序，不影响是否命中
+                self.i += 1
+            elif self.peek() == "+":
+                raise self.error("不支持占有量词")
+            node = ("rep", node, lo, hi)
+            quantified = True
+
+    def parse_quantifier(self) -> Optional[Tuple[int, Optional[int]]]:
+        c = self.peek()
+        if c in ("*", "+", "?"):
+            self.i += 1
+            return {"*": (0, None), "+": (1, None), "?": (0, 1)}[c]
+        if c != "{":
+            return None
+        end = self.s.find("}", self.i)
+        body = self.s[self.i + 1:end] if end > 0 else ""
+        lo_text, comma, hi_text = body.partition(",")
+        if end < 0 or not (lo_text.isdigit() or (comma and not lo_text)) or (hi_text and not hi_text.isdigit()):
+            # 与 re 一致：不构成量词的 { 按字面量处理
+            return None
+        lo = int(lo_text) if lo_text else 0
+        hi = (int(hi_text) if hi_text else None) if comma else lo
+        if hi is not None and hi < lo:
+            raise self.error("量词上界小于下界")
+        if max(lo, hi or 0) > MAX_REPEAT:
+            raise self.error(f"计数重复超过 {MAX_REPEAT}")
+        self.i = end + 1
+        return lo, hi
+
+    def parse_atom(self):
+        c = self.peek()
+        if c == "(":
+            self.i += 1
+            if self.s.startswith("?", self.i):
+                if self.s.startswith("?:", self.i):
+                    self.i += 2
+                elif self.s.startswith("?P<", self.i):
+                    close = self.s.find(">", self.i)
+                    if close < 0:
+                        raise self.error("命名分组不完整")
+                    self.i = close + 1
+                elif self.s.startswith(("?=", "?!", "?<=", "?<!"), self.i):
+                    raise self.error("不支持环视（无法线性匹配）")
+                elif self.s.startswith("?>", self.i):
+                    raise self.error("不支持原子分组")
+                elif self.s.startswith("?P=", self.i) or self.s.startswith("?(", self.i):
+                    raise self.error("不支持反向引用 / 条件分组")
+                else:
+                    raise self.error("不支持的分组语法（行内标志等）")
+            node = self.parse_alt()
+            if self.peek() != ")":
+                raise self.error("缺少右括号")
+            self.i += 1
+            return node
+        if c in ("*", "+", "?"):
+            raise self.error("量词前没有可重复的内容")
+        self.i += 1
+        if c == ".":
+            return ("lit", CharSet.any_but_newline())
+        if c == "^":
+            return ("bol",)
+        if c == "$":
+            return ("eol",)
+        if c == "[":
+            return ("lit", self.parse_class())
+        if c == "\\":
+            return self.parse_escape()
+        return ("lit", self.literal(c))
+
+    def literal(self, c: str) -> CharSet:
+        return CharSet(ranges=[(c, c)], ignore_case=self.ignore_case)
+
+    _SIMPLE_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "v": "\v", "a": "\a", "0": "\0"}
+
+    def escape_char(self) -> Tuple[Optional[str], Optional[str]]:
+        """读取反斜杠后的内容，返回 (字符, None) 或 (None, 类别名)"""
+        c = self.peek()
+        if c is None:
+            raise self.error("末尾的反斜杠")
+        self.i += 1
+        if c in "dDwWsS":
+            return None, c
+        if c in self._SIMPLE_ESCAPES:
+            return self._SIMPLE_ESCAPES[c], None
+        if c in "xuU":
+            width = {"x": 2, "u": 4, "U": 8}[c]
+            digits = self.s[self.i:self.i + width]
+            if len(digits) != width or any(d not in "0123456789abcdefABCDEF" for d in digits):
+                raise self.error(f"\\{c} 转义不完整")
+            self.i += width
+            return chr(int(digits, 16)), None
+        if c.isdigit():
+            raise self.error("不支持反向引用（无法线性匹配）")
+        if c in "bB":
+            raise self.error("不支持单词边界 \\b / \\B")
+        if c.isalnum():
+            raise self.error(f"未知的转义 \\{c}")
+        return c, None
+
+    def parse_escape(self):
+        c = self.peek()
+        if c == "A":
+            self.i += 1
+            return ("bol",)
+        if c == "Z":
+            self.i += 1
+            return ("eol",)
+        char, cls = self.escape_char()
+        if cls is not None:
+            return ("lit", CharSet(classes=[cls], ignore_case=self.ignore_case))
+        return ("lit", self.literal(char))
+
+    def parse_class(self) -> CharSet:
+        negate = self.peek() == "^"
+        if negate:
+            self.i += 1
+        ranges, classes = [], []
+        first = True
+        while True:
+            c = self.peek()
+            if c is None:
+                raise self.error("字符类缺少 ]")
+            if c == "]" and not first:
+                self.i += 1
+                break
+            first = False
+            self.i += 1
+            if c == "\\":
+                c, cls = self.escape_char()
+                if cls is not None:
+                    classes.append(cls)
+                    continue
+            if self.peek() == "-" and self.i + 1 < len(self.s) and self.s[self.i + 1] != "]":
+                self.i += 1
+                hi = self.peek()
+                self.i += 1
+                if hi == "\\":
+                    hi, cls = self.escape_char()
+                    if cls is not None:
+                        raise self.error("字符类区间的端点不能是类别")
+                if hi < c:
+                    raise self.error("字符类区间顺序错误")
+                ranges.append((c, hi))
+            else:
+                ranges.append((c, c))
+        return CharSet(ranges, classes, negate, self.ignore_case)
+
+
+def _nullable(node) -> bool:
+    kind = node[0]
+    if kind in ("empty", "bol", "eol"):
+        return True
+    if kind == "lit":
+        return False
+    if kind == "cat":
+        return all(_nullable(n) for n in node[1])
+    if kind == "alt":
+        return any(_nullable(n) for n in node[1])
+    return node[2] == 0 or _nullable(node[1])
+
+
+def _check_nesting(node, pattern: str, inside_unbounded: bool = False) -> None:
+    """回溯引擎下的灾难性写法：无界量词内再套无界量词，或对可空内容做无界重复"""
+    kind = node[0]
+    if kind in ("cat", "alt"):
+        for child in node[1]:
+            _check_nesting(child, pattern, inside_unbounded)
+    elif kind == "rep":
+        unbounded = node[3] is None
+        if unbounded and inside_unbounded:
+            raise RegexSafetyError(f"嵌套的无界量词（回溯时指数级）: {pattern}")
+        if unbounded and _nullable(node[1]):
+            raise RegexSafetyError(f"对可能为空的内容做无界重复: {pattern}")
+        _check_nesting(node[1], pattern, inside_unbounded or unbounded)
+
+
+def _reverse(node):
+    kind = node[0]
+    if kind == "cat":
+        return ("cat", [_reverse(n) for n in reversed(node[1])])
+    if kind == "alt":
+        return ("alt", [_reverse(n) for n in node[1]])
+    if kind == "rep":
+        return ("rep", _reverse(node[1]), node[2], node[3])
+    if kind == "bol":
+        return ("eol",)
+    if kind == "eol":
+        return ("bol",)
+    return node
+
+
+def _required_literal(node) -> str:
+    """文本中必须出现的最长字面量（只取无大小写区别的字符），没有时返回空串"""
+    kind = node[0]
+    if kind == "lit":
+        return node[1].single() or ""
+    if kind == "rep":
+        return _required_literal(node[1]) if node[2] >= 1 else ""
+    if kind != "cat":
+        return ""
+    best, run = "", ""
+    for child in node[1]:
+        char = child[1].single() if child[0] == "lit" else None
+        if char is not None:
+            run += char
+            continue
+        inner = _required_literal(child)
+        best = max(best, run, inner, key=len)
+        run = ""
+    return max(best, run, key=len)
+
+
+def parse(pattern: str, ignore_case: bool = True):
+    """解析并做复杂度检查，不合格时抛出 RegexSafetyError"""
+    node = _Parser(pattern, ignore_case).parse()
+    _check_nesting(node, pattern)
+    return node
+
+
+# ---------- NFA ----------
+_CHAR, _SPLIT, _BOL, _EOL, _MATCH = range(5)
+
+
+class _Program:
+    """Thompson NFA：states[i] = (类型, 参数, 后继列表)"""
+
+    def __init__(self):
+        self.states: List[list] = []
+
+    def add(self, kind: int, arg=None, outs=()) -> int:
+        self.states.append([kind, arg, list(outs)])
+        if len(self.states) > MAX_PROGRAM_STATES:
+            raise RegexSafetyError(f"规则正则展开后的状态数超过 {MAX_PROGRAM_STATES}")
+        return len(self.states) - 1
+
+    def emit(self, node, nxt: int) -> int:
+        kind = node[0]
+        if kind == "lit":
+            return self.add(_CHAR, node[1], [nxt])
+        if kind == "cat":
+            for child in reversed(node[1]):
+                nxt = self.emit(child, nxt)
+            return nxt
+        if kind == "alt":
+            return self.add(_SPLIT, None, [self.emit(child, nxt) for child in node[1]])
+        if kind == "bol":
+            return self.add(_BOL, None, [nxt])
+        if kind == "eol":
+            return self.add(_EOL, None, [nxt])
+        if kind == "empty":
+            return nxt
+        _, child, lo, hi = node
+        if hi is None:
+            loop = self.add(_SPLIT, None, [])
+            self.states[loop][2] = [self.emit(child, loop), nxt]
+            start = loop
+        else:
+            start = nxt
+            for _ in range(hi - lo):
+                start = self.add(_SPLIT, None, [self.emit(child, start), nxt])
+        for _ in range(lo):
+            start = self.emit(child, start)
+        return start
+
+    def compile(self, node, pattern_id: int, pattern: str) -> int:
+        before = len(self.states)
+        start = self.emit(node, self.add(_MATCH, pattern_id))
+        if len(self.states) - before > MAX_PATTERN_STATES:
+            raise RegexSafetyError(f"正则展开后的状态数超过 {MAX_PATTERN_STATES}: {pattern}")
+        return start
+
+
+class _DFACache:
+    def __init__(self):
+        self.sets: List[FrozenSet[int]] = []
+        self.ids: Dict[FrozenSet[int], int] = {}
+        self.trans: Dict[Tuple[int, str], int] = {}
+        self.accepts: List[FrozenSet[int]] = []
+
+
+class _LazyDFA:
+    """按需子集构造；unanchored=True 时每个位置都重新加入起始状态（即搜索）"""
+
+    def __init__(self, program: _Program, start: int, unanchored: bool):
+        self.program = program
+        self.start = start
+        self.unanchored = unanchored
+        self._lock = threading.Lock()
+        self._cache = _DFACache()
+        self._start_sets = (self._closure([start], at_begin=False), self._closure([start], at_begin=True))
+
+    def _closure(self, seeds, at_begin: bool, at_end: bool = False) -> FrozenSet[int]:
+        states = self.program.states
+        seen = set()
+        stack = list(seeds)
+        while stack:
+            s = stack.pop()
+            if s in seen:
+                continue
+            seen.add(s)
+            kind, _, outs = states[s]
+            if kind == _SPLIT or (kind == _BOL and at_begin) or (kind == _EOL and at_end):
+                stack.extend(outs)
+        return frozenset(seen)
+
+    def _accepts(self, nfa_set: FrozenSet[int]) -> FrozenSet[int]:
+        states = self.program.states
+        return frozenset(states[s][1] for s in nfa_set if states[s][0] == _MATCH)
+
+    def _intern(self, cache: _DFACache, nfa_set: FrozenSet[int]) -> int:
+        sid = cache.ids.get(nfa_set)
+        if sid is None:
+            sid = cache.ids[nfa_set] = len(cache.sets)
+            cache.sets.append(nfa_set)
+            cache.accepts.append(self._accepts(nfa_set))
+        return sid
+
+    def cache(self) -> _DFACache:
+        """一次扫描固定使用同一个缓存对象；缓存满时换新对象，正在进行的扫描不受影响"""
+        if len(self._cache.sets) > MAX_DFA_STATES:
+            self._cache = _DFACache()
+        return self._cache
+
+    def start_state(self, cache: _DFACache, at_begin: bool) -> int:
+        with self._lock:
+            return self._intern(cache, self._start_sets[at_begin])
+
+    def step(self, cache: _DFACache, sid: int, ch: str) -> int:
+        nxt = cache.trans.get((sid, ch))
+        if nxt is not None:
+            return nxt
+        states = self.program.states
+        seeds = [out for s in cache.sets[sid] if states[s][0] == _CHAR and states[s][1].matches(ch)
+                 for out in states[s][2]]
+        nfa_set = self._closure(seeds, at_begin=False)
+        if self.unanchored:
+            nfa_set = nfa_set | self._start_sets[False]
+        with self._lock:
+            nxt = cache.trans[(sid, ch)] = self._intern(cache, nfa_set)
+        return nxt
+
+    def final_accepts(self, cache: _DFACache, sid: int, at_begin: bool) -> FrozenSet[int]:
+        """文本末尾：允许 $ 成立后的接受集合"""
+        return self._accepts(self._closure(cache.sets[sid], at_begin=at_begin, at_end=True))
+
+    def is_dead(self, cache: _DFACache, sid: int) -> bool:
+        return not cache.sets[sid]
+
+
+class MultiPattern:
+    """
+    多个正则编译成一个程序，一次扫描给出每个模式的命中区间。
+    不合格的模式不会进入程序，原因记在 rejected 中（{模式下标: 原因}）
+    """
+
+    def __init__(self, patterns: Sequence[str], ignore_case: bool = True):
+        self.patterns = list(patterns)
+        self.rejected: Dict[int, str] = {}
+        self._program = _Program()
+        self._trees = {}
+        starts = []
+        for pid, pattern in enumerate(self.patterns):
+            try:
+                tree = parse(pattern, ignore_case)
+                before = len(self._program.states)
+                try:
+                    starts.append(self._program.compile(tree, pid, pattern))
+                except RegexSafetyError:
+                    del self._program.states[before:]
+                    raise
+            except RegexSafetyError as e:
+                self.rejected[pid] = str(e)
+                continue
+            self._trees[pid] = tree
+        self._forward = _LazyDFA(self._program, self._program.add(_SPLIT, None, starts), unanchored=True)
+        self._literals = {pid: _required_literal(tree) for pid, tree in self._trees.items()}
+        self._span_dfas: Dict[Tuple[int, bool], _LazyDFA] = {}
+        self._span_lock = threading.Lock()
+
+    @property
+    def accepted(self) -> List[int]:
+        return sorted(self._trees)
+
+    def _span_dfa(self, pid: int, reverse: bool) -> _LazyDFA:
+        """单个模式的锚定自动机：reverse=True 从结束位置向前找起点，否则从起点向后找最长终点"""
+        key = (pid, reverse)
+        dfa = self._span_dfas.get(key)
+        if dfa is None:
+            with self._span_lock:
+                dfa = self._span_dfas.get(key)
+                if dfa is None:
+                    program = _Program()
+                    tree = _reverse(self._trees[pid]) if reverse else self._trees[pid]
+                    dfa = self._span_dfas[key] = _LazyDFA(program, program.compile(tree, pid, self.patterns[pid]),
+                                                          unanchored=False)
+        return dfa
+
+    def _leftmost_start(self, text: str, pid: int, end: int) -> int:
+        dfa = self._span_dfa(pid, reverse=True)
+        cache = dfa.cache()
+        sid = dfa.start_state(cache, at_begin=end == len(text))
+        best = end if pid in cache.accepts[sid] else None
+        for j in range(end - 1, -1, -1):
+            sid = dfa.step(cache, sid, text[j])
+            if dfa.is_dead(cache, sid):
+                break
+            accepts = dfa.final_accepts(cache, sid, at_begin=False) if j == 0 else cache.accepts[sid]
+            if pid in accepts:
+                best = j
+        return best if best is not None else end
+
+    def _longest_end(self, text: str, pid: int, start: int, end: int) -> int:
+        dfa = self._span_dfa(pid, reverse=False)
+        cache = dfa.cache()
+        sid = dfa.start_state(cache, at_begin=start == 0)
+        for i in range(start, len(text)):
+            sid = dfa.step(cache, sid, text[i])
+            if dfa.is_dead(cache, sid):
+                return end
+            accepts = dfa.final_accepts(cache, sid, at_begin=False) if i + 1 == len(text) else cache.accepts[sid]
+            if pid in accepts:
+                end = i + 1
+        return end
+
+    def scan(self, text: str) -> Dict[int, Span]:
+        """{模式下标: (起点, 终点)}；每个模式取最早结束的匹配，起点取最左、终点取最长"""
+        candidates = {pid for pid, literal in self._literals.items() if literal in text}
+        if not candidates:
+            return {}
+        dfa = self._forward
+        cache = dfa.cache()
+        ends: Dict[int, int] = {}
+        sid = dfa.start_state(cache, at_begin=True)
+        for pid in cache.accepts[sid]:
+            ends.setdefault(pid, 0)
+        n = len(text)
+        for i, ch in enumerate(text):
+            sid = dfa.step(cache, sid, ch)
+            accepts = cache.accepts[sid]
+            if accepts:
+                for pid in accepts:
+                    if pid not in ends:
+                        ends[pid] = i + 1
+                if candidates.issubset(ends):
+                    break
+        else:
+            for pid in dfa.final_accepts(cache, sid, at_begin=n == 0):
+                ends.setdefault(pid, n)
+        spans = {}
+        for pid, end in ends.items():
+            start = self._leftmost_start(text, pid, end)
+            spans[pid] = (start, self._longest_end(text, pid, start, end))
+        return spans
+
+    def search(self, text: str) -> Optional[Tuple[int, Span]]:
+        """第一个（按结束位置）命中的模式及区间"""
+        spans = self.scan(text)
+        if not spans:
+            return None
+        pid = min(spans, key=lambda p: (spans[p][1], p))
+        return pid, spans[pid]
+
+
+def validate(pattern: str) -> Optional[str]:
+    """合规同事编辑规则时使用：可用返回 None，否则返回拒绝原因"""
+    try:
+        _Program().compile(parse(pattern), 0, pattern)
+    except RegexSafetyError as e:
+        return str(e)
+    return None
+
+
+def benchmark(rules, texts: Sequence[str], repeat: int = 3) -> Dict[str, float]:
+    """全部规则正则在样本文本上的吞吐：逐条 re.search 与合并自动机（首轮含 DFA 构造）"""
+    import re
+
+    from .local_screen import _REGEX_CHARS
+
+    patterns = [kw.replace("\\\\", "\\") for rule in rules
+                for kw in rule.trigger.keywords + rule.trigger.regex_patterns]
+    patterns = [p for p in patterns if _REGEX_CHARS.search(p)]
+    compiled = [re.compile(p, re.IGNORECASE) for p in patterns]
+    multi = MultiPattern(patterns)
+    report = {"patterns": len(patterns), "rejected": len(multi.rejected), "texts": len(texts)}
+    for name, fn in (("re", lambda t: [p.search(t) for p in compiled]), ("automaton", multi.scan)):
+        timings = []
+        for _ in range(repeat):
+            began = time.perf_counter()
+            for text in texts:
+                fn(text)
+            timings.append(time.perf_counter() - began)
+        report[f"{name}_us_per_text"] = min(timings) / max(len(texts), 1) * 1e6
+    return report
+
+
+def main():
+    from pathlib import Path
+
+    from .rule_loader import load_all_rules
+
+    parser = argparse.ArgumentParser(description="规则正则检查与基准测试")
+    parser.add_argument("cmd", choices=["check", "bench"])
+    parser.add_argument("--rules", default=str(Path(__file__).parent / "compliance_rules.yaml"))
+    parser.add_argument("--texts", help="基准测试文本（每行一条），默认使用规则 few_shot 示例")
+    args = parser.parse_args()
+
+    rules = load_all_rules(args.rules)
+    if args.cmd == "check":
+        from .local_screen import _REGEX_CHARS
+
+        bad = 0
+        for rule in rules:
+            for kw in rule.trigger.keywords + rule.trigger.regex_patterns:
+                kw = kw.replace("\\\\", "\\")
+                if _REGEX_CHARS.search(kw):
+                    reason = validate(kw)
+                    print(f"{'拒绝' if reason else '通过'}  {rule.event_name}: {kw}" + (f"\n      {reason}" if reason else ""))
+                    bad += bool(reason)
+        raise SystemExit(1 if bad else 0)
+
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = [ex.input for rule in rules for ex in rule.few_shot]
+    # 长文本与对抗输入：大段数字后没有结尾字面量，回溯引擎需要平方时间
+    texts = texts + [" ".join(texts) * 20, "1" * 20000 + "天", "本金" + "1" * 20000 + "万赚"]
+    for key, value in benchmark(rules, texts).items():
+        print(f"{key:<24}{value:.2f}" if isinstance(value, float) else f"{key:<24}{value}")
+
+
+if __name__ == "__main__":
+    main()
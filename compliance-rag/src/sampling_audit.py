@@ -0,0 +1,339 @@
+# src/sampling_audit.py
+"""
+本地放行结论的抽样稽核。
+
+本地规则（local_first / 分片预筛）、近似重复复用、蒸馏分类器放行之后，大部分文本不再经过 LLM，
+需要有证据表明这些放行没有漏掉违规。抽样稽核：
+- 按放行来源分层（local / distilled / near_dup），每层按配置的比例随机抽取被放行的文本
+- 抽中的文本在后台以 bulk 优先级走 predict(full=True)（完整 Prompt，不使用任何本地放行）
+- 逐规则估计漏判率 = 放行文本中 LLM 判定触发该规则的比例，各层给出 Wilson 置信区间，
+  全部放行流量上的漏判率按各层放行量加权（区间为各层区间的加权，偏保守）
+- 某层某规则的样本数达到 min_samples 且漏判率估计超过 target_miss_rate 时自动收紧该层：
+  - distilled：该规则的放行阈值乘以 distilled_factor
+  - local：该规则加入 engine.llm_required_events，不再本地放行
+  - near_dup：近似重复的最大海明距离减 1（全局阈值，每次 adjust 最多收紧一档）
+  调整写入 SQLite 并在重启后重放，调整之后的漏判率只用调整之后的样本估计；
+  near_dup 任一规则触发收紧后，该层所有规则都只用收紧之后的样本估计
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from statistics import NormalDist
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .circuit_breaker import OPEN, CircuitOpenError
+from .concurrency import classify_error
+from .local_screen import split_events
+from .priority_scheduler import BULK
+
+DEFAULT_RATES = {"local": 0.02, "distilled": 0.05, "near_dup": 0.01}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    stratum TEXT NOT NULL,
+    rule_version TEXT NOT NULL,
+    text TEXT NOT NULL,
+    audit_events TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_samples_stratum ON samples(rule_version, stratum, ts);
+CREATE TABLE IF NOT EXISTS cleared (
+    rule_version TEXT NOT NULL,
+    stratum TEXT NOT NULL,
+    seen INTEGER NOT NULL,
+    PRIMARY KEY (rule_version, stratum)
+);
+CREATE TABLE IF NOT EXISTS adjustments (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    stratum TEXT NOT NULL,
+    event TEXT NOT NULL,
+    old REAL,
+    new REAL,
+    miss_rate REAL NOT NULL,
+    samples INTEGER NOT NULL
+);
+"""
+
+
+def wilson_interval(k: int, n: int, confidence: float = 0.95) -> Tuple[float, float]:
+    """二项比例的 Wilson 置信区间（k 次命中 / n 次抽样）"""
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = k / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * ((p * (1 - p) + z * z / (4 * n)) / n) ** 0.5 / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+class SamplingAuditor:
+    """见模块说明；构造后挂到 engine.auditor 上，引擎每条本地放行的结论都会经过 offer"""
+
+    def __init__(self, engine, rates: Optional[Dict[str, float]] = None,
+                 target_miss_rate: float = 0.01, confidence: float = 0.95,
+                 min_samples: int = 200, adjust_every: int = 50,
+                 db_path: Optional[str] = None, distilled_factor: float = 0.5,
+                 min_distilled_threshold: float = 1e-4, maxlen: int = 10000,
+                 max_attempts: int = 3, seed: Optional[int] = None):
+        self.engine = engine
+        self.rates = {**DEFAULT_RATES, **(rates or {})}
+        self.target_miss_rate = target_miss_rate
+        self.confidence = confidence
+        self.min_samples = min_samples
+        self.adjust_every = adjust_every
+        self.distilled_factor = distilled_factor
+        self.min_distilled_threshold = min_distilled_threshold
+        self.db_path = db_path or os.getenv("AUDIT_DB", "audit.sqlite")
+        self._random = random.Random(seed)
+        self.max_attempts = max_attempts
+        self.dropped = 0
+        self._queue: Deque[Tuple[str, str, int]] = deque(maxlen=maxlen)
+        self._seen: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._worker: Optional[threading.Thread] = None
+        self._since_adjust = 0
+        conn = self._connect()
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        self._replay()
+        engine.auditor = self
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    # ---------- 抽样 ----------
+    def offer(self, text: str, result: Dict[str, Any]) -> None:
+        """引擎在 _finish 中调用：只抽取本地放行（不违规、非降级）的结论"""
+        stratum = result.get("source")
+        if stratum not in self.rates or result["violation"] or result.get("degraded"):
+            return
+        with self._cond:
+            self._seen[stratum] = self._seen.get(stratum, 0) + 1
+            if self._random.random() >= self.rates[stratum]:
+                return
+            self._queue.append((stratum, text, 0))
+            self._cond.notify_all()
+        self._start()
+
+    def _start(self) -> None:
+        with self._cond:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._drain, name="sampling-audit", daemon=True)
+            self._worker.start()
+
+    def _drain(self, poll_interval: float = 2.0) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+            if self.engine.breaker.state == OPEN:
+                time.sleep(poll_interval)
+                continue
+            with self._cond:
+                stratum, text, attempts = self._queue.popleft()
+            try:
+                audit = self.engine.predict(text, BULK, full=True)
+            except Exception as e:
+                # 放回队尾重试；不可重试的错误（如内容审核拒绝）或失败 max_attempts 次后丢弃，不阻塞后面的样本
+                if not isinstance(e, CircuitOpenError):
+                    attempts += 1
+                if attempts >= self.max_attempts or (
+                        not isinstance(e, CircuitOpenError) and classify_error(e) == "fatal"):
+                    print(f"抽样稽核样本丢弃（第 {attempts} 次失败）: {type(e).__name__}: {e}")
+                    with self._cond:
+                        self.dropped += 1
+                else:
+                    with self._cond:
+                        self._queue.append((stratum, text, attempts))
+                time.sleep(poll_interval)
+                continue
+            if audit.get("degraded"):
+                continue
+            self.record(stratum, text, audit)
+
+    def record(self, stratum: str, text: str, audit: Dict[str, Any]) -> None:
+        """记录一条稽核样本（audit 为完整路径的判定结果），累计到 adjust_every 条时检查是否需要收紧"""
+        version = self.engine.rule_version.id
+        with self._cond:
+            seen, self._seen = self._seen, {}
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT INTO samples (ts, stratum, rule_version, text, audit_events) VALUES (?, ?, ?, ?, ?)",
+                         (time.time(), stratum, version, text,
+                          json.dumps(split_events(audit["triggered_event"]), ensure_ascii=False)))
+            conn.executemany(
+                "INSERT INTO cleared (rule_version, stratum, seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(rule_version, stratum) DO UPDATE SET seen = seen + excluded.seen",
+                [(version, s, n) for s, n in seen.items()])
+        self._since_adjust += 1
+        if self._since_adjust >= self.adjust_every:
+            self._since_adjust = 0
+            self.adjust()
+
+    # ---------- 估计 ----------
+    def estimate(self) -> Dict[str, Dict[str, Any]]:
+        """
+        当前规则版本下逐规则的漏判率估计：
+        {规则: {"strata": {层: {n, misses, rate, low, high}}, "rate", "low", "high"}}
+        """
+        conn = self._connect()
+        version = self.engine.rule_version.id
+        last_adjusted = {(s, e): ts for s, e, ts in conn.execute(
+            "SELECT stratum, event, MAX(ts) FROM adjustments GROUP BY stratum, event")}
+        # 近似重复的海明距离是全局阈值：任一规则触发的收紧都改变所有规则的放行条件
+        near_dup_since = max((ts for (s, _), ts in last_adjusted.items() if s == "near_dup"), default=0.0)
+        seen = dict(conn.execute("SELECT stratum, seen FROM cleared WHERE rule_version = ?", (version,)).fetchall())
+        with self._cond:
+            for stratum, n in self._seen.items():
+                seen[stratum] = seen.get(stratum, 0) + n
+        samples: Dict[str, List[Tuple[float, List[str]]]] = {}
+        for stratum, ts, events in conn.execute(
+                "SELECT stratum, ts, audit_events FROM samples WHERE rule_version = ?", (version,)):
+            samples.setdefault(stratum, []).append((ts, json.loads(events)))
+
+        report = {}
+        for event in self.engine.rule_titles:
+            strata = {}
+            for stratum, rows in samples.items():
+                since = near_dup_since if stratum == "near_dup" else last_adjusted.get((stratum, event), 0.0)
+                n = misses = 0
+                for ts, events in rows:
+                    if ts > since:
+                        n += 1
+                        misses += event in events
+                low, high = wilson_interval(misses, n, self.confidence)
+                strata[stratum] = {"n": n, "misses": misses, "rate": misses / n if n else None,
+                                   "low": low, "high": high}
+            # 全部放行流量：按各层放行量加权，只计有样本的层
+            weights = {s: seen.get(s, 0) for s, v in strata.items() if v["n"]}
+            total = sum(weights.values())
+            combined = {"rate": None, "low": None, "high": None}
+            if total:
+                combined = {k: sum(weights[s] * strata[s][k] for s in weights) / total
+                            for k in ("rate", "low", "high")}
+            report[event] = {"strata": strata, **combined}
+        return report
+
+    # ---------- 调整 ----------
+    def adjust(self) -> List[Dict[str, Any]]:
+        """漏判率超标的 (层, 规则) 收紧放行条件，返回本次的调整记录"""
+        changes = []
+        for event, item in self.estimate().items():
+            for stratum, stats in item["strata"].items():
+                if stats["n"] < self.min_samples or stats["rate"] <= self.target_miss_rate:
+                    continue
+                if stratum == "near_dup" and any(c["stratum"] == "near_dup" for c in changes):
+                    # 全局阈值每次只收紧一档，之后用收紧后的样本重新估计
+                    continue
+                change = self._tighten(stratum, event)
+                if change is None:
+                    continue
+                old, new = change
+                changes.append({"stratum": stratum, "event": event, "old": old, "new": new,
+                                "miss_rate": stats["rate"], "samples": stats["n"]})
+        if changes:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO adjustments (ts, stratum, event, old, new, miss_rate, samples) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(time.time(), c["stratum"], c["event"], c["old"], c["new"], c["miss_rate"], c["samples"])
+                     for c in changes])
+            for c in changes:
+                action = "改为一律交给 LLM" if c["stratum"] == "local" else f"{c['old']} -> {c['new']}"
+                print(f"抽样稽核收紧放行: {c['stratum']} / {c['event']} 漏判率 {c['miss_rate']:.2%}"
+                      f"（{c['samples']} 个样本），{action}")
+        return changes
+
+    def _tighten(self, stratum: str, event: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+        engine = self.engine
+        if stratum == "distilled":
+            model = engine.distilled
+            if model is None or event not in model.events:
+                return None
+            i = model.events.index(event)
+            old = float(model.thresholds[i])
+            new = max(self.min_distilled_threshold, old * self.distilled_factor)
+            if new >= old:
+                return None
+            model.thresholds[i] = new
+            return old, new
+        if stratum == "local":
+            if event in engine.llm_required_events:
+                return None
+            engine.llm_required_events.add(event)
+            return None, None
+        if stratum == "near_dup":
+            old = engine.near_dup.max_distance
+            if old == 0:
+                return None
+            engine.near_dup.max_distance = old - 1
+            return old, old - 1
+        return None
+
+    def _replay(self) -> None:
+        """重启后重放已做过的调整；蒸馏模型重新训练（文件更新）后，之前的阈值调整不再适用"""
+        engine = self.engine
+        rows = self._connect().execute(
+            "SELECT ts, stratum, event, new FROM adjustments ORDER BY id").fetchall()
+        model = engine.distilled
+        model_mtime = os.path.getmtime(model.model_path) if model is not None else None
+        for ts, stratum, event, new in rows:
+            if stratum == "local":
+                engine.llm_required_events.add(event)
+            elif stratum == "near_dup":
+                engine.near_dup.max_distance = min(engine.near_dup.max_distance, int(new))
+            elif stratum == "distilled" and model is not None and ts > model_mtime and event in model.events:
+                i = model.events.index(event)
+                model.thresholds[i] = min(float(model.thresholds[i]), new)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"audit_queue": len(self._queue), "audit_dropped": self.dropped}
+
+
+def print_report(report: Dict[str, Dict[str, Any]], target: float) -> None:
+    for event, item in report.items():
+        if item["rate"] is None:
+            continue
+        flag = "  超标" if item["rate"] > target else ""
+        print(f"{event:<24} 漏判率 {item['rate']:.2%} [{item['low']:.2%}, {item['high']:.2%}]{flag}")
+        for stratum, s in item["strata"].items():
+            if s["n"]:
+                print(f"    {stratum:<10} {s['misses']}/{s['n']} = {s['rate']:.2%} [{s['low']:.2%}, {s['high']:.2%}]")
+
+
+def main():
+    from .rag_engine import ComplianceRAGEngine
+
+    parser = argparse.ArgumentParser(description="本地放行结论的抽样稽核报告")
+    parser.add_argument("--db", default=None, help="稽核库（默认 AUDIT_DB）")
+    parser.add_argument("--rules", default=None)
+    parser.add_argument("--target", type=float, default=0.01)
+    parser.add_argument("--adjust", action="store_true", help="按当前估计立即收紧放行条件")
+    args = parser.parse_args()
+
+    engine = ComplianceRAGEngine(args.rules)
+    auditor = SamplingAuditor(engine, db_path=args.db, target_miss_rate=args.target)
+    print_report(auditor.estimate(), args.target)
+    if args.adjust:
+        auditor.adjust()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ class TriggerConfig(BaseModel):
     keywords: List[str] = Field(default_factory=list)
     regex_patterns: List[str] = Field(default_factory=list)
     context_words: List[str] = Field(default_factory=list)
+    # 规避写法词典：{规范写法: [变体, ...]}，如 {"微信": ["V信", "薇信"]}
+    variants: Dict[str, List[str]] = Field(default_factory=dict)
 
 class FewShotExample(BaseModel):
     input: str
@@ -18,4 +20,35 @@ class ComplianceRule(BaseModel):
     description: str
     trigger: TriggerConfig
     whitelist: List[str] = Field(default_factory=list)
-    few_shot: List[FewShotExample] = Field(default_factory=list)
\ No newline at end of file
+    few_shot: List[FewShotExample] = Field(default_factory=list)
+
+class LLMBackendConfig(BaseModel):
+    """一个 LLM 后端 = key + base_url + model，附带独立配额"""
+    name: str
+    api_key: str
+    base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+    model: str = "qwen-max"
+    qps: float = 5.0
+    burst: int = 10
+    max_concurrency: int = 16
+    weight: float = 1.0
+
+class TenantConfig(BaseModel):
+    """一个租户 = 一套规则文件 + 可选的 Prompt 段落覆盖 + 引擎参数"""
+    tenant_id: str
+    rules_file: str
+    # YAML 文件：{规则标题: Prompt 段落}，覆盖内置段落
+    prompt_file: Optional[str] = None
+    cache_size: int = 50000
+    near_dup_capacity: int = 200_000
+    # 透传给 ComplianceRAGEngine 的其他参数，如 local_first / sharded
+    engine_options: Dict[str, Any] = Field(default_factory=dict)
+
+class ShadowConfig(BaseModel):
+    """影子评估的候选配置：规则文件 / Prompt 段落未给出时沿用线上引擎，engine_options 为候选引擎的构造参数"""
+    name: str
+    rules_file: Optional[str] = None
+    prompt_file: Optional[str] = None
+    engine_options: Dict[str, Any] = Field(default_factory=dict)
+    # 线上请求中同时交给候选配置判定的比例
+    sample_rate: float = 0.05
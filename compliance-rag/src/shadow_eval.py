@@ -0,0 +1,335 @@
+# src/shadow_eval.py
+"""
+候选配置的影子评估。
+
+改 Prompt（如精简规则说明）或改 compliance_rules.yaml 之后直接上线，没有任何度量。影子模式：
+- 线上 predict 的结果按 sample_rate 抽样，同一文本在后台线程里交给候选配置的引擎再判定一次，
+  候选引擎以 bulk 优先级调用 LLM，与线上引擎共享后端池、并发控制、调度和熔断，不占用在线请求的关键路径
+- 候选引擎不写判定日志和历史案例库，不使用判定缓存、近似重复复用和蒸馏分类器放行（每个样本都真实评估一次）；
+  候选配置本身的本地判定（local_first、分片预筛等）产生的非 LLM 结果照常记录，但不计入报告的一致率与 token / 耗时对比
+- 每个样本记录双方触发的规则、来源、token 用量、LLM 耗时与端到端耗时（SQLite，SHADOW_DB）
+- 报告：违规结论一致率、逐规则一致率（含 Wilson 区间）与双方各自多判的条数、
+  token 与耗时的均值 / 分位数及变化比例，作为候选配置能否上线的依据
+线上结果来自缓存或降级判定的请求不抽样（token 与耗时没有可比性）。
+
+候选配置（YAML，环境变量 SHADOW_CONFIG）：
+    name: "slim-prompt-v2"
+    prompt_file: "rules/slim_prompt.yaml"
+    sample_rate: 0.05
+    engine_options: {sharded: true}
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import yaml
+
+from .circuit_breaker import OPEN
+from .local_screen import split_events
+from .near_dup import NearDuplicateIndex
+from .priority_scheduler import BULK
+from .sampling_audit import wilson_interval
+from .schemas import ShadowConfig
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shadow_samples (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    candidate TEXT NOT NULL,
+    primary_version TEXT NOT NULL,
+    candidate_version TEXT NOT NULL,
+    text TEXT NOT NULL,
+    primary_events TEXT NOT NULL,
+    candidate_events TEXT NOT NULL,
+    primary_source TEXT NOT NULL,
+    candidate_source TEXT NOT NULL,
+    primary_input_tokens INTEGER NOT NULL,
+    primary_output_tokens INTEGER NOT NULL,
+    candidate_input_tokens INTEGER NOT NULL,
+    candidate_output_tokens INTEGER NOT NULL,
+    primary_llm_ms REAL NOT NULL,
+    candidate_llm_ms REAL NOT NULL,
+    primary_latency_ms REAL NOT NULL,
+    candidate_latency_ms REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_shadow_candidate ON shadow_samples(candidate, ts);
+"""
+
+
+def load_shadow_config(config_file: Optional[str] = None) -> ShadowConfig:
+    config_file = config_file or os.getenv("SHADOW_CONFIG")
+    if not config_file:
+        raise ValueError("未配置候选配置文件（参数 config_file 或环境变量 SHADOW_CONFIG）")
+    with open(config_file, "r", encoding="utf-8") as f:
+        config = ShadowConfig(**(yaml.safe_load(f) or {}))
+    # 相对路径按配置文件所在目录解析
+    base = os.path.dirname(os.path.abspath(config_file))
+    for field in ("rules_file", "prompt_file"):
+        value = getattr(config, field)
+        if value and not os.path.isabs(value):
+            setattr(config, field, os.path.join(base, value))
+    return config
+
+
+def build_candidate(engine, config: ShadowConfig):
+    """候选引擎：与线上引擎共享 LLM 后端池、并发控制、调度、熔断、嵌入模型和历史案例库（只读使用）"""
+    from .rag_engine import ComplianceRAGEngine
+    from .tenants import load_prompt_sections
+
+    options = dict(config.engine_options)
+    options.setdefault("cache_size", 0)
+    # 近似重复复用与蒸馏放行依赖历史判定而不是候选配置本身；max_distance=-1 的索引永远不会命中
+    options["near_dup"] = NearDuplicateIndex(capacity=1, max_distance=-1)
+    prompt_sections = load_prompt_sections(config.prompt_file) if config.prompt_file else dict(engine.rule_sections)
+    candidate = ComplianceRAGEngine(
+        config.rules_file or engine.rules_file,
+        concurrency=engine.concurrency,
+        llm_pool=engine.llm_pool,
+        breaker=engine.breaker,
+        scheduler=engine.scheduler,
+        embeddings=engine.embeddings,
+        case_index=engine.case_index,
+        prompt_sections=prompt_sections,
+        record_verdicts=False,
+        **options,
+    )
+    # distilled_model_file 为空时引擎会读 DISTILLED_MODEL_FILE，构造后再关掉
+    candidate.distilled = None
+    return candidate
+
+
+class ShadowEvaluator:
+    """见模块说明；构造后挂到 engine.shadow 上，线上每条 predict 结果都会经过 offer"""
+
+    def __init__(self, engine, config: Optional[ShadowConfig] = None, candidate: Any = None,
+                 sample_rate: Optional[float] = None, db_path: Optional[str] = None,
+                 max_workers: int = 2, max_pending: int = 1000, seed: Optional[int] = None):
+        self.engine = engine
+        self.config = config or load_shadow_config()
+        self.candidate = candidate or build_candidate(engine, self.config)
+        self.name = self.config.name
+        self.sample_rate = sample_rate if sample_rate is not None else float(
+            os.getenv("SHADOW_SAMPLE_RATE", self.config.sample_rate))
+        self.db_path = db_path or os.getenv("SHADOW_DB", "shadow.sqlite")
+        self.max_pending = max_pending
+        self._random = random.Random(seed)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shadow")
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.pending = self.completed = self.dropped = self.failed = 0
+        conn = self._connect()
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        print(f"影子评估已启用: 候选配置 {self.name}，抽样比例 {self.sample_rate:.1%}")
+        engine.shadow = self
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def offer(self, text: str, result: Dict[str, Any]) -> None:
+        """线上引擎在 predict 返回前调用，只做抽样和入队"""
+        if result.get("cached") or result.get("degraded"):
+            return
+        with self._lock:
+            if self._random.random() >= self.sample_rate:
+                return
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self.pending += 1
+        self._executor.submit(self._evaluate, text, dict(result))
+
+    def _evaluate(self, text: str, primary: Dict[str, Any]) -> None:
+        try:
+            if self.engine.breaker.state == OPEN:
+                with self._lock:
+                    self.dropped += 1
+                return
+            shadow = self.candidate.predict(text, BULK)
+            if shadow.get("degraded"):
+                with self._lock:
+                    self.failed += 1
+                return
+            self.record(text, primary, shadow)
+            with self._lock:
+                self.completed += 1
+        except Exception as e:
+            print(f"影子评估调用失败: {type(e).__name__}: {e}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def record(self, text: str, primary: Dict[str, Any], shadow: Dict[str, Any]) -> None:
+        pu, cu = primary.get("usage") or {}, shadow.get("usage") or {}
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO shadow_samples (ts, candidate, primary_version, candidate_version, text, "
+                "primary_events, candidate_events, primary_source, candidate_source, "
+                "primary_input_tokens, primary_output_tokens, candidate_input_tokens, candidate_output_tokens, "
+                "primary_llm_ms, candidate_llm_ms, primary_latency_ms, candidate_latency_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), self.name, self.engine.rule_version.id, self.candidate.rule_version.id, text,
+                 json.dumps(split_events(primary["triggered_event"]), ensure_ascii=False),
+                 json.dumps(split_events(shadow["triggered_event"]), ensure_ascii=False),
+                 primary.get("source", "llm"), shadow.get("source", "llm"),
+                 pu.get("input_tokens", 0), pu.get("output_tokens", 0),
+                 cu.get("input_tokens", 0), cu.get("output_tokens", 0),
+                 pu.get("llm_ms", 0.0), cu.get("llm_ms", 0.0),
+                 primary.get("latency_ms", 0.0), shadow.get("latency_ms", 0.0)))
+
+    def report(self, since: Optional[float] = None) -> Dict[str, Any]:
+        return shadow_report(self.db_path, self.name, since)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        # 历史案例库属于线上引擎，不随候选引擎关闭
+        self.candidate.case_index = None
+        self.candidate.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"shadow_pending": self.pending, "shadow_completed": self.completed,
+                    "shadow_dropped": self.dropped, "shadow_failed": self.failed}
+
+
+# ---------- 报告 ----------
+def _percentile(values: Sequence[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _compare(primary: List[float], candidate: List[float]) -> Dict[str, Any]:
+    p_mean = sum(primary) / len(primary)
+    c_mean = sum(candidate) / len(candidate)
+    return {
+        "primary_mean": p_mean, "candidate_mean": c_mean,
+        "delta": (c_mean - p_mean) / p_mean if p_mean else None,
+        "primary_p50": _percentile(primary, 0.5), "candidate_p50": _percentile(candidate, 0.5),
+        "primary_p95": _percentile(primary, 0.95), "candidate_p95": _percentile(candidate, 0.95),
+    }
+
+
+def _open_readonly(db_path: str) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+
+
+def latest_candidate(db_path: str) -> Optional[str]:
+    row = _open_readonly(db_path).execute(
+        "SELECT candidate FROM shadow_samples ORDER BY id DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def shadow_report(db_path: str, candidate: Optional[str] = None, since: Optional[float] = None,
+                  confidence: float = 0.95) -> Dict[str, Any]:
+    """
+    candidate 为空时取最近一次评估的候选配置。只统计候选结果来自 LLM 的样本，其余计入 excluded。返回
+    {candidate, n, excluded, violation_agreement, exact_agreement, rules: {规则: {...}}, tokens, llm_ms, latency_ms}
+    """
+    candidate = candidate or latest_candidate(db_path)
+    conn = _open_readonly(db_path)
+    rows = conn.execute(
+        "SELECT primary_events, candidate_events, primary_input_tokens + primary_output_tokens, "
+        "candidate_input_tokens + candidate_output_tokens, primary_llm_ms, candidate_llm_ms, "
+        "primary_latency_ms, candidate_latency_ms FROM shadow_samples "
+        "WHERE candidate = ? AND ts >= ? AND candidate_source = 'llm'",
+        (candidate, since or 0.0)).fetchall()
+    (excluded,) = conn.execute(
+        "SELECT COUNT(*) FROM shadow_samples WHERE candidate = ? AND ts >= ? AND candidate_source != 'llm'",
+        (candidate, since or 0.0)).fetchone()
+    n = len(rows)
+    report: Dict[str, Any] = {"candidate": candidate, "n": n, "excluded": excluded}
+    if not n:
+        return report
+
+    pairs = [(set(json.loads(p)), set(json.loads(c))) for p, c, *_ in rows]
+    same_verdict = sum(bool(p) == bool(c) for p, c in pairs)
+    same_events = sum(p == c for p, c in pairs)
+    report["violation_agreement"] = {"rate": same_verdict / n,
+                                     **dict(zip(("low", "high"), wilson_interval(same_verdict, n, confidence)))}
+    report["exact_agreement"] = same_events / n
+
+    rules = {}
+    for event in sorted(set().union(*(p | c for p, c in pairs))):
+        both = sum(event in p and event in c for p, c in pairs)
+        primary_only = sum(event in p and event not in c for p, c in pairs)
+        candidate_only = sum(event in c and event not in p for p, c in pairs)
+        agree = n - primary_only - candidate_only
+        low, high = wilson_interval(agree, n, confidence)
+        rules[event] = {"both": both, "primary_only": primary_only, "candidate_only": candidate_only,
+                        "agreement": agree / n, "low": low, "high": high}
+    report["rules"] = rules
+
+    columns = list(zip(*rows))
+    report["tokens"] = _compare(columns[2], columns[3])
+    report["llm_ms"] = _compare(columns[4], columns[5])
+    report["latency_ms"] = _compare(columns[6], columns[7])
+    return report
+
+
+def disagreements(db_path: str, candidate: Optional[str] = None, event: Optional[str] = None,
+                  limit: int = 20) -> List[Dict[str, Any]]:
+    """双方结论不一致的样本（event 不为空时只看该规则，只看候选结果来自 LLM 的），最近的在前"""
+    candidate = candidate or latest_candidate(db_path)
+    found = []
+    for ts, text, p, c in _open_readonly(db_path).execute(
+            "SELECT ts, text, primary_events, candidate_events FROM shadow_samples "
+            "WHERE candidate = ? AND candidate_source = 'llm' ORDER BY id DESC", (candidate,)):
+        p, c = set(json.loads(p)), set(json.loads(c))
+        if (event is None and p != c) or (event is not None and (event in p) != (event in c)):
+            found.append({"ts": ts, "text": text, "primary": sorted(p), "candidate": sorted(c)})
+            if len(found) >= limit:
+                break
+    return found
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"候选配置 {report['candidate']}：{report['n']} 个样本"
+          + (f"（另有 {report['excluded']} 个候选结果未经 LLM，不计入对比）" if report.get("excluded") else ""))
+    if not report["n"]:
+        return
+    va = report["violation_agreement"]
+    print(f"违规结论一致率 {va['rate']:.2%} [{va['low']:.2%}, {va['high']:.2%}]，"
+          f"触发规则完全一致 {report['exact_agreement']:.2%}")
+    for event, r in report["rules"].items():
+        print(f"    {event:<24} 一致率 {r['agreement']:.2%} [{r['low']:.2%}, {r['high']:.2%}]  "
+              f"双方均判 {r['both']}，仅线上 {r['primary_only']}，仅候选 {r['candidate_only']}")
+    for key, label in (("tokens", "token/条"), ("llm_ms", "LLM 耗时 ms"), ("latency_ms", "端到端 ms")):
+        c = report[key]
+        delta = f"{c['delta']:+.1%}" if c["delta"] is not None else "-"
+        print(f"{label:<12} 均值 {c['primary_mean']:.1f} -> {c['candidate_mean']:.1f}（{delta}），"
+              f"p50 {c['primary_p50']:.1f} -> {c['candidate_p50']:.1f}，p95 {c['primary_p95']:.1f} -> {c['candidate_p95']:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="影子评估报告：候选配置与线上配置的一致率、token 与耗时对比")
+    parser.add_argument("--db", default=os.getenv("SHADOW_DB", "shadow.sqlite"))
+    parser.add_argument("--candidate", help="候选配置名，默认最近一次评估的配置")
+    parser.add_argument("--since-hours", type=float, default=None)
+    parser.add_argument("--examples", type=int, default=0, help="列出最近 N 条结论不一致的样本")
+    parser.add_argument("--event", help="只列出该规则不一致的样本")
+    args = parser.parse_args()
+
+    since = time.time() - args.since_hours * 3600 if args.since_hours else None
+    print_report(shadow_report(args.db, args.candidate, since))
+    for item in disagreements(args.db, args.candidate, args.event, args.examples) if args.examples else []:
+        print(f"- 线上 {item['primary'] or '无'} / 候选 {item['candidate'] or '无'}: {item['text'][:80]}")
+
+
+if __name__ == "__main__":
+    main()
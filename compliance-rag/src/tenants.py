@@ -0,0 +1,230 @@
+# src/tenants.py
+"""
+多租户：一个进程按租户 ID 服务多套规则。
+
+每个租户一个 ComplianceRAGEngine（各自的规则、Prompt、匹配器、近似重复索引、判定缓存），
+LLM 后端池、并发控制器、优先级调度器、熔断器和嵌入模型在租户之间共享。
+租户引擎首次请求时构建，按内存占用（engine.footprint()）做 LRU 淘汰；
+被淘汰的引擎等在途请求全部结束后才 close，期间该租户的新请求继续使用它，不会重复打开同一个案例索引。
+判定日志（VERDICT_LOG_FILE）和案例索引（CASE_INDEX_DIR）按租户分目录存放。
+
+租户配置（YAML，环境变量 TENANTS_FILE）：
+    tenants:
+      - tenant_id: "default"
+        rules_file: "src/compliance_rules.yaml"
+      - tenant_id: "wealth"
+        rules_file: "rules/wealth_rules.yaml"
+        prompt_file: "rules/wealth_prompt.yaml"
+        engine_options: {local_first: true}
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import yaml
+
+from .case_index import CaseIndex
+from .circuit_breaker import CircuitBreaker
+from .concurrency import AdaptiveConcurrencyController
+from .embeddings import SharedEmbeddings
+from .llm_pool import LLMPool
+from .near_dup import NearDuplicateIndex
+from .priority_scheduler import INTERACTIVE, PriorityScheduler
+from .schemas import TenantConfig
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def load_tenant_configs(config_file: Optional[str] = None) -> Dict[str, TenantConfig]:
+    config_file = config_file or os.getenv("TENANTS_FILE")
+    if not config_file:
+        raise ValueError("未配置租户文件（参数 config_file 或环境变量 TENANTS_FILE）")
+    with open(config_file, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    # 相对路径按配置文件所在目录解析
+    base = os.path.dirname(os.path.abspath(config_file))
+    configs = {}
+    for item in data.get("tenants", []):
+        config = TenantConfig(**item)
+        for field in ("rules_file", "prompt_file"):
+            value = getattr(config, field)
+            if value and not os.path.isabs(value):
+                setattr(config, field, os.path.join(base, value))
+        configs[config.tenant_id] = config
+    return configs
+
+
+def load_prompt_sections(prompt_file: Optional[str]) -> Optional[Dict[str, str]]:
+    if not prompt_file:
+        return None
+    with open(prompt_file, "r", encoding="utf-8") as f:
+        return {str(k): str(v) for k, v in (yaml.safe_load(f) or {}).items()}
+
+
+class TenantRegistry:
+    """见模块说明；max_bytes 为所有租户引擎私有缓存的内存上限（环境变量 TENANT_CACHE_BYTES）"""
+
+    def __init__(self, configs: Optional[Dict[str, TenantConfig]] = None,
+                 max_bytes: Optional[int] = None,
+                 llm_pool: Optional[LLMPool] = None,
+                 backends_file: Optional[str] = None,
+                 embeddings: Any = None):
+        self.configs = configs if configs is not None else load_tenant_configs()
+        self.max_bytes = max_bytes or int(os.getenv("TENANT_CACHE_BYTES", DEFAULT_MAX_BYTES))
+        # 所有租户共享的部分
+        self.llm_pool = llm_pool or LLMPool.from_config(
+            backends_file, temperature=0.0, max_tokens=500, max_retries=0)
+        self.concurrency = AdaptiveConcurrencyController(
+            max_limit=sum(b.config.max_concurrency for b in self.llm_pool.backends))
+        self.scheduler = PriorityScheduler(lambda: int(self.concurrency.limit))
+        self.breaker = CircuitBreaker()
+        self.embeddings = embeddings or SharedEmbeddings()
+
+        self._engines: "OrderedDict[str, Any]" = OrderedDict()
+        # 已淘汰但仍有在途请求的引擎；在途计数按引擎对象计，同一租户重建后是另一个引擎
+        self._retired: Dict[str, Any] = {}
+        self._inflight: Dict[int, int] = {}
+        # 租户级锁：构建与 close 互斥，同一租户的案例索引目录同一时刻只有一个引擎打开
+        self._tenant_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _build(self, config: TenantConfig):
+        from .rag_engine import ComplianceRAGEngine
+
+        print(f"构建租户引擎: {config.tenant_id}（规则文件 {config.rules_file}）")
+        options = dict(config.engine_options)
+        verdict_log_file = os.getenv("VERDICT_LOG_FILE")
+        if verdict_log_file and "verdict_log_file" not in options:
+            # 判定日志与规则版本文件按租户分开，否则增量复审和蒸馏训练会混入其他规则集的判定
+            head, name = os.path.split(verdict_log_file)
+            options["verdict_log_file"] = os.path.join(head, config.tenant_id, name)
+        case_index_dir = os.getenv("CASE_INDEX_DIR")
+        if case_index_dir and "case_index" not in options:
+            # 各租户的历史案例分开存放，不能共用同一个索引目录
+            options["case_index"] = CaseIndex(os.path.join(case_index_dir, config.tenant_id),
+                                              embeddings=self.embeddings)
+        return ComplianceRAGEngine(
+            config.rules_file,
+            concurrency=self.concurrency,
+            llm_pool=self.llm_pool,
+            breaker=self.breaker,
+            scheduler=self.scheduler,
+            embeddings=self.embeddings,
+            cache_size=config.cache_size,
+            near_dup=NearDuplicateIndex(capacity=config.near_dup_capacity),
+            prompt_sections=load_prompt_sections(config.prompt_file),
+            **options,
+        )
+
+    def get(self, tenant_id: str):
+        """
+        取租户引擎，不存在时构建；同一租户并发首次请求只构建一次。
+        返回的引擎不计入在途请求，淘汰时可能被 close，需要在调用期间保持可用请用 use()
+        """
+        engine = self._acquire(tenant_id)
+        self._release(tenant_id, engine)
+        return engine
+
+    @contextmanager
+    def use(self, tenant_id: str) -> Iterator[Any]:
+        """with 块内持有租户引擎的引用，期间引擎即使被淘汰也不会 close"""
+        engine = self._acquire(tenant_id)
+        try:
+            yield engine
+        finally:
+            self._release(tenant_id, engine)
+
+    def _tenant_lock(self, tenant_id: str) -> threading.Lock:
+        with self._lock:
+            return self._tenant_locks.setdefault(tenant_id, threading.Lock())
+
+    def _lookup(self, tenant_id: str):
+        """调用方持有 self._lock：已加载的引擎，或把仍在服务的已淘汰引擎放回"""
+        engine = self._engines.get(tenant_id)
+        if engine is None:
+            engine = self._retired.pop(tenant_id, None)
+            if engine is not None:
+                self._engines[tenant_id] = engine
+        if engine is not None:
+            self._engines.move_to_end(tenant_id)
+            self._inflight[id(engine)] = self._inflight.get(id(engine), 0) + 1
+        return engine
+
+    def _acquire(self, tenant_id: str):
+        with self._lock:
+            engine = self._lookup(tenant_id)
+            if engine is None and tenant_id not in self.configs:
+                raise KeyError(f"未知租户: {tenant_id}")
+        if engine is None:
+            with self._tenant_lock(tenant_id):
+                with self._lock:
+                    engine = self._lookup(tenant_id)
+                if engine is None:
+                    built = self._build(self.configs[tenant_id])
+                    with self._lock:
+                        self._engines[tenant_id] = built
+                        engine = self._lookup(tenant_id)
+        self._evict(keep=tenant_id)
+        return engine
+
+    def _release(self, tenant_id: str, engine) -> None:
+        with self._lock:
+            remaining = self._inflight[id(engine)] = self._inflight[id(engine)] - 1
+            retired = self._retired.get(tenant_id) is engine
+        if not remaining and retired:
+            self._close_retired(tenant_id, engine)
+
+    def _close_retired(self, tenant_id: str, engine) -> None:
+        """已淘汰且没有在途请求时 close；持租户锁，close 完成前该租户不会重建"""
+        with self._tenant_lock(tenant_id):
+            with self._lock:
+                if self._retired.get(tenant_id) is not engine or self._inflight.get(id(engine), 0):
+                    return
+                del self._retired[tenant_id]
+                self._inflight.pop(id(engine), None)
+            engine.close()
+            print(f"关闭已淘汰的租户引擎: {tenant_id}")
+
+    def _evict(self, keep: str) -> None:
+        """超过内存上限时从最久未使用的租户开始淘汰，当前租户保留"""
+        evicted = []
+        with self._lock:
+            total = sum(e.footprint() for e in self._engines.values())
+            for tenant_id in list(self._engines):
+                if total <= self.max_bytes:
+                    break
+                if tenant_id == keep:
+                    continue
+                engine = self._engines.pop(tenant_id)
+                total -= engine.footprint()
+                self._retired[tenant_id] = engine
+                evicted.append((tenant_id, engine))
+                self.evictions += 1
+                print(f"淘汰租户引擎: {tenant_id}")
+        for tenant_id, engine in evicted:
+            self._close_retired(tenant_id, engine)
+
+    def predict(self, tenant_id: str, text: str, priority: str = INTERACTIVE) -> Dict[str, Any]:
+        with self.use(tenant_id) as engine:
+            return engine.predict(text, priority)
+
+    def tenants(self) -> List[str]:
+        return list(self.configs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = {t: e.footprint() for t, e in self._engines.items()}
+            retired = list(self._retired)
+        return {
+            "loaded_tenants": loaded,
+            "retired_tenants": retired,
+            "footprint_bytes": sum(loaded.values()),
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            **self.concurrency.stats(),
+            "priorities": self.scheduler.stats(),
+            "backends": self.llm_pool.stats(),
+        }
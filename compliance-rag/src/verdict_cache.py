@@ -0,0 +1,65 @@
+# src/verdict_cache.py
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class VerdictCache:
+    """
+    判定结果 LRU 缓存，key 为规范化后的文本（见 normalizer.py），
+    因此“V信”和“微信”这类规避写法会命中同一条缓存。
+    """
+
+    def __init__(self, maxsize: int = 50000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+
+    @staticmethod
+    def _entry_bytes(key: str, result: Dict[str, Any]) -> int:
+        """粗略估算一条缓存占用的字节数（key + 各字段值）"""
+        return sys.getsizeof(key) + sum(sys.getsizeof(v) for v in result.values()) + 64 * len(result)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._data.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return dict(result)
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        if self.maxsize <= 0:
+            return
+        entry = dict(result)
+        size = self._entry_bytes(key, entry)
+        with self._lock:
+            old = self._data.get(key)
+            if old is not None:
+                self._bytes -= self._entry_bytes(key, old)
+            self._data[key] = entry
+            self._bytes += size
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                old_key, old = self._data.popitem(last=False)
+                self._bytes -= self._entry_bytes(old_key, old)
+
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "cache_size": len(self._data),
+            "cache_hits": self.hits,
+            "cache_hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,561 @@
+# src/worker.py
+"""
+队列消费模式：持续从聊天网关的消息队列取消息做合规判定。
+
+    python -m src.worker --source sqlite:queue.sqlite
+    python -m src.worker --source spool:/data/spool --batch-size 500 --max-wait 5
+
+- 消息来源可插拔（QueueSource）：receive / ack / nack，这里附带两种本地实现
+  - SpoolSource：网关往 <spool>/incoming 写 jsonl 文件（写完再改名成 .jsonl），
+    worker 用改名认领到 processing/<worker_id>，全部确认后删除，超过重试次数的移到 dead
+  - SQLiteQueueSource：messages 表 + 租约（lease），BEGIN IMMEDIATE 保证多个 worker 不会领到同一条
+- 按时间和条数攒批：攒满 batch_size 条或距批次第一条消息超过 max_wait 秒即处理
+- 一批消息并发 predict（near_real_time 优先级，与在线检测共享调度），
+  结果写入结果库（ResultStore）之后才 ack；判定失败的消息 nack，按重试次数指数退避后重投，
+  超过 max_attempts 进入死信；时间戳等无法解析的消息直接进入死信
+- LLM 不可用（降级判定、熔断打开）的消息延迟重投且不计重试次数；熔断器打开期间暂停取消息，
+  短时故障不会把整个队列打进死信
+- 横向扩展：同一来源上多启动几个 worker 进程即可；租约 / 认领超时后未确认的消息会重新投递，
+  因此语义为至少一次，worker 在写入结果库后、ack 之前崩溃时该批会重复写入
+消息体与批量输入的一行相同：纯文本，或 {"text", "agent", "conversation_id", "ts"} JSON。
+"""
+import argparse
+import json
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .circuit_breaker import OPEN, CircuitOpenError
+from .priority_scheduler import NEAR_REAL_TIME
+from .result_store import ResultStore, make_record, parse_input_line, parse_ts
+
+DEFAULT_VISIBILITY_TIMEOUT = 300.0
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 5.0
+MAX_RETRY_DELAY = 300.0
+
+
+def backoff_delay(attempts: int, base: float = DEFAULT_RETRY_DELAY, cap: float = MAX_RETRY_DELAY) -> float:
+    """第 attempts 次失败后的重投延迟：base * 2^(attempts-1)，不超过 cap"""
+    return min(cap, base * 2 ** max(0, attempts - 1))
+
+
+class Message(NamedTuple):
+    id: str
+    body: str
+    attempts: int
+
+
+class QueueSource:
+    """消息来源接口；receive 领到的消息在 ack 之前对其他 worker 不可见，超时未确认则重新投递"""
+
+    def receive(self, max_messages: int, timeout: float) -> List[Message]:
+        raise NotImplementedError
+
+    def ack(self, messages: Iterable[Message]) -> None:
+        raise NotImplementedError
+
+    def nack(self, messages: Iterable[Message], delay: Optional[float] = None,
+             count_attempt: bool = True) -> None:
+        """
+        放回队列，delay 秒后重投（默认按重试次数指数退避）；达到最大重试次数的消息进入死信。
+        count_attempt=False 时本次不计入重试次数（LLM 不可用等与消息本身无关的失败）
+        """
+        raise NotImplementedError
+
+    def reject(self, messages: Iterable[Message]) -> None:
+        """消息本身无法处理（格式错误等），直接进入死信"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteQueueSource(QueueSource):
+    """SQLite 消息队列，publish 供网关或本地测试写入"""
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY,
+        body TEXT NOT NULL,
+        enqueued REAL NOT NULL,
+        status TEXT NOT NULL DEFAULT 'ready',
+        lease_until REAL NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_status ON messages(status, lease_until, id);
+    """
+
+    def __init__(self, path: str, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, poll_interval: float = 0.5,
+                 retry_delay: float = DEFAULT_RETRY_DELAY):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self._SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：事务由 BEGIN IMMEDIATE 显式控制
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def publish(self, bodies: Iterable[str]) -> int:
+        conn = self._connect()
+        now = time.time()
+        rows = [(body, now) for body in bodies]
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("INSERT INTO messages (body, enqueued) VALUES (?, ?)", rows)
+        conn.execute("COMMIT")
+        return len(rows)
+
+    def _lease(self, max_messages: int) -> List[Message]:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 租约过期且已达最大重试次数（多半是让 worker 崩溃的消息）直接进入死信
+            conn.execute("UPDATE messages SET status = 'dead' WHERE status = 'leased' AND lease_until < ? "
+                         "AND attempts >= ?", (now, self.max_attempts))
+            rows = conn.execute(
+                "SELECT id, body, attempts FROM messages "
+                "WHERE (status = 'ready' AND lease_until <= ?) OR (status = 'leased' AND lease_until < ?) "
+                "ORDER BY id LIMIT ?",
+                (now, now, max_messages)).fetchall()
+            conn.executemany("UPDATE messages SET status = 'leased', lease_until = ?, attempts = attempts + 1 "
+                             "WHERE id = ?", [(now + self.visibility_timeout, r[0]) for r in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [Message(str(i), body, attempts + 1) for i, body, attempts in rows]
+
+    def receive(self, max_messages: int, timeout: float) -> List[Message]:
+        deadline = time.monotonic() + timeout
+        while True:
+            messages = self._lease(max_messages)
+            if messages or time.monotonic() >= deadline:
+                return messages
+            time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+
+    def ack(self, messages: Iterable[Message]) -> None:
+        ids = [(int(m.id),) for m in messages]
+        if ids:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM messages WHERE id = ?", ids)
+            conn.execute("COMMIT")
+
+    def nack(self, messages: Iterable[Message], delay: Optional[float] = None,
+             count_attempt: bool = True) -> None:
+        # ready 状态下 lease_until 表示最早重投时间
+        now = time.time()
+        rows = []
+        for m in messages:
+            attempts = m.attempts if count_attempt else m.attempts - 1
+            if attempts >= self.max_attempts:
+                rows.append(("dead", 0, attempts, int(m.id)))
+            else:
+                wait = backoff_delay(attempts, self.retry_delay) if delay is None else delay
+                rows.append(("ready", now + wait, attempts, int(m.id)))
+        self._update(rows)
+
+    def reject(self, messages: Iterable[Message]) -> None:
+        self._update([("dead", 0, m.attempts, int(m.id)) for m in messages])
+
+    def _update(self, rows: List[Tuple[str, float, int, int]]) -> None:
+        if rows:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE messages SET status = ?, lease_until = ?, attempts = ? WHERE id = ?", rows)
+            conn.execute("COMMIT")
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._connect().execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall())
+
+
+class SpoolSource(QueueSource):
+    """
+    文件目录队列：incoming/*.jsonl 每行一条消息。认领时整份文件改名到 processing/<worker_id>/，
+    文件内全部消息确认后删除；有消息 nack 时，未确认的消息按重试次数分组写成新文件
+    （<名称>.<随机串>.r<次数>.jsonl），先放到 delayed/<到期毫秒时间戳>-<文件名>，到期后移回 incoming；
+    达到上限或被 reject 的写入 dead。
+    其他 worker 认领超过 visibility_timeout 仍未处理完的文件会被放回 incoming。
+    """
+
+    def __init__(self, root: str, worker_id: Optional[str] = None,
+                 visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, poll_interval: float = 0.5,
+                 retry_delay: float = DEFAULT_RETRY_DELAY):
+        self.root = Path(root)
+        self.worker_id = worker_id or f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.incoming = self.root / "incoming"
+        self.processing = self.root / "processing"
+        self.delayed = self.root / "delayed"
+        self.dead = self.root / "dead"
+        self.claimed = self.processing / self.worker_id
+        for d in (self.incoming, self.claimed, self.delayed, self.dead):
+            d.mkdir(parents=True, exist_ok=True)
+        # 认领的文件 -> {"messages": {id: 消息}, "pending": 尚未确认的 id,
+        #               "failed": [(消息, 计入本次后的重试次数, 重投延迟)]}
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._buffer: List[Message] = []
+        self._last_recover = 0.0
+
+    @staticmethod
+    def _retry_name(name: str, attempts: int) -> str:
+        """重投 / 死信文件名：<原名>.<随机串>.r<次数>.jsonl，同一文件多次拆分写出时不会重名覆盖"""
+        return f"{name.split('.')[0]}.{uuid.uuid4().hex[:6]}.r{attempts}.jsonl"
+
+    @staticmethod
+    def _attempts(name: str) -> int:
+        parts = name.split(".")
+        return int(parts[-2][1:]) if len(parts) >= 3 and parts[-2].startswith("r") and parts[-2][1:].isdigit() else 0
+
+    def publish(self, bodies: Iterable[str], name: Optional[str] = None) -> int:
+        """写一个 spool 文件：先写 .tmp 再改名，worker 不会读到写了一半的文件"""
+        bodies = list(bodies)
+        name = name or f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        tmp = self.incoming / f"{name}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for body in bodies:
+                f.write(body.replace("\n", " ") + "\n")
+        os.replace(tmp, self.incoming / f"{name}.jsonl")
+        return len(bodies)
+
+    def _recover(self) -> None:
+        """其他 worker 认领超时（通常是进程已退出）的文件放回 incoming"""
+        now = time.time()
+        if now - self._last_recover < self.visibility_timeout / 4:
+            return
+        self._last_recover = now
+        for path in self.processing.glob("*/*.jsonl"):
+            if path.parent == self.claimed:
+                continue
+            try:
+                if now - path.stat().st_mtime > self.visibility_timeout:
+                    os.replace(path, self.incoming / path.name)
+                    print(f"回收超时未处理的 spool 文件: {path}")
+            except FileNotFoundError:
+                continue
+
+    def _release_delayed(self) -> None:
+        """到期的重投文件移回 incoming"""
+        now_ms = int(time.time() * 1000)
+        for path in self.delayed.glob("*.jsonl"):
+            due, _, name = path.name.partition("-")
+            if due.isdigit() and int(due) > now_ms:
+                continue
+            try:
+                os.replace(path, self.incoming / name)
+            except FileNotFoundError:
+                continue
+
+    def _claim(self) -> Optional[Path]:
+        for path in sorted(self.incoming.glob("*.jsonl")):
+            target = self.claimed / path.name
+            try:
+                os.replace(path, target)
+            except FileNotFoundError:
+                # 被其他 worker 抢先认领
+                continue
+            os.utime(target)
+            return target
+        return None
+
+    def _load(self, path: Path) -> List[Message]:
+        attempts = self._attempts(path.name) + 1
+        messages = {}
+        with open(path, encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                if line.strip():
+                    msg_id = f"{path.name}:{i}"
+                    messages[msg_id] = Message(msg_id, line.rstrip("\n"), attempts)
+        with self._lock:
+            self._files[path.name] = {"messages": messages, "pending": set(messages), "failed": []}
+        if not messages:
+            self._finish(path.name)
+        return list(messages.values())
+
+    def receive(self, max_messages: int, timeout: float) -> List[Message]:
+        deadline = time.monotonic() + timeout
+        self._recover()
+        while len(self._buffer) < max_messages:
+            self._release_delayed()
+            path = self._claim()
+            if path is not None:
+                self._buffer.extend(self._load(path))
+                continue
+            if self._buffer or time.monotonic() >= deadline:
+                break
+            time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+        batch, self._buffer = self._buffer[:max_messages], self._buffer[max_messages:]
+        # 认领后一直在处理的文件刷新修改时间，避免被其他 worker 当作超时回收
+        for name in {m.id.rsplit(":", 1)[0] for m in batch}:
+            try:
+                os.utime(self.claimed / name)
+            except FileNotFoundError:
+                pass
+        return batch
+
+    def _settle(self, messages: Iterable[Message], failures: Optional[List[Tuple[int, float]]] = None) -> None:
+        """failures 与 messages 一一对应的 (重试次数, 重投延迟)；为 None 表示确认"""
+        by_file: Dict[str, List[Tuple[Message, Optional[Tuple[int, float]]]]] = {}
+        messages = list(messages)
+        for m, failure in zip(messages, failures or [None] * len(messages)):
+            by_file.setdefault(m.id.rsplit(":", 1)[0], []).append((m, failure))
+        for name, items in by_file.items():
+            with self._lock:
+                state = self._files[name]
+                state["pending"].difference_update(m.id for m, _ in items)
+                state["failed"].extend((m, *failure) for m, failure in items if failure is not None)
+                done = not state["pending"]
+            if done:
+                self._finish(name)
+
+    def _write(self, directory: Path, name: str, messages: List[Message]) -> None:
+        tmp = self.claimed / (name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for m in messages:
+                f.write(m.body + "\n")
+        os.replace(tmp, directory / name)
+
+    def _finish(self, name: str) -> None:
+        """文件内消息都已处理：失败的消息按重试次数分组写成新文件延迟重投或进入死信，原文件删除"""
+        with self._lock:
+            state = self._files.pop(name)
+        groups: Dict[int, List[Tuple[Message, float]]] = {}
+        for m, attempts, delay in state["failed"]:
+            groups.setdefault(attempts, []).append((m, delay))
+        for attempts, items in groups.items():
+            retry_name = self._retry_name(name, attempts)
+            messages = [m for m, _ in items]
+            if attempts >= self.max_attempts:
+                self._write(self.dead, retry_name, messages)
+            else:
+                due = int((time.time() + max(d for _, d in items)) * 1000)
+                self._write(self.delayed, f"{due}-{retry_name}", messages)
+        (self.claimed / name).unlink(missing_ok=True)
+
+    def ack(self, messages: Iterable[Message]) -> None:
+        self._settle(messages)
+
+    def nack(self, messages: Iterable[Message], delay: Optional[float] = None,
+             count_attempt: bool = True) -> None:
+        messages = list(messages)
+        failures = []
+        for m in messages:
+            attempts = m.attempts if count_attempt else m.attempts - 1
+            failures.append((attempts, backoff_delay(attempts, self.retry_delay) if delay is None else delay))
+        self._settle(messages, failures)
+
+    def reject(self, messages: Iterable[Message]) -> None:
+        messages = list(messages)
+        self._settle(messages, [(self.max_attempts, 0.0)] * len(messages))
+
+    def close(self) -> None:
+        """未确认的消息放回 incoming：整份未动过的文件直接改名，部分确认过的只写回未确认部分"""
+        with self._lock:
+            files, self._files = self._files, {}
+            self._buffer = []
+        for name, state in files.items():
+            path = self.claimed / name
+            if len(state["pending"]) == len(state["messages"]):
+                os.replace(path, self.incoming / name)
+                continue
+            remaining = [state["messages"][i] for i in sorted(state["pending"])] + [m for m, _, _ in state["failed"]]
+            if remaining:
+                self._write(self.incoming, self._retry_name(name, self._attempts(name)), remaining)
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"incoming": len(list(self.incoming.glob("*.jsonl"))),
+                "processing": len(list(self.processing.glob("*/*.jsonl"))),
+                "delayed": len(list(self.delayed.glob("*.jsonl"))),
+                "dead": len(list(self.dead.glob("*.jsonl")))}
+
+
+def open_source(spec: str, **kwargs) -> QueueSource:
+    """"sqlite:<文件>" 或 "spool:<目录>" """
+    kind, _, location = spec.partition(":")
+    if kind == "sqlite" and location:
+        return SQLiteQueueSource(location, **kwargs)
+    if kind == "spool" and location:
+        return SpoolSource(location, **kwargs)
+    raise ValueError(f"不支持的消息来源: {spec}（sqlite:<文件> 或 spool:<目录>）")
+
+
+class QueueWorker:
+    """
+    见模块说明；predict 一般为 engine.predict。
+    is_available 返回 False（一般为熔断器打开）时暂停取消息，LLM 不可用导致的失败延迟 unavailable_delay 秒重投
+    """
+
+    def __init__(self, source: QueueSource, predict: Callable[..., Dict[str, Any]],
+                 store: Optional[ResultStore] = None, batch_size: int = 200, max_wait: float = 2.0,
+                 max_workers: int = 16, priority: str = NEAR_REAL_TIME,
+                 is_available: Optional[Callable[[], bool]] = None, unavailable_delay: float = 30.0):
+        self.source = source
+        self.predict = predict
+        self.store = store or ResultStore()
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.priority = priority
+        self.is_available = is_available or (lambda: True)
+        self.unavailable_delay = unavailable_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="queue-worker")
+        self._stop = threading.Event()
+        self.batches = self.processed = self.failed = self.rejected = 0
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _predict(self, item: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Exception]]:
+        try:
+            return self.predict(item["text"], self.priority), None
+        except Exception as e:
+            return None, e
+
+    def process(self, messages: List[Message]) -> Tuple[int, int]:
+        """判定一批消息，写入结果库后确认；返回 (成功, 失败) 条数"""
+        parsed, rejected = [], []
+        for message in messages:
+            item = parse_input_line(message.body)
+            try:
+                # 先校验时间戳（含 inf/nan、超出日期范围），格式错误的消息不调用 LLM，直接进入死信
+                item["ts"] = parse_ts(item["ts"])
+            except (ValueError, OverflowError) as e:
+                print(f"消息 {message.id} 无法处理，进入死信: {e}")
+                rejected.append(message)
+                continue
+            parsed.append((message, item))
+
+        records, done, retry, deferred = [], [], [], []
+        outcomes = self._executor.map(self._predict, [item for _, item in parsed])
+        for (message, item), (result, error) in zip(parsed, outcomes):
+            if isinstance(error, CircuitOpenError) or (result is not None and result.get("degraded")):
+                # LLM 不可用：降级判定只是本地规则结论，延迟重投等 LLM 恢复，不计重试次数
+                deferred.append(message)
+                continue
+            if result is None:
+                retry.append(message)
+                continue
+            try:
+                records.append(make_record(item["text"], result, item["conversation_id"], item["agent"],
+                                           item["ts"]))
+            except (ValueError, OverflowError) as e:
+                # 只把这一条放进死信，同批其他消息照常入库
+                print(f"消息 {message.id} 无法生成结果记录，进入死信: {e}")
+                rejected.append(message)
+                continue
+            done.append(message)
+        if records:
+            try:
+                self.store.append(records)
+            except Exception as e:
+                print(f"结果写入失败，整批放回队列: {type(e).__name__}: {e}")
+                deferred, done = deferred + done, []
+        self.source.ack(done)
+        if retry:
+            self.source.nack(retry)
+        if deferred:
+            self.source.nack(deferred, delay=self.unavailable_delay, count_attempt=False)
+        if rejected:
+            self.source.reject(rejected)
+            self.rejected += len(rejected)
+        return len(done), len(retry) + len(deferred) + len(rejected)
+
+    def run(self, poll_interval: float = 1.0) -> None:
+        """循环取批处理，直到 stop()；当前批处理完才退出"""
+        paused = False
+        while not self._stop.is_set():
+            if not self.is_available():
+                if not paused:
+                    print("LLM 不可用（熔断中），暂停取消息")
+                    paused = True
+                self._stop.wait(poll_interval)
+                continue
+            if paused:
+                print("LLM 已恢复，继续取消息")
+                paused = False
+            messages = self.source.receive(self.batch_size, self.max_wait)
+            if not messages:
+                continue
+            began = time.monotonic()
+            try:
+                ok, failed = self.process(messages)
+            except Exception as e:
+                # 单批意外失败不能让 worker 退出：能放回的放回（计重试次数），放不回的等租约超时重投
+                print(f"批次处理异常，整批放回队列: {type(e).__name__}: {e}")
+                try:
+                    self.source.nack(messages)
+                except Exception as nack_error:
+                    print(f"放回队列失败，等待租约超时后重投: {type(nack_error).__name__}: {nack_error}")
+                ok, failed = 0, len(messages)
+            self.batches += 1
+            self.processed += ok
+            self.failed += failed
+            print(f"批次 {self.batches}: {ok} 条已判定入库，{failed} 条放回队列或进入死信，"
+                  f"耗时 {time.monotonic() - began:.1f}s")
+        self.source.close()
+        self._executor.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"batches": self.batches, "processed": self.processed, "failed": self.failed,
+                "rejected": self.rejected}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息队列消费 worker：持续判定聊天网关的消息")
+    parser.add_argument("--source", default=os.getenv("WORKER_SOURCE", "sqlite:queue.sqlite"),
+                        help="sqlite:<文件> 或 spool:<目录>")
+    parser.add_argument("--publish", help="把 jsonl / txt 文件的每一行写入消息来源后退出（本地测试用）")
+    parser.add_argument("--rules", default=None)
+    parser.add_argument("--store", default=None, help="结果库目录（默认 RESULT_STORE_DIR）")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--max-wait", type=float, default=2.0, help="攒批最长等待秒数")
+    parser.add_argument("--workers", type=int, default=16, help="每批并发 predict 的线程数")
+    parser.add_argument("--visibility-timeout", type=float, default=DEFAULT_VISIBILITY_TIMEOUT)
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    args = parser.parse_args()
+
+    source = open_source(args.source, visibility_timeout=args.visibility_timeout, max_attempts=args.max_attempts)
+    if args.publish:
+        with open(args.publish, encoding="utf-8") as f:
+            n = source.publish(line.strip() for line in f if line.strip())
+        print(f"已写入 {n} 条消息 -> {args.source}")
+        return
+
+    from .rag_engine import ComplianceRAGEngine
+
+    engine = ComplianceRAGEngine(args.rules)
+    worker = QueueWorker(source, engine.predict, ResultStore(args.store), args.batch_size, args.max_wait,
+                         args.workers, is_available=lambda: engine.breaker.state != OPEN)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: worker.stop())
+    print(f"worker 启动: {args.source}，批大小 {args.batch_size}，最长等待 {args.max_wait}s")
+    worker.run()
+    print(f"worker 退出: {json.dumps(worker.stats(), ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
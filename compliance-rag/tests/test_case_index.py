@@ -0,0 +1,50 @@
+# tests/test_case_index.py
+"""历史案例索引：事件过滤返回满 k 条，事件种类超过掩码位数时照常收录"""
+import hashlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from src.case_index import MAX_EVENTS, CaseIndex
+
+
+class HashEmbeddings:
+    """按文本哈希生成的确定性单位向量"""
+
+    dim = 16
+
+    def embed_query(self, text):
+        seed = int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:4], "little")
+        v = np.random.default_rng(seed).normal(size=self.dim)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def case(i, event):
+    return {"text": f"案例{i}", "violation": event != "无", "triggered_event": event, "reason": ""}
+
+
+@pytest.fixture
+def index(tmp_path):
+    # 需要训练的 IVF 索引，样本不够时走 pending 暴力检索
+    return CaseIndex(str(tmp_path), HashEmbeddings(), factory="IVF4,Flat", train_size=1000)
+
+
+def test_filtered_search_returns_k_pending(index):
+    index.add_many([case(i, "承诺收益" if i % 10 == 0 else "无") for i in range(200)])
+    found = index.search("查询", k=5, events=["承诺收益"])
+    assert len(found) == 5
+    assert all(c.triggered_event == "承诺收益" for c in found)
+
+
+def test_event_overflow_is_recorded_without_mask_bit(index):
+    index.add_many([case(i, f"事件{i}") for i in range(MAX_EVENTS + 3)])
+    assert len(index) == MAX_EVENTS + 3
+    assert index.stats()["case_index_unmasked_events"] == 3
+    (overflow,) = index.get([MAX_EVENTS + 1])
+    assert overflow.triggered_event == f"事件{MAX_EVENTS + 1}"
+    assert [c.triggered_event for c in index.search("查询", k=1, events=["事件0"])] == ["事件0"]
@@ -0,0 +1,105 @@
+# tests/test_circuit_breaker.py
+"""熔断器状态转换，以及降级判定复核队列的重试 / 放弃"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from src.recheck_queue import RecheckQueue
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = SimpleNamespace(status_code=status, headers={})
+
+
+def fail(status):
+    raise HTTPStatusError(status)
+
+
+def test_opens_half_opens_and_closes():
+    transitions = []
+    breaker = CircuitBreaker(failure_threshold=3, window=5, recovery_timeout=0.05,
+                             on_state_change=lambda old, new: transitions.append((old, new)))
+    for _ in range(3):
+        with pytest.raises(HTTPStatusError):
+            breaker.call(fail, 503)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CLOSED
+    assert transitions == [(CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)]
+
+
+def test_half_open_failure_reopens_and_limits_probes():
+    breaker = CircuitBreaker(failure_threshold=1, window=1, recovery_timeout=0.05)
+    with pytest.raises(HTTPStatusError):
+        breaker.call(fail, 429)
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    # 探测名额只有一个
+    assert breaker.allow() is False
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["circuit_opens"] == 2
+
+
+def test_fatal_errors_do_not_count():
+    breaker = CircuitBreaker(failure_threshold=2, window=4)
+    for _ in range(5):
+        with pytest.raises(HTTPStatusError):
+            breaker.call(fail, 400)
+    assert breaker.state == CLOSED
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_recheck_parks_poison_text_and_keeps_draining():
+    queue = RecheckQueue(max_attempts=3)
+    attempts = {"坏": 0}
+
+    def recheck(text):
+        if text == "坏":
+            attempts["坏"] += 1
+            fail(503)
+        return {"violation": False, "triggered_event": "无"}
+
+    queue.put("坏", {"degraded": True})
+    queue.put("好", {"degraded": True})
+    queue.start(recheck, lambda: True, poll_interval=0.0)
+    assert wait_until(lambda: len(queue.failed) == 1 and len(queue.rechecked) == 1)
+    assert attempts["坏"] == 3
+    assert [text for text, _ in queue.rechecked] == ["好"]
+
+
+def test_recheck_fatal_error_and_open_circuit():
+    queue = RecheckQueue(max_attempts=3)
+    calls = []
+
+    def recheck(text):
+        calls.append(text)
+        if text == "拒绝":
+            fail(400)
+        if len(calls) < 5:
+            raise CircuitOpenError("open")
+        return {"violation": False, "triggered_event": "无"}
+
+    queue.put("拒绝", {"degraded": True})
+    queue.put("熔断", {"degraded": True})
+    queue.start(recheck, lambda: True, poll_interval=0.0)
+    assert wait_until(lambda: len(queue.rechecked) == 1)
+    # 400 不重试；熔断导致的失败不计次数，超过 max_attempts 次仍会继续复核
+    assert calls.count("拒绝") == 1
+    assert calls.count("熔断") >= 4
+    assert [text for text, _, _ in queue.failed] == ["拒绝"]
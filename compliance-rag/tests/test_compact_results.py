@@ -0,0 +1,46 @@
+# tests/test_compact_results.py
+"""列式批量结果：溢写前后内容一致，超过 64 种的事件名不丢失"""
+import pytest
+
+from src.compact_results import MAX_EVENTS, RAW_ZLIB, CompactResults
+
+
+def result(events, i):
+    return {"violation": events != "无", "triggered_event": events, "reason": f"理由{i}" * 5,
+            "raw_response": f"原始输出{i}", "source": "llm" if i % 2 else "local", "degraded": i % 7 == 0}
+
+
+@pytest.mark.parametrize("chunk_rows", [1000, 7])
+def test_roundtrip_with_and_without_spill(tmp_path, chunk_rows):
+    rows = [(f"文本{i}", result(["无", "使用敏感词汇", "使用敏感词汇,不文明用语"][i % 3], i)) for i in range(50)]
+    compact = CompactResults(chunk_rows=chunk_rows, spill_dir=str(tmp_path), raw=RAW_ZLIB, compress_reason=True)
+    compact.extend(rows)
+    assert len(compact) == 50
+    for record, (text, expected) in zip(compact, rows):
+        assert (record.text, record.triggered_event, record.reason, record.raw_response, record.source,
+                record.degraded) == (text, expected["triggered_event"], expected["reason"],
+                                     expected["raw_response"], expected["source"], expected["degraded"])
+    assert compact.counts() == {"total": 50, "violation": 33, "使用敏感词汇": 33, "不文明用语": 16}
+    frame = compact.to_frame({"text": "原文"})
+    assert list(frame["原文"]) == [text for text, _ in rows]
+    compact.close()
+
+
+def test_events_beyond_mask_are_kept():
+    compact = CompactResults()
+    for i in range(MAX_EVENTS + 2):
+        compact.append(f"t{i}", result(f"事件{i}", i))
+    compact.append("多个", result(f"事件0,事件{MAX_EVENTS + 1}", 1))
+    records = list(compact)
+    assert records[MAX_EVENTS + 1].triggered_event == f"事件{MAX_EVENTS + 1}"
+    assert records[-1].triggered_event == f"事件0,事件{MAX_EVENTS + 1}"
+    counts = compact.counts()
+    assert counts["事件0"] == 2 and counts[f"事件{MAX_EVENTS + 1}"] == 2
+
+
+def test_csv_export(tmp_path):
+    compact = CompactResults(chunk_rows=3, spill_dir=str(tmp_path / "spill"))
+    compact.extend((f"文本{i}", result("无", i)) for i in range(10))
+    path = tmp_path / "out.csv"
+    compact.to_csv(str(path))
+    assert len(path.read_text(encoding="utf-8-sig").splitlines()) == 11
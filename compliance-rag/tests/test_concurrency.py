@@ -0,0 +1,112 @@
+# tests/test_concurrency.py
+"""AIMD 并发控制器：单元行为，以及对本地假接口（注入 429/503）的自适应"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from fake_llm_server import FakeLLMHandler
+from src.concurrency import AdaptiveConcurrencyController, classify_error, extract_retry_after
+
+
+class HTTPStatusError(Exception):
+    """与 openai / httpx 异常一样带 status_code 与 response.headers"""
+
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = SimpleNamespace(status_code=status, headers=dict(headers or {}))
+
+
+@pytest.fixture
+def fake_server():
+    FakeLLMHandler.config = SimpleNamespace(capacity=3, throttle_rate=0.0, error_rate=0.0,
+                                            retry_after=0.05, latency=0.01)
+    FakeLLMHandler.inflight = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeLLMHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, FakeLLMHandler.config
+    server.shutdown()
+    server.server_close()
+
+
+def chat(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    request = urllib.request.Request(url, data=json.dumps({"messages": []}).encode("utf-8"), method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return json.load(response)["choices"][0]["message"]["content"]
+    except urllib.error.HTTPError as e:
+        raise HTTPStatusError(e.code, e.headers) from None
+
+
+def test_classify_error():
+    assert classify_error(HTTPStatusError(429)) == "throttle"
+    assert classify_error(HTTPStatusError(503)) == "server"
+    assert classify_error(HTTPStatusError(400)) == "fatal"
+    assert classify_error(type("ReadTimeout", (Exception,), {})()) == "timeout"
+    assert extract_retry_after(HTTPStatusError(429, {"Retry-After": "2"})) == 2.0
+
+
+def test_additive_increase_and_multiplicative_decrease():
+    controller = AdaptiveConcurrencyController(initial_limit=4, max_limit=8)
+    for _ in range(4):
+        controller.acquire()
+        controller.release(0.1)
+    assert controller.stats()["concurrency_limit"] == 5
+    controller.acquire()
+    controller.release(0.1, "throttle")
+    assert controller.stats()["concurrency_limit"] == 2
+
+
+def test_retry_after_blocks_new_slots():
+    controller = AdaptiveConcurrencyController(initial_limit=4)
+    controller.acquire()
+    controller.release(0.01, "throttle", retry_after=0.2)
+    assert controller.acquire(timeout=0.05) is False
+    assert controller.acquire(timeout=1.0) is True
+
+
+def test_fatal_errors_are_not_retried():
+    controller = AdaptiveConcurrencyController(default_backoff=0.0)
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise HTTPStatusError(400)
+
+    with pytest.raises(HTTPStatusError):
+        controller.call(fail)
+    assert len(calls) == 1
+
+
+def test_adapts_to_fake_endpoint_throttling(fake_server):
+    server, config = fake_server
+    controller = AdaptiveConcurrencyController(initial_limit=12, max_limit=16, default_backoff=0.01,
+                                               max_attempts=50)
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        answers = list(pool.map(lambda _: controller.call(chat, server), range(60)))
+    stats = controller.stats()
+    assert len(answers) == 60
+    assert stats["count_throttle"] > 0
+    # 超过假接口容量（3）被限流后，并发上限降到容量附近
+    assert stats["concurrency_limit"] < 12
+
+
+def test_server_errors_back_off(fake_server):
+    server, config = fake_server
+    config.error_rate = 1.0
+    controller = AdaptiveConcurrencyController(initial_limit=8, default_backoff=0.01, max_attempts=3)
+    started = time.monotonic()
+    with pytest.raises(HTTPStatusError):
+        controller.call(chat, server)
+    assert controller.stats()["count_server"] == 3
+    assert controller.stats()["concurrency_limit"] < 8
+    assert time.monotonic() - started >= 0.03
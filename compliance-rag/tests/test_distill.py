@@ -0,0 +1,45 @@
+# tests/test_distill.py
+"""蒸馏分类器：只用 LLM 标签训练，正样本不会被放行，没训练出模型的事件不放行"""
+import pytest
+
+pytest.importorskip("sklearn")
+
+from src.distill import DistilledClassifier, VerdictLog, train_distilled
+
+VIOLATIONS = ["加老师微信{}领取内部消息", "私聊老师{}号，带你上车", "老师微信{}，拉你进内部群"]
+CLEARS = ["今天大盘震荡{}，注意控制仓位", "公司公告第{}季度业绩", "市场情绪回暖{}，理性投资"]
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = VerdictLog(str(tmp_path / "verdicts.jsonl"))
+    for i in range(60):
+        log.append(VIOLATIONS[i % 3].format(i), {"violation": True, "triggered_event": "私下联系"})
+        log.append(CLEARS[i % 3].format(i), {"violation": False, "triggered_event": "无"})
+    # 本地结论不作为训练标签
+    log.append("加老师微信领取", {"violation": False, "triggered_event": "无", "source": "local"})
+    return log
+
+
+def test_train_and_clear(log, tmp_path):
+    path = str(tmp_path / "distilled.npz")
+    report = train_distilled(log, path, dim=1 << 12, holdout=0.3)
+    assert report["私下联系"]["recall@clear"] == 1.0
+    model = DistilledClassifier(path)
+    assert model.events == ["私下联系"]
+    assert not model.clears("加老师微信888领取内部消息")
+    assert model.clears("公司公告第三季度业绩")
+
+
+def test_event_without_model_is_never_cleared(log, tmp_path):
+    log.append("罕见违规话术", {"violation": True, "triggered_event": "罕见事件"})
+    path = str(tmp_path / "distilled.npz")
+    train_distilled(log, path, dim=1 << 12, holdout=0.3)
+    model = DistilledClassifier(path)
+    assert "罕见事件" in model.all_events and "罕见事件" not in model.events
+    assert not model.clears("公司公告第三季度业绩")
+
+
+def test_empty_log_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        train_distilled(VerdictLog(str(tmp_path / "empty.jsonl")), str(tmp_path / "m.npz"))
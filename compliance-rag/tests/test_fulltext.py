@@ -0,0 +1,73 @@
+# tests/test_fulltext.py
+"""全文索引：任意子串可查、布尔查询、分片导入与导入记录同一事务"""
+import sqlite3
+
+import pytest
+
+from src.fulltext import FullTextIndex
+from src.result_store import ResultStore, make_record
+
+CLEAR = {"violation": False, "triggered_event": "无", "reason": ""}
+TEXTS = ["这只sh600519明天还能涨", "华泰证券最低佣金万一", "华泰证券开户送VIP", "今天天气不错"]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = FullTextIndex(str(tmp_path / "fulltext"), keywords=["华泰证券", "佣金", "vip"])
+    index.add([make_record(t, CLEAR, agent="张三" if i % 2 else "李四", ts="2024-05-01 10:00")
+               for i, t in enumerate(TEXTS)])
+    return index
+
+
+def texts(index, query, **kwargs):
+    frame, total, _ = index.search(query, **kwargs)
+    assert total == len(frame)
+    return sorted(frame["text"])
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("600519", [TEXTS[0]]),
+    ("h6005", [TEXTS[0]]),
+    ("ip", [TEXTS[2]]),
+    ("券最低", [TEXTS[1]]),
+    ("华泰证券 佣金", [TEXTS[1]]),
+    ("华泰证券 -佣金", [TEXTS[2]]),
+    ("天气 OR 600519", [TEXTS[0], TEXTS[3]]),
+    ('"天不错"', []),
+])
+def test_substring_and_boolean_queries(index, query, expected):
+    assert texts(index, query) == sorted(expected)
+
+
+def test_agent_and_date_filters(index):
+    assert texts(index, "华泰证券", agents=["张三"]) == [TEXTS[1]]
+    assert texts(index, "华泰证券", start="2024-05-02") == []
+
+
+def test_ingest_store_commits_part_with_postings(tmp_path):
+    store = ResultStore(str(tmp_path / "results"))
+    store.append([make_record(t, CLEAR, ts="2024-05-01 10:00") for t in TEXTS])
+    index = FullTextIndex(str(tmp_path / "fulltext"))
+    tokenize = index.tokenizer.index_tokens
+
+    def fail(text):
+        raise RuntimeError("boom")
+
+    index.tokenizer.index_tokens = fail
+    with pytest.raises(RuntimeError):
+        index.ingest_store(store)
+    # 失败的分片既没有文档也没有导入记录，下次会完整重新导入
+    assert index.stats()["docs"] == 0
+    index.tokenizer.index_tokens = tokenize
+    assert index.ingest_store(store) == len(TEXTS)
+    assert index.ingest_store(store) == 0
+    assert texts(index, "600519") == [TEXTS[0]]
+
+
+def test_index_with_old_tokenizer_is_rejected(index):
+    conn = sqlite3.connect(str(index.db_path))
+    with conn:
+        conn.execute("PRAGMA user_version = 0")
+    conn.close()
+    with pytest.raises(ValueError):
+        FullTextIndex(str(index.root))
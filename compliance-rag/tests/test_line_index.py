@@ -0,0 +1,46 @@
+# tests/test_line_index.py
+"""大文件按行索引：随机访问、索引复用与失效、按字节分片"""
+import os
+
+from src.line_index import LineIndex
+
+
+def test_random_access_and_iteration(tmp_path):
+    path = tmp_path / "chat.txt"
+    path.write_bytes("﻿第一行\nsecond line\n\r\n带回车\r\n最后一行没有换行".encode("utf-8"))
+    with LineIndex(str(path)) as index:
+        assert len(index) == 5
+        assert index.line(0) == "第一行"
+        assert index.line(3) == "带回车"
+        assert index.line(4) == "最后一行没有换行"
+        assert bytes(index.line_bytes(1)) == b"second line"
+        assert [n for n, text in index.iter_lines() if text] == [0, 1, 3, 4]
+
+
+def test_index_is_reused_and_rebuilt_on_change(tmp_path):
+    path = tmp_path / "chat.txt"
+    path.write_text("a\nb\n", encoding="utf-8")
+    LineIndex(str(path)).close()
+    assert os.path.exists(str(path) + ".lines")
+    with LineIndex(str(path)) as index:
+        assert len(index) == 2
+    path.write_text("a\nb\nc\n", encoding="utf-8")
+    with LineIndex(str(path)) as index:
+        assert len(index) == 3 and index.line(2) == "c"
+
+
+def test_shards_cover_all_lines(tmp_path):
+    path = tmp_path / "chat.txt"
+    path.write_text("".join(f"第{i}行内容\n" for i in range(1000)), encoding="utf-8")
+    with LineIndex(str(path)) as index:
+        shards = index.shards(7)
+        assert shards[0][0] == 0 and shards[-1][1] == 1000
+        assert all(a < b for a, b in shards)
+        assert all(prev[1] == cur[0] for prev, cur in zip(shards, shards[1:]))
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    with LineIndex(str(path)) as index:
+        assert len(index) == 0 and index.shards(4) == []
@@ -0,0 +1,89 @@
+# tests/test_llm_pool.py
+"""LLM 后端池：按负载路由、连续失败摘除、鉴权失败立即摘除"""
+from types import SimpleNamespace
+
+import pytest
+
+from src.llm_pool import LLMBackend, LLMPool, TokenBucket, track_usage
+from src.schemas import LLMBackendConfig
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = SimpleNamespace(status_code=status, headers={})
+
+
+class FakeLLM:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(content="是否违规：否", usage_metadata={"input_tokens": 10, "output_tokens": 2})
+
+
+def make_pool(*llms, **kwargs):
+    backends = [LLMBackend(LLMBackendConfig(name=f"b{i}", api_key="k", qps=1000, burst=1000), llm)
+                for i, llm in enumerate(llms)]
+    return LLMPool(backends, **kwargs)
+
+
+def test_routes_to_least_loaded():
+    pool = make_pool(FakeLLM(), FakeLLM())
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    pool.release(first)
+    pool.release(second)
+
+
+def test_ejects_after_consecutive_errors():
+    bad, good = FakeLLM(HTTPStatusError(503)), FakeLLM()
+    pool = make_pool(bad, good, eject_after=2, eject_seconds=60)
+    for _ in range(2):
+        # 负载相同时按健康分挑选，bad 先被选中直到被摘除
+        pool.backends[1].inflight += 1
+        with pytest.raises(HTTPStatusError):
+            pool.invoke("prompt")
+        pool.backends[1].inflight -= 1
+    assert bad.calls == 2
+    for _ in range(5):
+        pool.invoke("prompt")
+    assert bad.calls == 2 and good.calls == 5
+
+
+def test_auth_failure_ejects_immediately():
+    bad, good = FakeLLM(HTTPStatusError(401)), FakeLLM()
+    pool = make_pool(bad, good, eject_after=5, eject_seconds=60)
+    pool.backends[1].inflight += 1
+    with pytest.raises(HTTPStatusError):
+        pool.invoke("prompt")
+    pool.backends[1].inflight -= 1
+    for _ in range(3):
+        pool.invoke("prompt")
+    assert bad.calls == 1 and good.calls == 3
+
+
+def test_usage_is_tracked():
+    pool = make_pool(FakeLLM())
+    with track_usage() as usage:
+        pool.invoke("prompt")
+        pool.invoke("prompt")
+    assert usage["llm_calls"] == 2 and usage["input_tokens"] == 20 and not usage["estimated"]
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=10, capacity=2)
+    bucket.take()
+    bucket.take()
+    assert 0 < bucket.wait_time() <= 0.1
+
+
+def test_empty_pool_is_rejected():
+    with pytest.raises(ValueError):
+        LLMPool([])
@@ -0,0 +1,46 @@
+# tests/test_near_dup.py
+"""近似重复复用：只换数字 / 代码 / 日期的话术复用判定，规则相关签名不同时不复用"""
+from src.near_dup import NearDuplicateIndex, mask_entities, rule_signature
+from src.numeric_rules import NumericRuleEvaluator
+
+VIOLATION = {"violation": True, "triggered_event": "承诺收益"}
+
+
+def test_masking_hides_codes_dates_and_numbers():
+    a = mask_entities("2024-05-01 关注600519贵州茅台，目标价1800")
+    b = mask_entities("2024-06-12 关注000858五粮液，目标价150")
+    assert a == b
+
+
+def test_reuses_verdict_for_templated_script():
+    index = NearDuplicateIndex(capacity=100)
+    template = "老师今天推荐{}，明天开盘直接买入，跟上节奏，名额有限，赶紧私信老师领取完整操作计划"
+    index.add(mask_entities(template.format("600519贵州茅台")), 1, VIOLATION)
+    hit = index.lookup(mask_entities(template.format("000858五粮液")), 1)
+    assert hit == (True, "承诺收益", 0)
+    assert index.stats()["near_dup_hits"] == 1
+
+
+def test_different_rule_signature_is_not_reused():
+    index = NearDuplicateIndex(capacity=100)
+    text = mask_entities("老师今天推荐一只票，明天开盘直接买入，跟上节奏")
+    index.add(text, 1, VIOLATION)
+    assert index.lookup(text, 2) is None
+
+
+def test_numeric_verdict_changes_signature():
+    evaluator = NumericRuleEvaluator()
+    a = rule_signature({}, evaluator.evaluate("3天收益30%"))
+    b = rule_signature({}, evaluator.evaluate("今天天气不错"))
+    assert a != b
+
+
+def test_distance_threshold_and_ring_buffer():
+    index = NearDuplicateIndex(capacity=2, max_distance=0)
+    index.add("甲乙丙丁戊己庚辛壬癸子丑寅卯", 0, VIOLATION)
+    assert index.lookup("甲乙丙丁戊己庚辛壬癸子丑寅辰", 0) is None
+    index.add("其他话术一", 0, VIOLATION)
+    index.add("其他话术二", 0, VIOLATION)
+    # 环形缓冲区覆盖了最早的槽位
+    assert len(index) == 2
+    assert index.lookup("甲乙丙丁戊己庚辛壬癸子丑寅卯", 0) is None
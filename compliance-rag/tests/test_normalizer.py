@@ -0,0 +1,24 @@
+# tests/test_normalizer.py
+"""变体词典不能改写正常用语"""
+from pathlib import Path
+
+import pytest
+
+from src.normalizer import TextNormalizer
+from src.rule_loader import load_all_rules
+
+RULES_FILE = Path(__file__).resolve().parent.parent / "src" / "compliance_rules.yaml"
+
+
+@pytest.fixture(scope="module")
+def normalizer():
+    return TextNormalizer.from_rules(load_all_rules(str(RULES_FILE)))
+
+
+@pytest.mark.parametrize("text", ["公司主要股东减持", "这是重要股票"])
+def test_common_words_are_not_rewritten(normalizer, text):
+    assert "妖股" not in normalizer.normalize(text).text
+
+
+def test_variants_are_rewritten(normalizer):
+    assert normalizer.normalize("又一只妖g").text == "又一只妖股"
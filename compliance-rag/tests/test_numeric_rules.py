@@ -0,0 +1,64 @@
+# tests/test_numeric_rules.py
+"""数值类规则的确定性判定：误报样例必须不为 True，典型违规样例必须为 True"""
+import pytest
+
+from src.numeric_rules import (BENCHMARK_FUTURE_TREND, LOW_INPUT_HIGH_RETURN, SHORT_TERM_HIGH_RETURN,
+                               NumericRuleEvaluator, extract_entities)
+
+evaluator = NumericRuleEvaluator()
+
+
+@pytest.mark.parametrize("text, event", [
+    ("今天两市有50个涨停，大家会觉得市场很热", BENCHMARK_FUTURE_TREND),
+    ("抓住这次机会，昨天有3个涨停", BENCHMARK_FUTURE_TREND),
+    ("3月买入，收益20%", SHORT_TERM_HIGH_RETURN),
+    ("2024年目标收益30%", SHORT_TERM_HIGH_RETURN),
+    ("5月3日买入收益20%", SHORT_TERM_HIGH_RETURN),
+    ("千万不要拿本金去赚5万", LOW_INPUT_HIGH_RETURN),
+    ("别信什么投入1万赚10万", LOW_INPUT_HIGH_RETURN),
+])
+def test_false_positives_are_not_triggered(text, event):
+    assert evaluator.evaluate(text)[event].triggered is not True
+
+
+@pytest.mark.parametrize("text, event", [
+    ("投入1万，一个月赚5万", LOW_INPUT_HIGH_RETURN),
+    ("拿10万本金赚了20万", LOW_INPUT_HIGH_RETURN),
+    ("3天收益30%", SHORT_TERM_HIGH_RETURN),
+    ("3个月内收益翻倍", SHORT_TERM_HIGH_RETURN),
+    ("3月内收益翻倍", SHORT_TERM_HIGH_RETURN),
+    ("这只票会有3个连板", BENCHMARK_FUTURE_TREND),
+    ("下周还有3个涨停", BENCHMARK_FUTURE_TREND),
+    ("明天至少涨20%", BENCHMARK_FUTURE_TREND),
+    ("3-5个涨停", BENCHMARK_FUTURE_TREND),
+])
+def test_clear_violations_are_triggered(text, event):
+    assert evaluator.evaluate(text)[event].triggered is True
+
+
+def test_dates_are_not_timespans():
+    kinds = {e.text: e.kind for e in extract_entities("2024年3月15日买入，3个月内目标翻倍")}
+    assert "2024年" not in kinds and "3月" not in kinds and "15日" not in kinds
+    assert kinds["3个月"] == "timespan"
+
+
+def test_qianwan_adverb_is_not_amount():
+    assert [e.text for e in extract_entities("千万不要拿本金去赚5万")] == ["5万"]
+    assert [e.text for e in extract_entities("本金一千万")] == ["一千万"]
+
+
+@pytest.mark.parametrize("text, event", [
+    ("5万本金，老师带你做到15万", LOW_INPUT_HIGH_RETURN),
+    ("本金3万，跟着老师操作账户到了8万", LOW_INPUT_HIGH_RETURN),
+    ("我们保证一周之内给你赚10个点", SHORT_TERM_HIGH_RETURN),
+    ("今天5万进场，下周就能拿到10万收益", SHORT_TERM_HIGH_RETURN),
+    ("跟上老师，下个月必有5个板", BENCHMARK_FUTURE_TREND),
+])
+def test_unparsed_numeric_claims_defer_to_llm(text, event):
+    """数字或收益表述解析不全时必须交给 LLM，不能给出确定不违规"""
+    assert evaluator.evaluate(text)[event].triggered is not False
+
+
+def test_text_without_numbers_is_clear():
+    verdicts = evaluator.evaluate("今天天气不错，大家注意休息")
+    assert all(v.triggered is False for v in verdicts.values())
@@ -0,0 +1,77 @@
+# tests/test_priority_scheduler.py
+"""优先级调度：在线请求优先，bulk 占用上限，在线排队时 bulk 再收紧"""
+import threading
+import time
+
+from src.priority_scheduler import BULK, INTERACTIVE, NEAR_REAL_TIME, PriorityScheduler
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+def start(scheduler, priority, order, cost=1.0):
+    thread = threading.Thread(target=lambda: (scheduler.acquire(priority, cost), order.append(priority)),
+                              daemon=True)
+    thread.start()
+    return thread
+
+
+def test_bulk_share_is_capped():
+    scheduler = PriorityScheduler(lambda: 10)
+    order = []
+    for _ in range(10):
+        start(scheduler, BULK, order)
+    assert wait_until(lambda: len(order) == 6)
+    time.sleep(0.05)
+    bulk = scheduler.stats()[BULK]
+    assert (bulk["inflight"], bulk["queued"]) == (6, 4)
+
+
+def test_interactive_goes_first_when_slots_free_up():
+    scheduler = PriorityScheduler(lambda: 2)
+    scheduler.acquire(NEAR_REAL_TIME)
+    scheduler.acquire(INTERACTIVE)
+    order = []
+    start(scheduler, NEAR_REAL_TIME, order)
+    assert wait_until(lambda: scheduler.stats()[NEAR_REAL_TIME]["queued"] == 1)
+    start(scheduler, INTERACTIVE, order)
+    assert wait_until(lambda: scheduler.stats()[INTERACTIVE]["queued"] == 1)
+    scheduler.release(NEAR_REAL_TIME)
+    assert wait_until(lambda: order == [INTERACTIVE])
+    scheduler.release(INTERACTIVE)
+    assert wait_until(lambda: order == [INTERACTIVE, NEAR_REAL_TIME])
+
+
+def test_bulk_tightens_under_interactive_pressure():
+    scheduler = PriorityScheduler(lambda: 8, max_share={INTERACTIVE: 0.5}, bulk_share_under_pressure=0.25)
+    for _ in range(4):
+        scheduler.acquire(INTERACTIVE)
+    order = []
+    start(scheduler, INTERACTIVE, order)
+    assert wait_until(lambda: scheduler.stats()[INTERACTIVE]["queued"] == 1)
+    for _ in range(4):
+        start(scheduler, BULK, order)
+    # 在线请求排队时 bulk 最多占 8 * 0.25 = 2 个名额
+    assert wait_until(lambda: order.count(BULK) == 2)
+    time.sleep(0.05)
+    assert order.count(BULK) == 2
+
+
+def test_weighted_fair_share_between_queued_classes():
+    scheduler = PriorityScheduler(lambda: 1, max_share={BULK: 1.0, NEAR_REAL_TIME: 1.0})
+    scheduler.acquire(BULK)
+    order = []
+    threads = [start(scheduler, p, order) for p in [BULK] * 4 + [NEAR_REAL_TIME] * 4]
+    assert wait_until(lambda: sum(c["queued"] for c in scheduler.stats().values()) == 8)
+    for _ in range(8):
+        scheduler.release(order[-1] if order else BULK)
+        count = len(order)
+        assert wait_until(lambda: len(order) == count + 1)
+    # 权重 3:1，准实时请求先于大部分 bulk 请求放行
+    assert order[:4].count(NEAR_REAL_TIME) >= 3
+    for thread in threads:
+        thread.join(1)
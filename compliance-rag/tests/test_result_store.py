@@ -0,0 +1,116 @@
+# tests/test_result_store.py
+"""结果库与批量任务：时间戳解析、按索引查询、任务逐条持久化后整批入库"""
+import datetime as dt
+import socket
+import threading
+import time
+
+import pytest
+
+from src.batch_jobs import DONE, INTERRUPTED, RUNNING, BatchJobManager
+from src.result_store import ResultStore, make_record, parse_input_line, parse_ts
+
+VIOLATION = {"violation": True, "triggered_event": "直接承诺收益,使用敏感词汇", "reason": "r"}
+CLEAR = {"violation": False, "triggered_event": "无", "reason": ""}
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1714521600, 1714521600.0),
+    ("1714521600", 1714521600.0),
+    (1714521600123, 1714521600.123),
+    ("2024-05-01T00:00:00+00:00", 1714521600.0),
+    (dt.datetime(2024, 5, 1, tzinfo=dt.timezone.utc), 1714521600.0),
+])
+def test_parse_ts_formats(value, expected):
+    assert parse_ts(value) == pytest.approx(expected)
+
+
+def test_parse_input_line():
+    assert parse_input_line('{"text": "你好", "agent": "A", "ts": 1}') == \
+        {"text": "你好", "agent": "A", "conversation_id": "", "ts": 1}
+    assert parse_input_line("纯文本", "c1")["conversation_id"] == "c1"
+
+
+def test_store_query_and_summary(tmp_path):
+    store = ResultStore(str(tmp_path))
+    store.append([
+        make_record("a", VIOLATION, "c1", "张三", "2024-05-01T10:00:00"),
+        make_record("b", CLEAR, "c1", "李四", "2024-05-02T10:00:00"),
+        make_record("c", VIOLATION, "c2", "张三", "2024-05-02T11:00:00"),
+    ])
+    assert store.query(event="使用敏感词汇")["text"].tolist() == ["a", "c"]
+    assert store.query(agent="李四", violation=False)["text"].tolist() == ["b"]
+    assert store.query(start="2024-05-02")["text"].tolist() == ["b", "c"]
+    summary = {row["event"]: row["n"] for row in store.summary(("event",), violation=True)}
+    assert summary == {"直接承诺收益": 2, "使用敏感词汇": 2}
+    assert len(store.scan()) == 3
+
+
+def wait_done(manager, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while manager.get(job_id)["status"] != DONE and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return manager.get(job_id)
+
+
+def test_job_runs_and_persists(tmp_path):
+    store = ResultStore(str(tmp_path / "results"))
+    manager = BatchJobManager(lambda text: VIOLATION if "保证" in text else CLEAR,
+                              root=str(tmp_path / "jobs"), max_workers=2, store=store)
+    items = ({"text": f"保证收益{i}" if i % 3 == 0 else f"正常{i}", "agent": "A", "conversation_id": "",
+              "ts": 1714521600 + i} for i in range(30))
+    job_id = manager.submit(items, name="上传.txt")
+    job = wait_done(manager, job_id)
+    assert (job["status"], job["total"], job["done"]) == (DONE, 30, 30)
+    assert manager.counts(job_id) == {"violation": 10, "compliant": 20, "failed": 0}
+    assert [item["idx"] for item in manager.results(job_id, offset=5, limit=3)] == [5, 6, 7]
+    assert len(store.query(conversation_id="上传.txt")) == 30
+    assert manager.export(job_id).counts()["直接承诺收益"] == 10
+
+
+def test_failed_items_are_recorded(tmp_path):
+    def predict(text):
+        if text == "坏":
+            raise RuntimeError("boom")
+        return CLEAR
+
+    manager = BatchJobManager(predict, root=str(tmp_path), max_workers=2)
+    job_id = manager.submit([{"text": t, "ts": None} for t in ("好", "坏", "好")])
+    wait_done(manager, job_id)
+    assert manager.counts(job_id)["failed"] == 1
+    (failed,) = [item for item in manager.results(job_id) if item["status"] != DONE]
+    assert "boom" in failed["result"]["error"]
+
+
+def test_submit_failure_leaves_no_partial_job(tmp_path):
+    manager = BatchJobManager(lambda text: CLEAR, root=str(tmp_path))
+
+    def items():
+        yield {"text": "a"}
+        raise OSError("upload broken")
+
+    with pytest.raises(OSError):
+        manager.submit(items())
+    assert manager.list_jobs() == []
+
+
+def test_only_jobs_of_dead_owners_are_interrupted(tmp_path):
+    release = threading.Event()
+    running = BatchJobManager(lambda text: release.wait(5) and CLEAR, root=str(tmp_path), max_workers=1)
+    live = running.submit([{"text": "慢"}])
+    now = time.time()
+    conn = running._connect()
+    with conn:
+        conn.executemany("INSERT INTO jobs (id, name, status, total, created, updated, owner, heartbeat) "
+                         "VALUES (?, '', ?, 0, ?, ?, ?, ?)", [
+                             ("dead", RUNNING, now, now, f"{socket.gethostname()}:{2 ** 22 + 12345}:x", now),
+                             ("stale", RUNNING, now, now, "other-host:1:x", now - 3600),
+                             ("remote", RUNNING, now, now, "other-host:1:y", now),
+                         ])
+    other = BatchJobManager(lambda text: CLEAR, root=str(tmp_path))
+    status = {job["id"]: job["status"] for job in other.list_jobs()}
+    assert status == {live: RUNNING, "dead": INTERRUPTED, "stale": INTERRUPTED, "remote": RUNNING}
+    release.set()
+    assert wait_done(running, live)["status"] == DONE
+    running.close()
+    other.close()
@@ -0,0 +1,56 @@
+# tests/test_rule_versions.py
+"""规则版本与重判：只重判受变更规则影响的文本，版本文件多实例注册不丢失"""
+from pathlib import Path
+
+from src.distill import VerdictLog
+from src.numeric_rules import NumericRuleEvaluator
+from src.rule_loader import load_all_rules
+from src.rule_versions import RuleSetVersion, RuleVersionRegistry, plan_reaudit
+
+RULES_FILE = Path(__file__).resolve().parent.parent / "src" / "compliance_rules.yaml"
+
+
+def changed_rules(event_name):
+    rules = load_all_rules(str(RULES_FILE))
+    for rule in rules:
+        if rule.event_name == event_name:
+            rule.description += "（修订）"
+    return rules
+
+
+def test_changed_since_reports_only_edited_rule():
+    old = RuleSetVersion.from_rules(load_all_rules(str(RULES_FILE)))
+    new = RuleSetVersion.from_rules(changed_rules("不文明用语"))
+    assert old.id != new.id
+    assert new.changed_since(old.hashes) == {"不文明用语"}
+
+
+def test_plan_reaudit_selects_affected_texts(tmp_path):
+    old = RuleSetVersion.from_rules(load_all_rules(str(RULES_FILE)))
+    rules = changed_rules("不文明用语")
+    new = RuleSetVersion.from_rules(rules)
+    log = VerdictLog(str(tmp_path / "verdicts.jsonl"))
+    registry = RuleVersionRegistry.for_log(log)
+    registry.register(old)
+    clear = {"violation": False, "triggered_event": "无"}
+    log.append("当时判过不文明用语", {"violation": True, "triggered_event": "不文明用语"}, rule_version=old.id)
+    log.append("预筛涉及不文明用语", clear, rule_version=old.id, prescreen=["不文明用语"])
+    log.append("与变更无关", clear, rule_version=old.id, prescreen=["使用敏感词汇"])
+    log.append("当前版本", clear, rule_version=new.id)
+    log.append("没有版本信息", clear)
+    plan = plan_reaudit(log, registry, new, rules, NumericRuleEvaluator().evaluate)
+    assert sorted(plan["texts"]) == sorted(["当时判过不文明用语", "预筛涉及不文明用语", "没有版本信息"])
+    assert plan["changed"] == {old.id: ["不文明用语"]}
+    assert plan["unknown_version"] == 1
+
+
+def test_registry_merges_across_instances(tmp_path):
+    path = str(tmp_path / "versions.json")
+    a, b = RuleVersionRegistry(path), RuleVersionRegistry(path)
+    v1 = RuleSetVersion({"A": "1"})
+    v2 = RuleSetVersion({"A": "2"})
+    a.register(v1)
+    b.register(v2)
+    assert RuleVersionRegistry(path).get(v1.id) == {"A": "1"}
+    # a 没见过 v2，按需从文件读取
+    assert a.get(v2.id) == {"A": "2"}
@@ -0,0 +1,57 @@
+# tests/test_safe_regex.py
+"""线性时间正则：命中区间与 re 一致，灾难性写法在编译期拒绝"""
+import re
+import time
+from pathlib import Path
+
+import pytest
+
+from src.local_screen import _REGEX_CHARS
+from src.rule_loader import load_all_rules
+from src.safe_regex import MultiPattern, validate
+
+RULES_FILE = Path(__file__).resolve().parent.parent / "src" / "compliance_rules.yaml"
+EXTRA_PATTERNS = [r"(加|添)(微信|vx)", r"v[x信]\d{4,}", r"[0-9]{6}", r"^老师", r"再见$", r"带你(赚|挣)\d+万",
+                  r"\d+(\.\d+)?%", r"(?:QQ|qq)\s*\d+"]
+EXTRA_TEXTS = ["老师说加微信vx123456领取", "添vx吧", "代码600519今天涨了3.5%", "带你赚50万，再见",
+               "qq 12345 私聊", "无关文本", "", "加加微信微信"]
+
+
+def rule_patterns():
+    rules = load_all_rules(str(RULES_FILE))
+    patterns = [kw.replace("\\\\", "\\") for rule in rules
+                for kw in rule.trigger.keywords + rule.trigger.regex_patterns]
+    texts = [shot.input for rule in rules for shot in rule.few_shot]
+    return [p for p in patterns if _REGEX_CHARS.search(p)], texts
+
+
+def test_span_parity_with_re():
+    patterns, texts = rule_patterns()
+    patterns += EXTRA_PATTERNS
+    texts += EXTRA_TEXTS + ["我们保证收益20%，赚500元", "利润30%，回报15%，保本8%，利润1000元", "3天赚5万，本金1万赚10万"]
+    multi = MultiPattern(patterns)
+    assert multi.rejected == {}
+    for text in texts:
+        spans = multi.scan(text)
+        for pid, pattern in enumerate(patterns):
+            expected = re.search(pattern, text, re.IGNORECASE)
+            assert spans.get(pid) == (expected.span() if expected else None), (pattern, text)
+
+
+def test_search_returns_earliest_ending_pattern():
+    multi = MultiPattern([r"收益\d+%", r"赚\d+元"])
+    assert multi.search("先赚5元，再收益10%") == (1, (1, 4))
+
+
+@pytest.mark.parametrize("pattern", [r"(\d+)+元", r"(a|a)*b*(c+)+", r"(?<=a)b", r"(a)\1", r"a{1,100000}"])
+def test_dangerous_patterns_are_rejected(pattern):
+    assert validate(pattern) is not None
+    assert 0 in MultiPattern([pattern]).rejected
+
+
+def test_linear_time_on_adversarial_text():
+    multi = MultiPattern([r"\d+天赚\d+万", r"(\d|\d\d)+元"])
+    text = "1" * 20000 + "!"
+    began = time.perf_counter()
+    multi.scan(text)
+    assert time.perf_counter() - began < 2.0
@@ -0,0 +1,38 @@
+# tests/test_sampling_audit.py
+"""抽样稽核：近似重复的全局阈值每次只收紧一档，收紧后所有规则重新估计"""
+from types import SimpleNamespace
+
+from src.sampling_audit import SamplingAuditor
+
+
+def make_engine():
+    return SimpleNamespace(rule_titles=["规则A", "规则B"], rule_version=SimpleNamespace(id="v1"),
+                           near_dup=SimpleNamespace(max_distance=3), llm_required_events=set(),
+                           distilled=None, auditor=None)
+
+
+def test_near_dup_tightens_once_per_adjust(tmp_path):
+    engine = make_engine()
+    auditor = SamplingAuditor(engine, min_samples=5, adjust_every=10 ** 6, db_path=str(tmp_path / "a.sqlite"))
+    for i in range(10):
+        auditor.record("near_dup", f"文本{i}", {"triggered_event": "规则A、规则B"})
+    changes = auditor.adjust()
+    assert [(c["stratum"], c["old"], c["new"]) for c in changes] == [("near_dup", 3, 2)]
+    assert engine.near_dup.max_distance == 2
+    # 收紧前的样本不再参与任何规则的估计
+    strata = {e: item["strata"]["near_dup"]["n"] for e, item in auditor.estimate().items()}
+    assert strata == {"规则A": 0, "规则B": 0}
+    assert auditor.adjust() == []
+
+
+def test_local_misses_route_rule_to_llm(tmp_path):
+    engine = make_engine()
+    auditor = SamplingAuditor(engine, min_samples=5, adjust_every=10 ** 6, db_path=str(tmp_path / "a.sqlite"))
+    for i in range(10):
+        auditor.record("local", f"文本{i}", {"triggered_event": "规则B" if i < 3 else "无"})
+    auditor.adjust()
+    assert engine.llm_required_events == {"规则B"}
+    # 重启后重放调整
+    restarted = make_engine()
+    SamplingAuditor(restarted, db_path=str(tmp_path / "a.sqlite"))
+    assert restarted.llm_required_events == {"规则B"}
@@ -0,0 +1,28 @@
+# tests/test_shadow_eval.py
+"""影子评估：候选结果未经 LLM 的样本不计入一致率与 token / 耗时对比"""
+from types import SimpleNamespace
+
+from src.schemas import ShadowConfig
+from src.shadow_eval import ShadowEvaluator, disagreements, shadow_report
+
+
+def result(events, source="llm", tokens=100):
+    return {"triggered_event": events, "source": source, "latency_ms": 10.0,
+            "usage": {"input_tokens": tokens, "output_tokens": 0, "llm_ms": 5.0}}
+
+
+def test_non_llm_candidate_results_are_excluded(tmp_path):
+    engine = SimpleNamespace(rule_version=SimpleNamespace(id="v1"), shadow=None)
+    candidate = SimpleNamespace(rule_version=SimpleNamespace(id="v2"))
+    db = str(tmp_path / "shadow.sqlite")
+    shadow = ShadowEvaluator(engine, ShadowConfig(name="slim"), candidate=candidate, sample_rate=1.0, db_path=db)
+    shadow.record("a", result("无"), result("无", tokens=50))
+    shadow.record("b", result("直接承诺收益"), result("无", source="near_dup", tokens=0))
+    shadow.record("c", result("直接承诺收益"), result("无", source="local", tokens=0))
+
+    report = shadow_report(db, "slim")
+    assert (report["n"], report["excluded"]) == (1, 2)
+    assert report["violation_agreement"]["rate"] == 1.0
+    assert report["tokens"]["delta"] == -0.5
+    assert disagreements(db, "slim") == []
+    shadow._executor.shutdown()
@@ -0,0 +1,57 @@
+# tests/test_shards_windows.py
+"""规则分片合并与长对话滑动窗口"""
+from pathlib import Path
+
+from src.conversation import build_windows, merge_window_verdicts, split_turns
+from src.prompts import RULE_TITLES
+from src.rule_loader import load_all_rules
+from src.rule_shards import merge_shard_verdicts, restrict_shards, shards_by_risk_level
+
+RULES_FILE = Path(__file__).resolve().parent.parent / "src" / "compliance_rules.yaml"
+
+
+def test_risk_level_shards_cover_every_rule_once():
+    shards = shards_by_risk_level(load_all_rules(str(RULES_FILE)), max_shard_size=3)
+    covered = [t for shard in shards for t in shard]
+    assert sorted(covered) == sorted(RULE_TITLES)
+    assert all(len(shard) <= 3 for shard in shards)
+
+
+def test_restrict_drops_empty_shards():
+    assert restrict_shards([("A", "B"), ("C",)], {"B"}) == [("B",)]
+
+
+def test_merge_only_trusts_events_inside_shard():
+    merged = merge_shard_verdicts([
+        (("A", "B"), {"raw_response": "1", "triggered_event": "A,C", "reason": "甲"}),
+        (("C",), {"raw_response": "2", "triggered_event": "无", "reason": "乙"}),
+    ])
+    assert merged["triggered_event"] == "A"
+    assert merged["violation"] is True
+    assert merged["shards"] == 2
+
+
+def test_windows_overlap_and_keep_turns_whole():
+    text = "\n".join(f"{'销售' if i % 2 else '客户'}：第{i}轮发言内容" for i in range(20))
+    turns = split_turns(text)
+    assert len(turns) == 20
+    windows = build_windows(turns, max_tokens=40, overlap_turns=1)
+    assert windows[0].turns[0] == 0 and windows[-1].turns[-1] == 19
+    for prev, cur in zip(windows, windows[1:]):
+        assert prev.turns[-1] == cur.turns[0]
+
+
+def test_long_turn_is_split_by_sentence():
+    turns = split_turns("销售：" + "这是一句很长的话。" * 50)
+    windows = build_windows(turns, max_tokens=30)
+    assert len(windows) > 1
+    assert all(w.turns == (0,) for w in windows)
+
+
+def test_overlapping_windows_count_violation_once():
+    turns = split_turns("客户：你好\n销售：加我微信私聊\n客户：好的\n销售：再见")
+    windows = build_windows(turns, max_tokens=12, overlap_turns=1)
+    results = [{"triggered_event": "私下联系" if 1 in w.turns else "无", "reason": "“加我微信私聊”"}
+               for w in windows]
+    violations = merge_window_verdicts(windows, results, turns, [{} for _ in turns])
+    assert [(v["event"], v["turns"]) for v in violations] == [("私下联系", [1])]
@@ -0,0 +1,104 @@
+# tests/test_worker.py
+"""队列 worker：确认 / 重投 / 死信，以及坏时间戳只影响自己这一条"""
+import json
+
+import pytest
+
+from src.circuit_breaker import CircuitOpenError
+from src.result_store import ResultStore, parse_ts
+from src.worker import QueueWorker, SpoolSource, SQLiteQueueSource
+
+CLEAR = {"violation": False, "triggered_event": "无", "reason": "", "degraded": False}
+
+
+def body(text, ts=None):
+    return json.dumps({"text": text, "ts": ts}, ensure_ascii=False)
+
+
+@pytest.fixture(params=["sqlite", "spool"])
+def source(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteQueueSource(str(tmp_path / "queue.sqlite"), poll_interval=0.01)
+    return SpoolSource(str(tmp_path / "spool"), poll_interval=0.01)
+
+
+def make_worker(source, tmp_path, predict):
+    return QueueWorker(source, predict, ResultStore(str(tmp_path / "results")), batch_size=10,
+                       max_wait=0.05, max_workers=2, unavailable_delay=60)
+
+
+def dead_count(source):
+    stats = source.stats()
+    if isinstance(source, SQLiteQueueSource):
+        return stats.get("dead", 0)
+    return sum(1 for path in source.dead.glob("*.jsonl") for _ in open(path, encoding="utf-8"))
+
+
+@pytest.mark.parametrize("ts", ["1e30", "inf", "nan", float("inf"), 1e30, "not a date"])
+def test_parse_ts_rejects_non_finite_and_out_of_range(ts):
+    with pytest.raises(ValueError):
+        parse_ts(ts)
+
+
+def test_bad_timestamps_are_rejected_without_llm_call(source, tmp_path):
+    calls = []
+    source.publish([body("正常消息", 1714521600), body("坏时间戳", "1e30"), body("非有限值", "nan")])
+    worker = make_worker(source, tmp_path, lambda text, priority: calls.append(text) or dict(CLEAR))
+    ok, failed = worker.process(source.receive(10, 0.1))
+    assert (ok, failed) == (1, 2)
+    assert calls == ["正常消息"]
+    assert dead_count(source) == 2
+    assert worker.store.query()["text"].tolist() == ["正常消息"]
+
+
+def test_errors_are_retried_and_outages_are_deferred_uncounted(tmp_path):
+    source = SQLiteQueueSource(str(tmp_path / "queue.sqlite"), poll_interval=0.01)
+    source.publish(["出错", "熔断"])
+
+    def predict(text, priority):
+        raise RuntimeError("boom") if text == "出错" else CircuitOpenError("open")
+
+    worker = make_worker(source, tmp_path, predict)
+    assert worker.process(source.receive(10, 0.1)) == (0, 2)
+    rows = dict(source._connect().execute("SELECT body, attempts FROM messages WHERE status = 'ready'"))
+    # 普通错误计一次重试，熔断导致的失败不计
+    assert rows == {"出错": 1, "熔断": 0}
+    # 重投有延迟，立即再取拿不到
+    assert source.receive(10, 0) == []
+
+
+def test_spool_nack_goes_to_delayed_and_reject_to_dead(tmp_path):
+    source = SpoolSource(str(tmp_path / "spool"), poll_interval=0.01)
+    source.publish(["a", "b", "c"])
+    a, b, c = source.receive(10, 0.1)
+    source.ack([a])
+    source.nack([b], delay=60)
+    source.reject([c])
+    assert source.stats() == {"incoming": 0, "processing": 0, "delayed": 1, "dead": 1}
+    # 到期后重新投递，重试次数记在文件名里
+    for path in source.delayed.glob("*.jsonl"):
+        path.rename(source.delayed / ("0-" + path.name.partition("-")[2]))
+    (retried,) = source.receive(10, 0.1)
+    assert (retried.body, retried.attempts) == ("b", 2)
+
+
+def test_degraded_results_are_deferred(source, tmp_path):
+    source.publish(["降级"])
+    worker = make_worker(source, tmp_path, lambda text, priority: {**CLEAR, "degraded": True})
+    assert worker.process(source.receive(10, 0.1)) == (0, 1)
+    assert dead_count(source) == 0
+
+
+def test_run_survives_a_failing_batch(tmp_path):
+    source = SQLiteQueueSource(str(tmp_path / "queue.sqlite"), poll_interval=0.01)
+    source.publish(["x"])
+    worker = make_worker(source, tmp_path, lambda text, priority: dict(CLEAR))
+
+    def process(messages):
+        worker.stop()
+        raise RuntimeError("unexpected")
+
+    worker.process = process
+    worker.run(poll_interval=0.01)
+    assert worker.batches == 1 and worker.failed == 1
+    assert source.stats() == {"ready": 1}
@@ -1,32 +1,98 @@
 # web_app.py
 import streamlit as st
 import pandas as pd
+import hashlib
 import os
 import sys
+import tempfile
+import time
+import uuid
+from functools import partial
 
 # 添加 src 目录到 Python 路径
 sys.path.append('src')
 
-# 设置环境变量
-os.environ["DASHSCOPE_API_KEY"] = "sk-2061ea9f55e446ffa570d8ac2510d401"
-
 # 导入你的 RAG 引擎
 try:
-    from src.rag_engine import ComplianceRAGEngine
+    from src.engine_registry import EngineBusyError, get_registry, session_for
+    from src.conversation import estimate_tokens
+    from src.result_store import ResultStore, parse_input_line
+    from src.batch_jobs import BatchJobManager
+    from src.local_screen import split_events
+    from src.fulltext import FullTextIndex, rule_keywords
+    from src.sampling_audit import SamplingAuditor
+    from src.shadow_eval import ShadowEvaluator
+    from src.line_index import LineIndex
 except ImportError as e:
     st.error(f"导入错误: {e}")
     st.stop()
 
-# 初始化 RAG 引擎
+# 超过该估算 token 数的输入自动按对话分窗检测
+LONG_TEXT_TOKENS = 1200
+# 批量任务页面预览的行数
+PREVIEW_ROWS = 500
+EXPORT_LABELS = {"text": "内容", "violation": "是否违规", "triggered_event": "触发事件",
+                 "reason": "理由", "source": "判定来源", "degraded": "降级判定"}
+
+# 初始化 RAG 引擎：进程内所有会话共用注册表中的同一个引擎（见 engine_registry.py），
+# 这里只负责一次性挂载稽核 / 影子评估
 @st.cache_resource
 def load_engine():
     try:
-        engine = ComplianceRAGEngine()
+        engine = get_registry().get()
+        # 设置 AUDIT_DB 时抽样稽核本地放行的结论（见 sampling_audit.py）
+        if os.getenv("AUDIT_DB"):
+            SamplingAuditor(engine)
+        # 设置 SHADOW_CONFIG 时抽样把请求同时交给候选配置判定（见 shadow_eval.py）
+        if os.getenv("SHADOW_CONFIG"):
+            ShadowEvaluator(engine)
         return engine
     except Exception as e:
         st.error(f"引擎初始化失败: {str(e)}")
         return None
 
+# 持久化结果库（Parquet + SQLite 索引，目录由 RESULT_STORE_DIR 指定）
+@st.cache_resource
+def load_result_store():
+    return ResultStore()
+
+# 后台批量任务（任务与逐条结果持久化在 JOBS_DIR，页面刷新或关闭不影响执行）
+@st.cache_resource
+def load_job_manager(_engine):
+    # 批量任务走 bulk 优先级和独立的 bulk 在途名额（排队不超时），不挤占单条在线检测的名额
+    return BatchJobManager(partial(get_registry().predict, session_id="batch-jobs", priority="bulk"),
+                           store=load_result_store())
+
+# 全文倒排索引（目录由 FULLTEXT_DIR 指定），分词词典包含规则关键词
+@st.cache_resource
+def load_fulltext_index(_engine):
+    return FullTextIndex(keywords=rule_keywords(_engine.rules))
+
+# 上传文件落盘到 JOBS_DIR/uploads/<内容哈希>/，按行索引读取（见 line_index.py），不在内存中整体解码切分。
+# 目录为所有会话共用，按内容哈希区分：不同用户上传同名同大小的不同文件不会互相覆盖
+def save_upload(uploaded_file):
+    # Streamlit 每次交互都会重跑脚本，同一次上传只算一次哈希
+    key = f"upload_digest_{getattr(uploaded_file, 'file_id', uploaded_file.name)}"
+    if key not in st.session_state:
+        st.session_state[key] = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()[:32]
+    path = os.path.join(os.getenv("JOBS_DIR", "jobs"), "uploads", st.session_state[key],
+                        os.path.basename(uploaded_file.name))
+    # 内容相同的文件不重复写入，行索引也就不会重建
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+        os.replace(tmp, path)
+    return path
+
+def load_line_index(path):
+    return _load_line_index(path, os.stat(path).st_mtime_ns)
+
+@st.cache_resource(max_entries=4)
+def _load_line_index(path, mtime):
+    return LineIndex(path)
+
 def main():
     st.title("🔍 金融合规审查系统")
     st.markdown("---")
@@ -38,12 +104,14 @@ def main():
     if engine is None:
         st.error("无法启动合规引擎，请检查配置")
         st.stop()
+    # 本会话的引擎句柄：检测请求计入全局在途上限与会话统计
+    engine = session_for(st.session_state)
     
     # 侧边栏导航
     st.sidebar.title("导航")
     app_mode = st.sidebar.selectbox(
         "选择功能",
-        ["单条文本分析", "批量文件分析", "测试用例演示"]
+        ["单条文本分析", "批量文件分析", "历史结果查询", "测试用例演示"]
     )
     
     st.sidebar.markdown("---")
@@ -54,10 +122,21 @@ def main():
     - 测试用例演示：查看预定义测试用例结果
     """)
     
+    stats = engine.stats()
+    st.sidebar.metric("LLM 当前并发上限", stats["concurrency_limit"], help=f"在途请求 {stats['inflight']}，累计限流 {stats['count_throttle']} 次")
+    with st.sidebar.expander("优先级队列"):
+        st.dataframe(pd.DataFrame(stats["priorities"]).T, use_container_width=True)
+    registry_stats = get_registry().stats()
+    st.sidebar.metric("在线会话", registry_stats["active_sessions"],
+                      help=f"检测请求在途 {registry_stats['requests_inflight']}/{registry_stats['requests_max_inflight']}，"
+                           f"排队 {registry_stats['requests_waiting']}，累计拒绝 {registry_stats['requests_rejected']} 次")
+    
     if app_mode == "单条文本分析":
         single_text_analysis(engine)
     elif app_mode == "批量文件分析":
         batch_file_analysis(engine)
+    elif app_mode == "历史结果查询":
+        result_query(engine)
     elif app_mode == "测试用例演示":
         demo_analysis(engine)
 
@@ -71,6 +150,11 @@ def single_text_analysis(engine):
         height=150
     )
     
+    conversation_mode = st.checkbox(
+        "整段对话分窗检测",
+        help="按说话人切分轮次，滑动窗口并发判定，违规定位到具体轮次；文本较长时自动启用"
+    )
+    
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
         analyze_btn = st.button("🚀 开始分析", type="primary", use_container_width=True)
@@ -81,11 +165,21 @@ def single_text_analysis(engine):
             return
             
         with st.spinner("正在分析中，请稍候..."):
-            result = engine.predict(text_input.strip())
+            try:
+                if conversation_mode or estimate_tokens(text_input) > LONG_TEXT_TOKENS:
+                    result = engine.predict_conversation(text_input.strip())
+                else:
+                    result = engine.predict(text_input.strip())
+            except EngineBusyError as e:
+                st.warning(str(e))
+                return
         
         # 显示结果
         st.markdown("### 📊 分析结果")
         
+        if result.get("degraded"):
+            st.warning("⚠️ LLM 服务暂不可用，当前为本地规则降级判定，恢复后将自动复核")
+        
         # 状态卡片
         col1, col2 = st.columns(2)
         
@@ -102,83 +196,253 @@ def single_text_analysis(engine):
         st.markdown("### 📋 分析理由")
         st.write(result["reason"])
         
+        if "violations" in result:
+            show_conversation_result(result)
+            return
+        
+        show_similar_cases(engine, text_input.strip(), result)
+        
         # 原始响应
         with st.expander("🔍 查看详细响应"):
             st.code(result["raw_response"])
 
+def show_similar_cases(engine, text, result):
+    """相似历史案例：判定时带入 Prompt 的案例；没有时（缓存 / 本地判定）现查"""
+    if engine.case_index is None:
+        return
+    cases = result.get("similar_cases")
+    if not cases:
+        events = split_events(result["triggered_event"]) or None
+        cases = [c._asdict() for c in engine.case_index.search(text, k=5, events=events)]
+    with st.expander(f"🗂️ 相似历史案例（{len(cases)} 条）"):
+        if not cases:
+            st.write("暂无相似案例")
+            return
+        st.dataframe(pd.DataFrame([{
+            "相似度": round(c["score"], 3),
+            "文本": c["text"],
+            "是否违规": "违规" if c["violation"] else "合规",
+            "触发事件": c["triggered_event"],
+            "理由": c["reason"],
+            "规则版本": c["rule_version"],
+        } for c in cases]), use_container_width=True)
+
+def show_conversation_result(result):
+    """长对话：逐条违规及其所在轮次"""
+    turns = result["turns"]
+    st.caption(f"共 {len(turns)} 轮发言，切分为 {len(result['windows'])} 个窗口")
+    if result["violations"]:
+        st.markdown("### 🧭 违规定位")
+        rows = []
+        for v in result["violations"]:
+            rows.append({
+                "触发事件": v["event"],
+                "轮次": "、".join(str(i + 1) for i in v["turns"]),
+                "原文": "\n".join(turns[i].render() for i in v["turns"]),
+                "理由": v["reasons"][0],
+            })
+        st.dataframe(pd.DataFrame(rows), use_container_width=True)
+    with st.expander("🔍 查看各窗口响应"):
+        for i, w in enumerate(result["windows"], 1):
+            st.markdown(f"**窗口 {i}**（第 {w['turns'][0] + 1}~{w['turns'][-1] + 1} 轮）")
+            st.code(w["raw_response"])
+
 def batch_file_analysis(engine):
     st.header("📁 批量文件分析")
+    manager = load_job_manager(engine)
     
     uploaded_file = st.file_uploader(
         "上传文本文件",
-        type=['txt'],
-        help="请上传UTF-8编码的文本文件，每行作为一个独立的审查内容"
+        type=['txt', 'jsonl'],
+        help="请上传UTF-8编码的文本文件，每行作为一个独立的审查内容；"
+             "jsonl 每行形如 {\"text\": ..., \"agent\": ..., \"conversation_id\": ...}"
     )
     
     if uploaded_file is not None:
         # 读取文件内容
         try:
-            content = uploaded_file.read().decode('utf-8')
-            lines = [line.strip() for line in content.split('\n') if line.strip()]
+            index = load_line_index(save_upload(uploaded_file))
+            st.success(f"✅ 成功读取文件，共 {len(index)} 行")
             
-            st.success(f"✅ 成功读取文件，共 {len(lines)} 条内容")
+            with st.expander("🔎 按行号查看原文"):
+                n = st.number_input("行号", min_value=1, max_value=max(len(index), 1), value=1)
+                if len(index):
+                    st.code(index.line(int(n) - 1))
             
-            if st.button("🚀 开始批量分析", type="primary"):
-                analyze_batch_content(engine, lines, uploaded_file.name)
+            if st.button("🚀 提交后台分析任务", type="primary"):
+                # 逐行读取、分页写入任务库，不在内存中生成整份条目列表
+                items = (parse_input_line(line, conversation_id=uploaded_file.name)
+                         for _, line in index.iter_lines() if line)
+                st.query_params["job"] = manager.submit(items, uploaded_file.name)
                 
         except Exception as e:
             st.error(f"文件读取失败: {str(e)}")
+    
+    # 任务列表：页面刷新后通过地址栏中的 job 参数重新挂载
+    jobs = manager.list_jobs()
+    if not jobs:
+        return
+    st.markdown("---")
+    job_ids = [job["id"] for job in jobs]
+    current = st.query_params.get("job")
+    job_id = st.selectbox(
+        "后台任务",
+        job_ids,
+        index=job_ids.index(current) if current in job_ids else 0,
+        format_func=lambda i: next(f"{j['name']} · {j['status']} · {j['done']}/{j['total']} ({i})"
+                                   for j in jobs if j["id"] == i),
+    )
+    st.query_params["job"] = job_id
+    show_batch_job(manager, job_id)
 
-def analyze_batch_content(engine, lines, filename):
-    """分析批量内容"""
-    results = []
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+def show_batch_job(manager, job_id):
+    """展示后台任务进度与已完成的部分结果，运行中自动轮询刷新"""
+    job = manager.get(job_id)
+    finished = job["done"] + job["failed"]
+    st.progress(finished / job["total"] if job["total"] else 1.0)
+    st.caption(f"状态：{job['status']}，已完成 {finished}/{job['total']} 条（失败 {job['failed']} 条）")
+    if job["error"]:
+        st.error(job["error"])
     
-    # 创建结果容器
-    result_container = st.container()
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        if job["status"] == "running" and st.button("⏹️ 取消任务"):
+            manager.cancel(job_id)
+            st.rerun()
+    with col2:
+        if job["status"] in ("cancelled", "interrupted", "failed") and st.button("▶️ 继续任务"):
+            manager.resume(job_id)
+            st.rerun()
+    with col3:
+        auto_refresh = st.checkbox("自动刷新", value=True)
     
-    for i, line in enumerate(lines):
-        status_text.text(f"📋 正在分析第 {i+1}/{len(lines)} 条内容...")
-        result = engine.predict(line)
+    # 只展示最近完成的 PREVIEW_ROWS 条，统计直接在任务库上计算，不把全部结果载入内存
+    counts = manager.counts(job_id)
+    preview = manager.results(job_id, offset=max(0, finished - PREVIEW_ROWS), limit=PREVIEW_ROWS)
+    results = []
+    for item in preview:
+        result = item["result"]
+        if item["status"] != "done":
+            results.append({'内容': item["text"], '合规状态': '失败', '触发事件': '',
+                            '理由': result.get("error", ""), '降级判定': ''})
+            continue
         results.append({
-            '内容': line,
+            '内容': item["text"],
             '合规状态': '违规' if result['violation'] else '合规',
             '触发事件': result['triggered_event'],
-            '理由': result['reason']
+            '理由': result['reason'],
+            '降级判定': '是' if result.get('degraded') else '否'
         })
-        progress_bar.progress((i + 1) / len(lines))
     
-    status_text.text("✅ 分析完成！")
+    # 显示结果表格（运行中为部分结果）
+    df = pd.DataFrame(results)
+    st.markdown("### 📋 分析结果汇总")
+    if finished > PREVIEW_ROWS:
+        st.caption(f"仅展示最近完成的 {PREVIEW_ROWS} 条，完整结果请下载")
+    st.dataframe(df, use_container_width=True)
     
-    # 显示结果表格
-    with result_container:
-        df = pd.DataFrame(results)
-        st.markdown("### 📋 分析结果汇总")
-        st.dataframe(df, use_container_width=True)
-        
-        # 统计信息
-        st.markdown("### 📈 统计信息")
-        col1, col2, col3, col4 = st.columns(4)
-        total_count = len(results)
-        violation_count = sum(1 for r in results if r['合规状态'] == '违规')
-        compliant_count = total_count - violation_count
-        violation_rate = (violation_count / total_count * 100) if total_count > 0 else 0
-        
-        col1.metric("总条目", total_count)
-        col2.metric("违规数量", violation_count)
-        col3.metric("合规数量", compliant_count)
-        col4.metric("违规率", f"{violation_rate:.1f}%")
-        
-        # 下载功能
+    # 统计信息
+    st.markdown("### 📈 统计信息")
+    col1, col2, col3, col4 = st.columns(4)
+    total_count = finished
+    violation_count = counts["violation"]
+    compliant_count = counts["compliant"]
+    violation_rate = (violation_count / total_count * 100) if total_count > 0 else 0
+    
+    col1.metric("已完成", total_count)
+    col2.metric("违规数量", violation_count)
+    col3.metric("合规数量", compliant_count)
+    col4.metric("违规率", f"{violation_rate:.1f}%")
+    
+    if job["status"] == "done":
+        # 下载功能：列式结果逐块写 CSV
         st.markdown("### 💾 下载结果")
-        csv = df.to_csv(index=False, encoding='utf-8-sig')
         st.download_button(
             label="📥 下载分析结果 (CSV)",
-            data=csv,
-            file_name=f"合规分析结果_{filename}.csv",
+            data=export_job_csv(manager, job_id),
+            file_name=f"合规分析结果_{job['name']}.csv",
             mime="text/csv"
         )
+    elif job["status"] == "running" and auto_refresh:
+        time.sleep(2)
+        st.rerun()
+
+@st.cache_data(max_entries=4)
+def export_job_csv(_manager, job_id):
+    path = os.path.join(tempfile.gettempdir(), f"compliance-job-{job_id}.csv")
+    results = _manager.export(job_id)
+    try:
+        results.to_csv(path, labels=EXPORT_LABELS)
+    finally:
+        results.close()
+    with open(path, "rb") as f:
+        return f.read()
+
+def result_query(engine):
+    st.header("🗂️ 历史结果查询")
+    store = load_result_store()
+    
+    with st.expander("🔤 全文检索", expanded=True):
+        fulltext_query(engine, store)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        event = st.text_input("触发事件", placeholder="如：与客户进行私下联系")
+        agent = st.text_input("坐席")
+        conversation_id = st.text_input("会话 / 批次文件")
+    with col2:
+        start = st.date_input("开始日期", value=pd.Timestamp.today() - pd.Timedelta(days=30))
+        end = st.date_input("结束日期", value=pd.Timestamp.today())
+        only_violation = st.checkbox("只看违规", value=True)
+    
+    filters = dict(
+        event=event.strip() or None,
+        agent=agent.strip() or None,
+        conversation_id=conversation_id.strip() or None,
+        start=start,
+        end=end,
+        violation=True if only_violation else None,
+    )
+    if st.button("🔎 查询", type="primary"):
+        df = store.query(**filters, limit=5000)
+        st.markdown(f"### 共 {len(df)} 条")
+        st.dataframe(df, use_container_width=True)
+        summary = store.summary(("agent", "event"), **{k: v for k, v in filters.items() if k not in ("agent", "event")})
+        if summary:
+            st.markdown("### 📈 坐席 × 事件统计")
+            st.dataframe(pd.DataFrame(summary), use_container_width=True)
+
+def fulltext_query(engine, store):
+    """全文检索：空格 / AND 为与，OR 为或，NOT 或 - 为非，引号内为短语"""
+    index = load_fulltext_index(engine)
+    query = st.text_input("检索式", placeholder='如：华泰证券 最低佣金 -"已告知风险"')
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        start = st.date_input("开始日期", value=pd.Timestamp.today() - pd.Timedelta(days=90), key="ft_start")
+    with col2:
+        end = st.date_input("结束日期", value=pd.Timestamp.today(), key="ft_end")
+    with col3:
+        agents = st.text_input("坐席（多个用逗号分隔）", key="ft_agents")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        search_btn = st.button("🔎 全文检索", type="primary")
+    with col2:
+        # 增量导入结果库中新增的分片
+        if st.button("🔄 更新全文索引"):
+            with st.spinner("正在导入..."):
+                n = index.ingest_store(store)
+            st.success(f"新导入 {n} 条")
+    
+    if search_btn and query.strip():
+        try:
+            frame, total = index.search(query.strip(), start, end,
+                                        [a.strip() for a in agents.split(",") if a.strip()] or None)
+        except ValueError as e:
+            st.error(f"检索式有误: {e}")
+            return
+        st.markdown(f"### 命中 {total} 条" + (f"（显示最近 {len(frame)} 条）" if total > len(frame) else ""))
+        st.dataframe(frame.drop(columns=["id", "ts"], errors="ignore"), use_container_width=True)
 
 def demo_analysis(engine):
     st.header("🧪 测试用例演示")